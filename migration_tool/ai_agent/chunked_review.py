@@ -0,0 +1,167 @@
+import re
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_$#]*")
+_NEXT_WORD = re.compile(r"\s*([A-Za-z_][A-Za-z0-9_$#]*)")
+
+
+def split_sql(sql: str):
+    """
+    Splits SQL / PL/SQL text into top-level units: a unit ends at a ';'
+    outside strings, comments, parentheses and DECLARE/BEGIN/CASE ... END
+    blocks, or at a line holding only '/'. Text is preserved exactly, so "".join(units)
+    == sql.
+    """
+    s = sql or ""
+    units = []
+    start = 0
+    i = 0
+    n = len(s)
+    paren = 0
+    block = 0
+    declares = 0
+    while i < n:
+        c = s[i]
+        if c == "'":
+            j = i + 1
+            while j < n:
+                if s[j] == "'":
+                    if j + 1 < n and s[j + 1] == "'":
+                        j += 2
+                        continue
+                    break
+                j += 1
+            i = j + 1
+            continue
+        if c == '"':
+            j = s.find('"', i + 1)
+            i = n if j < 0 else j + 1
+            continue
+        if s.startswith("--", i):
+            j = s.find("\n", i)
+            i = n if j < 0 else j
+            continue
+        if s.startswith("/*", i):
+            j = s.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+            continue
+        if c == "(":
+            paren += 1
+        elif c == ")":
+            paren = max(0, paren - 1)
+        elif c == ";" and paren == 0 and block == 0:
+            units.append(s[start:i + 1])
+            start = i + 1
+        elif c == "/" and paren == 0 and block == 0 and s[s.rfind("\n", 0, i) + 1:i].strip() == "" and s[i + 1:].split("\n", 1)[0].strip() == "":
+            if units and not s[start:i].strip():
+                # The '/' after "END;" belongs to the block it runs
+                units[-1] += s[start:i + 1]
+            else:
+                units.append(s[start:i + 1])
+            start = i + 1
+        elif c.isalpha() or c == "_":
+            m = _WORD.match(s, i)
+            if i > 0 and (s[i - 1].isalnum() or s[i - 1] in "_$#"):
+                i = m.end()
+                continue
+            w = m.group(0).upper()
+            end = m.end()
+            if w == "DECLARE":
+                # The declaration section and its BEGIN ... END form one block
+                block += 1
+                declares += 1
+            elif w == "BEGIN":
+                if declares:
+                    declares -= 1
+                else:
+                    block += 1
+            elif w == "CASE":
+                block += 1
+            elif w == "END":
+                nxt = _NEXT_WORD.match(s, end)
+                kw = nxt.group(1).upper() if nxt else ""
+                if kw != "IF" and kw != "LOOP":
+                    block = max(0, block - 1)
+                if kw in ("IF", "LOOP", "CASE"):
+                    # END CASE closes the CASE statement; its CASE must not open another block
+                    end = nxt.end()
+            i = end
+            continue
+        i += 1
+    if s[start:].strip():
+        units.append(s[start:])
+    elif units:
+        units[-1] += s[start:]
+    return units
+
+
+def group_units(units, max_chars: int):
+    """Index ranges [(lo, hi)] of consecutive units whose text fits max_chars (a single oversized unit stays alone)."""
+    out = []
+    lo = 0
+    size = 0
+    for i, u in enumerate(units):
+        if i > lo and size + len(u) > max_chars:
+            out.append((lo, i))
+            lo = i
+            size = 0
+        size += len(u)
+    if units:
+        out.append((lo, len(units)))
+    return out
+
+
+def pair_chunks(oracle_sql: str, snowflake_sql: str, max_chars: int, convert_fn=None):
+    """
+    Pairs Oracle and Snowflake chunks. When both sides split into the same
+    number of units they are grouped on the same boundaries; otherwise the
+    Oracle chunks are re-converted with convert_fn (if given) so each chunk
+    still has a matching target. Returns (pairs, aligned).
+    """
+    o_units = split_sql(oracle_sql)
+    s_units = split_sql(snowflake_sql)
+    if len(o_units) == len(s_units):
+        sizes = [len(a) + len(b) for a, b in zip(o_units, s_units)]
+        ranges = group_units(["x" * n for n in sizes], max_chars)
+        return [("".join(o_units[lo:hi]), "".join(s_units[lo:hi])) for lo, hi in ranges], True
+    if convert_fn is None:
+        return [(oracle_sql, snowflake_sql)], False
+    pairs = []
+    for lo, hi in group_units(o_units, max_chars // 2):
+        o = "".join(o_units[lo:hi])
+        pairs.append((o, convert_fn(o)))
+    return pairs, False
+
+
+def merge_reviews(reviews, weights):
+    """
+    Combines chunk reviews: issues are concatenated (prefixed with the part
+    number, duplicates dropped), the score is the size-weighted mean, and the
+    lowest chunk score is kept as min_score.
+    """
+    issues = []
+    seen = set()
+    suggestions = []
+    total_w = 0
+    acc = 0.0
+    scores = []
+    for i, (r, w) in enumerate(zip(reviews, weights), 1):
+        r = r or {}
+        try:
+            sc = float(r.get("score", 0))
+        except (TypeError, ValueError):
+            sc = 0.0
+        scores.append(sc)
+        acc += sc * w
+        total_w += w
+        for it in r.get("issues") or []:
+            if str(it) not in seen:
+                seen.add(str(it))
+                issues.append(f"[part {i}] {it}")
+        if r.get("suggestion"):
+            suggestions.append(f"[part {i}] {r['suggestion']}")
+    return {
+        "score": int(round(acc / total_w)) if total_w else 0,
+        "min_score": int(min(scores)) if scores else 0,
+        "issues": issues,
+        "suggestion": "\n".join(suggestions),
+    }
@@ -1,15 +1,90 @@
 import json
-import os
 from datetime import datetime
 from migration_tool.converter.oracle_to_snowflake import convert
-from migration_tool.ai_agent.llm_utils import get_llm_client, simple_chat
+from migration_tool.converter.rule_gate import gate_rule, with_rule
+from migration_tool.converter.rule_history import get_history_store
+from migration_tool.converter.rule_registry import get_registry
+from migration_tool.converter.static_review import static_review
+from concurrent.futures import ThreadPoolExecutor
+from migration_tool.ai_agent.chunked_review import merge_reviews, pair_chunks
+from migration_tool.ai_agent.json_stream import JSONFieldStream
+from migration_tool.ai_agent.llm_utils import estimate_tokens, get_llm_client, simple_chat, stream_chat
+from migration_tool.ai_agent.usage import BudgetExceeded
+
+# Above this many (estimated) prompt tokens a review is split into chunks
+CHUNK_REVIEW_TOKENS = 3000
+
+BATCH_REVIEW_PROMPT = """You are a Snowflake SQL Expert and Code Reviewer.
+For EACH item below, compare the source Oracle SQL and the converted Snowflake SQL.
+
+Identify per item:
+1. Syntax errors in Snowflake SQL.
+2. Functional differences or semantic changes.
+3. Oracle functions that were not converted or converted incorrectly (e.g. keeping 'NVL' instead of 'COALESCE', or 'SYSDATE' issues).
+4. Any 'CLOB', 'BLOB', 'ROWNUM' usages that are not supported or need change.
+
+Output a JSON array with exactly one object per item, in any order:
+[
+    {{"id": "<item id>", "score": <0-10 integer, 10 is perfect>, "issues": ["list of specific issues found"], "suggestion": "general suggestion"}}
+]
+Output ONLY valid JSON.
+
+Items:
+{items}"""
+
+
+def _json_objects(text: str):
+    """Every top-level JSON object in text, skipping fragments that do not parse."""
+    dec = json.JSONDecoder()
+    out = []
+    i = text.find("{")
+    while i >= 0:
+        try:
+            obj, end = dec.raw_decode(text, i)
+        except ValueError:
+            i = text.find("{", i + 1)
+            continue
+        if isinstance(obj, dict):
+            out.append(obj)
+        i = text.find("{", end)
+    return out
+
+
+def _parse_batch_review(res: str):
+    """Maps item id -> review from a reviewer answer; tolerates a broken array by salvaging whole objects."""
+    res = (res or "").replace("```json", "").replace("```", "").strip()
+    try:
+        data = json.loads(res)
+        items = data if isinstance(data, list) else data.get("results") or data.get("items") or [data]
+    except Exception:
+        items = _json_objects(res)
+    out = {}
+    for it in items:
+        if isinstance(it, dict) and it.get("id") is not None and "score" in it:
+            out[str(it["id"])] = {k: v for k, v in it.items() if k != "id"}
+    return out
+
+
+def _with_static(review, pre):
+    """Folds the deterministic pre-review findings into an LLM review."""
+    if not pre or not isinstance(review, dict):
+        return review
+    issues = list(pre["issues"])
+    issues += [i for i in review.get("issues") or [] if i not in issues]
+    review["issues"] = issues
+    try:
+        review["score"] = min(int(review.get("score", 0)), pre["score"])
+    except (TypeError, ValueError):
+        review["score"] = pre["score"]
+    return review
 
 class EvolutionManager:
-    def __init__(self, api_key=None, provider="openai", model="gpt-4o-mini", base_url=None):
-        self.client = get_llm_client(api_key, provider, base_url)
+    def __init__(self, api_key=None, provider="openai", model="gpt-4o-mini", base_url=None, use_cache=True, tracker=None, static_first=True, secondary=None, hedge_percentile=None):
+        self.client = get_llm_client(api_key, provider, base_url, secondary=secondary, hedge_percentile=hedge_percentile)
         self.model = model
-        self.history_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "converter", "rules_history.json")
-        self.rules_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "converter", "rules.json")
+        self.use_cache = use_cache
+        self.tracker = tracker
+        self.static_first = static_first
 
     def generate_sql(self, topic):
         """1. Generator Agent"""
@@ -20,16 +95,34 @@ class EvolutionManager:
         Include typical Oracle-specific functions, syntax, or patterns relevant to this topic.
         Output ONLY the SQL statement, no markdown, no explanation."""
         
-        return simple_chat(self.client, self.model, [{"role": "user", "content": prompt}])
+        return simple_chat(self.client, self.model, [{"role": "user", "content": prompt}], use_cache=self.use_cache, tracker=self.tracker, role="generator")
 
     def convert_sql(self, oracle_sql, current_rules=None):
-        """2. Converter (Deterministic)"""
+        """2. Converter (Deterministic); without current_rules the registry's live generation is used"""
+        if current_rules is None:
+            current_rules = get_registry().current()
         return convert(oracle_sql, rules=current_rules)
 
-    def review_conversion(self, oracle_sql, snowflake_sql):
-        """3. Reviewer Agent"""
+    def review_conversion(self, oracle_sql, snowflake_sql, on_token=None, on_field=None):
+        """
+        3. Reviewer Agent
+        With on_token/on_field the answer is streamed: on_token(delta, text)
+        per chunk and on_field(key, value) as soon as a top-level field such as
+        "score" or "issues" is complete. A stream that is not JSON is aborted.
+        With static_first the deterministic pre-review runs first: a clean
+        result is returned without calling the LLM, otherwise its findings are
+        merged into the LLM review.
+        """
+        pre = None
+        if self.static_first:
+            pre = static_review(oracle_sql, snowflake_sql)
+            if pre["clean"]:
+                if on_field is not None:
+                    on_field("score", pre["score"])
+                    on_field("issues", pre["issues"])
+                return pre
         if not self.client:
-            return {"score": 0, "issues": ["LLM client missing"]}
+            return _with_static({"score": 0, "issues": ["LLM client missing"]}, pre)
 
         prompt = f"""You are a Snowflake SQL Expert and Code Reviewer.
         Compare the source Oracle SQL and the converted Snowflake SQL.
@@ -54,13 +147,146 @@ class EvolutionManager:
         }}
         Output ONLY valid JSON."""
 
-        res = simple_chat(self.client, self.model, [{"role": "user", "content": prompt}])
+        if on_token is None and on_field is None:
+            res = simple_chat(self.client, self.model, [{"role": "user", "content": prompt}], use_cache=self.use_cache, tracker=self.tracker, role="reviewer")
+        else:
+            fields = JSONFieldStream()
+
+            def _on_token(delta, text):
+                if on_token is not None:
+                    on_token(delta, text)
+                for k, v in fields.feed(delta):
+                    if on_field is not None:
+                        on_field(k, v)
+                return not fields.failed
+
+            res = stream_chat(
+                self.client, self.model, [{"role": "user", "content": prompt}],
+                on_token=_on_token, use_cache=self.use_cache, tracker=self.tracker, role="reviewer",
+            )
+            if fields.failed:
+                return _with_static({"score": 0, "issues": [f"Failed to parse Reviewer output: {res}"], "error": "stream aborted: not JSON"}, pre)
         try:
             # Clean up potential markdown code blocks
             res = res.replace("```json", "").replace("```", "").strip()
-            return json.loads(res)
+            return _with_static(json.loads(res), pre)
         except Exception as e:
-            return {"score": 0, "issues": [f"Failed to parse Reviewer output: {res}"], "error": str(e)}
+            return _with_static({"score": 0, "issues": [f"Failed to parse Reviewer output: {res}"], "error": str(e)}, pre)
+
+    def plan_reviews(self, pairs, max_prompt_tokens=6000):
+        """
+        (reviews, pre_reviews, batches) for review_conversions: reviews holds
+        the clean static pre-reviews (None where the LLM is needed) and
+        batches the indexes of the other pairs, packed in order so that each
+        batch prompt stays under max_prompt_tokens.
+        """
+        results = [None] * len(pairs)
+        pres = [None] * len(pairs)
+        if self.static_first:
+            for i, (o_sql, s_sql) in enumerate(pairs):
+                pres[i] = static_review(o_sql, s_sql)
+                if pres[i]["clean"]:
+                    results[i] = pres[i]
+        overhead = estimate_tokens(BATCH_REVIEW_PROMPT)
+        batches = []
+        cur = []
+        used = overhead
+        for i, (o_sql, s_sql) in enumerate(pairs):
+            if results[i] is not None:
+                continue
+            cost = estimate_tokens(o_sql, s_sql) + 20
+            if cur and used + cost > max_prompt_tokens:
+                batches.append(cur)
+                cur = []
+                used = overhead
+            cur.append(i)
+            used += cost
+        if cur:
+            batches.append(cur)
+        return results, pres, batches
+
+    def review_conversions(self, pairs, max_prompt_tokens=6000, retry_missing=True):
+        """
+        3b. Batched Reviewer: packs several (oracle_sql, snowflake_sql) pairs
+        into one prompt up to max_prompt_tokens and asks for a JSON array keyed
+        by item id. Items missing from an answer (or unparseable) are reviewed
+        one by one when retry_missing, otherwise reported as failed.
+        Returns reviews in input order. With static_first, pairs the
+        deterministic pre-review finds clean are not sent at all.
+        """
+        results, pres, batches = self.plan_reviews(pairs, max_prompt_tokens)
+        if not self.client:
+            return [r if r is not None else _with_static({"score": 0, "issues": ["LLM client missing"]}, p) for r, p in zip(results, pres)]
+
+        for idxs in batches:
+            if len(idxs) == 1:
+                results[idxs[0]] = self.review_conversion(*pairs[idxs[0]])
+                continue
+            items = "\n\n".join(
+                f"### id: {i}\nSource (Oracle):\n{pairs[i][0]}\n\nTarget (Snowflake):\n{pairs[i][1]}" for i in idxs
+            )
+            try:
+                res = simple_chat(
+                    self.client, self.model, [{"role": "user", "content": BATCH_REVIEW_PROMPT.format(items=items)}],
+                    use_cache=self.use_cache, tracker=self.tracker, role="reviewer",
+                )
+                parsed = _parse_batch_review(res)
+            except BudgetExceeded:
+                raise
+            except Exception as e:
+                res = str(e)
+                parsed = {}
+            for i in idxs:
+                r = parsed.get(str(i))
+                if r is not None:
+                    results[i] = _with_static(r, pres[i])
+                elif retry_missing:
+                    results[i] = self.review_conversion(*pairs[i])
+                else:
+                    results[i] = _with_static({"score": 0, "issues": [f"Failed to parse Reviewer output for item {i}: {res}"], "error": "missing item"}, pres[i])
+        return results
+
+    def review_conversion_chunked(self, oracle_sql, snowflake_sql, max_chunk_tokens=CHUNK_REVIEW_TOKENS, concurrency=4, acquire=None):
+        """
+        3c. Chunked Reviewer for large objects (e.g. PL/SQL packages): both
+        sides are split on matching statement/block boundaries, the chunks are
+        reviewed concurrently and the results merged (issues tagged with their
+        part, size-weighted score, min_score). Inputs under max_chunk_tokens
+        get a single review_conversion call. acquire(est_tokens), if given, is
+        called (and may block) before every reviewer request, e.g. to take a
+        rate-limiter slot per chunk.
+        """
+
+        def _review(o, s):
+            if acquire is not None:
+                acquire(estimate_tokens(o, s) + 500)
+            return self.review_conversion(o, s)
+
+        if estimate_tokens(oracle_sql, snowflake_sql) <= max_chunk_tokens:
+            return _review(oracle_sql, snowflake_sql)
+        if self.static_first:
+            pre = static_review(oracle_sql, snowflake_sql)
+            if pre["clean"]:
+                return pre
+        pairs, aligned = pair_chunks(
+            oracle_sql, snowflake_sql, max_chunk_tokens * 4,
+            convert_fn=lambda o: self.convert_sql(o)[0],
+        )
+        if len(pairs) == 1:
+            return _review(oracle_sql, snowflake_sql)
+        n = len(pairs)
+        with ThreadPoolExecutor(max_workers=max(1, min(int(concurrency), n)), thread_name_prefix="review-chunk") as ex:
+            futs = [
+                ex.submit(_review, f"-- part {i}/{n}\n{o}", f"-- part {i}/{n}\n{s}")
+                for i, (o, s) in enumerate(pairs, 1)
+            ]
+            reviews = [f.result() for f in futs]
+        merged = merge_reviews(reviews, [len(o) + len(s) for o, s in pairs])
+        merged["chunks"] = n
+        merged["aligned"] = aligned
+        if not aligned:
+            merged["issues"].append("Statement boundaries differ between source and target; chunks were re-converted from the source for review.")
+        return merged
 
     def optimize_rule(self, oracle_sql, snowflake_sql, issues):
         """4. Optimizer Agent"""
@@ -85,64 +311,36 @@ class EvolutionManager:
         For regex, ensure you use Python regex syntax. Escape backslashes correctly for JSON.
         Output ONLY valid JSON."""
 
-        res = simple_chat(self.client, self.model, [{"role": "user", "content": prompt}])
+        res = simple_chat(self.client, self.model, [{"role": "user", "content": prompt}], use_cache=self.use_cache, tracker=self.tracker, role="optimizer")
         try:
             res = res.replace("```json", "").replace("```", "").strip()
             return json.loads(res)
         except Exception:
             return None
 
-    def save_rule_snapshot(self, rule_proposal, oracle_sql, snowflake_sql, review_result):
-        """5. Version Control / Logging"""
+    def save_rule_snapshot(self, rule_proposal, oracle_sql, snowflake_sql, review_result, status="proposed", **extra):
+        """5. Version Control / Logging: appends to the rule history store, returns the entry id"""
         entry = {
             "timestamp": datetime.utcnow().isoformat(),
             "trigger_sql": oracle_sql,
             "before_conversion": snowflake_sql,
             "issues": review_result.get("issues"),
             "proposed_rule": rule_proposal,
-            "applied": False
+            **extra,
         }
-        
-        history = []
-        if os.path.exists(self.history_path):
-            try:
-                with open(self.history_path, "r", encoding="utf-8") as f:
-                    history = json.load(f)
-            except:
-                pass
-        
-        history.append(entry)
-        with open(self.history_path, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
-        
-        return len(history) - 1  # Return index
+        return get_history_store().append(entry, status)
+
+    def mark_rule(self, entry_id, status):
+        """Moves a history entry to applied / rejected / rolled_back."""
+        return get_history_store().set_status(entry_id, status)
+
+    def gate_rule(self, rule_proposal, trigger_sql=None, **kw):
+        """4b. Regression / performance gate for a proposal against the live rules (see rule_gate.gate_rule)."""
+        return gate_rule(rule_proposal, get_registry().rules(), trigger_sql=trigger_sql, **kw)
 
     def apply_rule(self, rule_proposal):
-        """Apply the rule to the local rules.json file"""
-        current_rules = {"replacements": [], "regex": [], "warnings": []}
-        if os.path.exists(self.rules_path):
-            try:
-                with open(self.rules_path, "r", encoding="utf-8") as f:
-                    current_rules = json.load(f)
-            except:
-                pass
-        
-        # Ensure keys exist
-        for k in ["replacements", "regex", "warnings"]:
-            if k not in current_rules:
-                current_rules[k] = []
-
-        if rule_proposal.get("type") == "regex":
-            # Check for duplicates? simple check
-            new_rule = {"pattern": rule_proposal["pattern"], "repl": rule_proposal["repl"]}
-            if new_rule not in current_rules["regex"]:
-                current_rules["regex"].append(new_rule)
-        elif rule_proposal.get("type") == "replacement":
-            new_rule = [rule_proposal["pattern"], rule_proposal["repl"]]
-            if new_rule not in current_rules["replacements"]:
-                current_rules["replacements"].append(new_rule)
-        
-        with open(self.rules_path, "w", encoding="utf-8") as f:
-            json.dump(current_rules, f, indent=2, ensure_ascii=False)
-        
-        return True
+        """Publish the live rules plus this rule as a new registry generation; returns the generation"""
+        return get_registry().update(
+            lambda current_rules: with_rule(current_rules, rule_proposal),
+            note=f"{rule_proposal.get('type')}: {rule_proposal.get('pattern')}",
+        )
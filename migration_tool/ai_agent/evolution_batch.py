@@ -0,0 +1,246 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from migration_tool.ai_agent.evolution import CHUNK_REVIEW_TOKENS
+from migration_tool.ai_agent.llm_utils import estimate_tokens
+
+
+class TokenBucket:
+    """Async token bucket refilling `per_minute` units per minute up to one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, n: float = 1.0):
+        if self.capacity <= 0:
+            return
+        n = min(float(n), self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """Requests/min and tokens/min limits; 0 disables a limit."""
+
+    def __init__(self, requests_per_min: float = 60, tokens_per_min: float = 100000):
+        self.requests = TokenBucket(requests_per_min)
+        self.tokens = TokenBucket(tokens_per_min)
+
+    async def acquire(self, est_tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(est_tokens)
+
+
+async def _call(limiter, executor, est_tokens, fn, *args):
+    await limiter.acquire(est_tokens)
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+def _label(topic):
+    if isinstance(topic, dict):
+        return topic.get("topic") or f"[log ×{topic.get('count', 1)}] {' '.join(topic['oracle_sql'].split())[:80]}"
+    return topic
+
+
+def _new_result(topic):
+    res = {"topic": topic, "oracle_sql": None, "snowflake_sql": None, "warnings": [], "review": None, "proposal": None, "error": None}
+    if isinstance(topic, dict):
+        res.update(topic)
+        res["topic"] = _label(topic)
+    res["_start"] = time.perf_counter()
+    return res
+
+
+def _done(res):
+    res["elapsed_ms"] = int((time.perf_counter() - res.pop("_start")) * 1000)
+    return res
+
+
+async def _prepare(manager, res, topic, limiter, rules, executor):
+    """Generate (unless the topic carries its SQL) and convert; errors land in res."""
+    try:
+        if res["oracle_sql"] is None:
+            res["oracle_sql"] = await _call(limiter, executor, estimate_tokens(topic) + 600, manager.generate_sql, topic)
+        sf_sql, warns = manager.convert_sql(res["oracle_sql"], rules)
+        res["snowflake_sql"] = sf_sql
+        res["warnings"] = warns
+    except Exception as e:
+        res["error"] = str(e)
+    return res
+
+
+async def _review_one(manager, res, limiter, executor):
+    """Chunked review of one topic; every chunk request takes its own rate-limiter slot."""
+    loop = asyncio.get_running_loop()
+
+    def acquire(est_tokens):
+        asyncio.run_coroutine_threadsafe(limiter.acquire(est_tokens), loop).result()
+
+    try:
+        res["review"] = await loop.run_in_executor(
+            executor, partial(manager.review_conversion_chunked, res["oracle_sql"], res["snowflake_sql"], acquire=acquire),
+        )
+    except Exception as e:
+        res["error"] = str(e)
+
+
+async def _review_batch(manager, items, limiter, executor, max_prompt_tokens):
+    """One batched review request for items (already packed to fit); items it missed are reviewed one by one."""
+    pairs = [(r["oracle_sql"], r["snowflake_sql"]) for r in items]
+    try:
+        reviews = await _call(
+            limiter, executor, estimate_tokens(*[sql for p in pairs for sql in p]) + 200 * len(pairs) + 300,
+            manager.review_conversions, pairs, max_prompt_tokens, False,
+        )
+    except Exception as e:
+        for r in items:
+            r["error"] = str(e)
+        return
+    retry = []
+    for r, review in zip(items, reviews):
+        if review.get("error") == "missing item":
+            retry.append(r)
+        else:
+            r["review"] = review
+    await asyncio.gather(*[_review_one(manager, r, limiter, executor) for r in retry])
+
+
+async def _review_all(manager, items, limiter, executor, sem, max_prompt_tokens=6000):
+    """
+    Review stage over many converted topics: pairs small enough for one
+    prompt are packed into batched reviewer calls (static-clean ones skip the
+    LLM), larger objects get the chunked reviewer. sem bounds the batches and
+    objects under review at once.
+    """
+
+    async def _bounded(coro):
+        async with sem:
+            await coro
+
+    small = [r for r in items if estimate_tokens(r["oracle_sql"], r["snowflake_sql"]) <= CHUNK_REVIEW_TOKENS]
+    large = [r for r in items if r not in small]
+    reviews, _, batches = manager.plan_reviews([(r["oracle_sql"], r["snowflake_sql"]) for r in small], max_prompt_tokens)
+    for r, review in zip(small, reviews):
+        if review is not None:
+            r["review"] = review
+    await asyncio.gather(
+        *[_bounded(_review_batch(manager, [small[i] for i in idxs], limiter, executor, max_prompt_tokens)) for idxs in batches],
+        *[_bounded(_review_one(manager, r, limiter, executor)) for r in large],
+    )
+
+
+async def _optimize(manager, res, limiter, executor):
+    """Proposes (and snapshots) a rule for a reviewed topic whose review found problems."""
+    review = res["review"]
+    sf_sql = res["snowflake_sql"]
+    try:
+        if review.get("score", 0) < 10 or review.get("issues"):
+            res["proposal"] = await _call(
+                limiter,
+                executor,
+                estimate_tokens(res["oracle_sql"], sf_sql, review.get("issues")) + 400,
+                manager.optimize_rule,
+                res["oracle_sql"],
+                sf_sql,
+                review.get("issues"),
+            )
+            if res["proposal"]:
+                res["history_id"] = await asyncio.get_running_loop().run_in_executor(
+                    executor, manager.save_rule_snapshot, res["proposal"], res["oracle_sql"], sf_sql, review,
+                )
+    except Exception as e:
+        res["error"] = str(e)
+    return res
+
+
+async def evolve_topic(manager, topic, limiter: RateLimiter, rules=None, executor=None):
+    """
+    One generate → convert → review → optimize pipeline; blocking agent calls
+    run in worker threads. topic may also be a dict carrying oracle_sql (e.g.
+    a statement mined from the logs, see log_corpus.mine_failing_sql): the
+    generator call is skipped and its other keys are kept in the result.
+    """
+    res = await _prepare(manager, _new_result(topic), topic, limiter, rules, executor)
+    if res["error"] is None:
+        await _review_one(manager, res, limiter, executor)
+    if res["error"] is None:
+        await _optimize(manager, res, limiter, executor)
+    return _done(res)
+
+
+async def evolve_topics(manager, topics, concurrency: int = 8, requests_per_min: float = 60, tokens_per_min: float = 100000, rules=None, on_result=None):
+    """
+    Runs the evolution pipeline for every topic, at most `concurrency` agent
+    calls at a time and within the request/token rate limits. All topics are
+    generated and converted first, then reviewed together so that small
+    conversions share batched reviewer prompts, then optimized.
+    on_result(result) is called as each topic finishes (failed ones as soon as
+    they fail, the rest in completion order); returns all results. Once the
+    manager's UsageTracker reports its budget exhausted, topics not yet
+    started are skipped. Without rules each conversion uses the rule
+    registry's live generation, so rules applied mid-run are picked up.
+    """
+    limiter = RateLimiter(requests_per_min, tokens_per_min)
+    concurrency = max(1, int(concurrency))
+    sem = asyncio.Semaphore(concurrency)
+
+    tracker = getattr(manager, "tracker", None)
+    results = []
+
+    def _report(res):
+        results.append(_done(res))
+        if on_result is not None:
+            on_result(res)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="evolution") as executor:
+
+        async def _one(topic):
+            res = _new_result(topic)
+            async with sem:
+                if tracker is not None and tracker.exhausted:
+                    res.update(skipped=True, error="budget exhausted")
+                else:
+                    await _prepare(manager, res, topic, limiter, rules, executor)
+            if res["error"] is not None:
+                _report(res)
+            return res
+
+        converted = [r for r in await asyncio.gather(*[_one(t) for t in topics]) if r["error"] is None]
+        if tracker is not None and tracker.exhausted:
+            for r in converted:
+                r.update(skipped=True, error="budget exhausted")
+                _report(r)
+            return results
+        await _review_all(manager, converted, limiter, executor, sem)
+        for r in converted:
+            if r["error"] is not None:
+                _report(r)
+
+        async def _finish(res):
+            async with sem:
+                return await _optimize(manager, res, limiter, executor)
+
+        for fut in asyncio.as_completed([_finish(r) for r in converted if r["error"] is None]):
+            _report(await fut)
+    return results
+
+
+def run_evolution_batch(manager, topics, concurrency: int = 8, requests_per_min: float = 60, tokens_per_min: float = 100000, rules=None, on_result=None):
+    """Blocking entry point for the UI: drives evolve_topics on a fresh event loop."""
+    return asyncio.run(evolve_topics(manager, topics, concurrency, requests_per_min, tokens_per_min, rules, on_result))
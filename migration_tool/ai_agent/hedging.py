@@ -0,0 +1,301 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from migration_tool.ai_agent.llm_cache import client_endpoint
+from migration_tool.metrics import REGISTRY
+
+LLM_HEDGES = REGISTRY.counter("migration_llm_hedges_total", "Hedged LLM calls: hedges and failovers launched, wins by a non-primary provider.", ("outcome",))
+
+_QUOTA_MARKERS = ("http error 429", "insufficient_quota", "quota", "rate limit", "ratelimit", "too many requests")
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name) or default)
+    except ValueError:
+        return default
+
+
+def is_quota_error(exc):
+    """True for 429s and provider quota/rate-limit errors (HTTP fallback text or SDK status_code)."""
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    text = str(exc).lower()
+    return any(m in text for m in _QUOTA_MARKERS)
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _ProviderState:
+    """Latency windows, quota parking and counters of one (endpoint, model); shared by every HedgedClient in the process."""
+
+    def __init__(self, window):
+        self.lock = threading.Lock()
+        self.latency = {False: deque(maxlen=window), True: deque(maxlen=window)}
+        self.parked_until = 0.0
+        self.stats = {"calls": 0, "wins": 0, "errors": 0, "quota_errors": 0, "cancelled": 0}
+
+
+_STATES = {}
+_STATES_LOCK = threading.Lock()
+
+
+def _provider_state(endpoint, model, window=200):
+    key = (endpoint, model)
+    with _STATES_LOCK:
+        st = _STATES.get(key)
+        if st is None:
+            st = _STATES[key] = _ProviderState(window)
+        return st
+
+
+class HedgedClient:
+    """
+    Multi-provider LLM client. A call goes to the first provider; if it has
+    not answered after its recent hedge_percentile latency (time to first
+    token when streaming, full answer otherwise), the same request is sent
+    to the next provider and the first valid answer wins, the other stream
+    being closed at its next chunk. Errors fail over to the next provider at
+    once; quota/429 errors also park the provider for quota_cooldown seconds
+    so later calls start on a healthy one. Until min_samples latencies are
+    known the hedge waits initial_delay. Latency windows, parking and
+    counters are kept per process for each (endpoint, model), so every
+    client over the same provider shares them. Attempts run without
+    transport retries: the other provider is the retry. Only the winner's usage is
+    reported; tokens spent by a cancelled attempt are not.
+
+    providers: [{"client", "model" (None = caller's model), "name"}], primary first.
+    """
+
+    is_hedged = True
+
+    def __init__(self, providers, hedge_percentile=None, initial_delay=None, min_delay=0.05, min_samples=20, quota_cooldown=None, window=200, valid=None):
+        if not providers:
+            raise ValueError("HedgedClient needs at least one provider")
+        self.providers = [dict(p, name=p.get("name") or f"provider{i}") for i, p in enumerate(providers)]
+        self.hedge_percentile = float(hedge_percentile if hedge_percentile is not None else _env_float("MIGRATION_LLM_HEDGE_PERCENTILE", 95))
+        self.initial_delay = float(initial_delay if initial_delay is not None else _env_float("MIGRATION_LLM_HEDGE_DELAY", 5.0))
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.quota_cooldown = float(quota_cooldown if quota_cooldown is not None else _env_float("MIGRATION_LLM_QUOTA_COOLDOWN", 60.0))
+        self.valid = valid or (lambda content: bool((content or "").strip()))
+        self._window = window
+        self._endpoints = [client_endpoint(p["client"]) for p in self.providers]
+        # Cache identity is the primary's, so hedging does not split the cache
+        self.base_url = self._endpoints[0]
+
+    def _model(self, index, model):
+        return self.providers[index].get("model") or model
+
+    def _state(self, index, model):
+        """Process-wide state of provider index serving model (keyed by endpoint and model)."""
+        return _provider_state(self._endpoints[index], self._model(index, model), self._window)
+
+    def hedge_delay(self, index: int, streaming: bool = False, model=None):
+        """Seconds to wait on provider index before hedging: its recent latency percentile."""
+        st = self._state(index, model)
+        with st.lock:
+            w = sorted(st.latency[streaming])
+        if len(w) < self.min_samples:
+            return self.initial_delay
+        k = min(len(w) - 1, max(0, int(round(self.hedge_percentile / 100.0 * len(w))) - 1))
+        return max(self.min_delay, w[k])
+
+    def _observe(self, index, model, streaming, seconds):
+        st = self._state(index, model)
+        with st.lock:
+            st.latency[streaming].append(seconds)
+
+    def _count(self, index, model, key, park=False):
+        st = self._state(index, model)
+        with st.lock:
+            st.stats[key] += 1
+            if park:
+                st.parked_until = time.monotonic() + self.quota_cooldown
+
+    def _order(self, model):
+        """Provider indexes, healthy ones first (parked ones only as a last resort)."""
+        now = time.monotonic()
+        until = {}
+        for i in range(len(self.providers)):
+            st = self._state(i, model)
+            with st.lock:
+                until[i] = st.parked_until
+        parked = sorted((i for i in until if until[i] > now), key=lambda i: until[i])
+        return [i for i in until if until[i] <= now] + parked
+
+    def stats(self, model=None):
+        """Per-provider counters, current hedge delay and parking; model is the caller's model for providers without their own."""
+        now = time.monotonic()
+        out = []
+        for i, p in enumerate(self.providers):
+            st = self._state(i, model)
+            with st.lock:
+                s = dict(st.stats)
+                parked = max(0.0, st.parked_until - now)
+            s["name"] = p["name"]
+            s["hedge_delay_s"] = round(self.hedge_delay(i, model=model), 3)
+            s["parked_s"] = round(parked, 1)
+            out.append(s)
+        return out
+
+    def _attempt(self, index, model, messages, temperature, cancel, streaming, results):
+        """Runs one provider in a worker thread; tokens and the outcome go to results, never to caller callbacks."""
+        from migration_tool.ai_agent.llm_utils import _stream
+
+        p = self.providers[index]
+        start = time.perf_counter()
+        first = []
+
+        def on_token(delta, text):
+            if cancel.is_set():
+                return False
+            if not first:
+                first.append(time.perf_counter() - start)
+            if streaming:
+                results.put(("token", index, delta, text))
+            return True
+
+        try:
+            content, usage, aborted = _stream(p["client"], self._model(index, model), messages, temperature, on_token, max_retries=0)
+        except Exception as e:
+            results.put(("done", index, e, None, None))
+            return
+        if aborted and cancel.is_set():
+            self._count(index, model, "cancelled")
+            results.put(("done", index, _Cancelled(), None, None))
+            return
+        elapsed = time.perf_counter() - start
+        results.put(("done", index, None, (content, usage), (first[0] if first else elapsed, elapsed)))
+
+    def stream(self, model, messages, temperature=0, on_token=None):
+        """
+        (content, usage, aborted, model), model being the one that answered
+        (a secondary's own model when it won). With on_token the first
+        provider to emit a token wins and only its tokens are forwarded;
+        on_token returning False closes the stream early, as in stream_chat.
+        on_token is always called on the calling thread (Streamlit elements
+        can only be updated there).
+        """
+        streaming = on_token is not None
+        order = self._order(model)
+        results = queue.Queue()
+        cancels = {}
+        winner = None
+        text = ""
+        pending = 0
+        launched = 0
+        last_launch = 0.0
+        last_error = None
+
+        def launch():
+            nonlocal pending, launched, last_launch
+            i = order[launched]
+            launched += 1
+            pending += 1
+            cancels[i] = threading.Event()
+            self._count(i, model, "calls")
+            last_launch = time.monotonic()
+            threading.Thread(
+                target=self._attempt, args=(i, model, messages, temperature, cancels[i], streaming, results), daemon=True
+            ).start()
+
+        def cancel_others(i):
+            for j, ev in cancels.items():
+                if j != i:
+                    ev.set()
+
+        launch()
+        while True:
+            timeout = None
+            if launched < len(order) and winner is None:
+                timeout = self.hedge_delay(order[launched - 1], streaming, model) - (time.monotonic() - last_launch)
+                if timeout <= 0:
+                    LLM_HEDGES.inc(outcome="hedged")
+                    launch()
+                    continue
+            try:
+                msg = results.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if msg[0] == "token":
+                _, i, delta, text_i = msg
+                if cancels[i].is_set():
+                    continue
+                if winner is None:
+                    winner = i
+                    cancel_others(i)
+                text = text_i
+                if on_token(delta, text) is False:
+                    cancels[i].set()
+                    return text, None, True, self._model(i, model)
+                continue
+            _, i, err, res, times = msg
+            pending -= 1
+            if isinstance(err, _Cancelled):
+                if pending == 0 and launched >= len(order):
+                    raise last_error or RuntimeError("all LLM providers were cancelled")
+                continue
+            if err is None and not self.valid(res[0]):
+                err = ValueError(f"{self.providers[i]['name']} returned an invalid answer")
+            if err is None and (winner is None or winner == i):
+                cancel_others(i)
+                self._observe(i, model, streaming, times[0] if streaming else times[1])
+                st = self._state(i, model)
+                with st.lock:
+                    st.stats["wins"] += 1
+                    st.parked_until = 0.0
+                if i != 0:
+                    LLM_HEDGES.inc(outcome="secondary_won")
+                return res[0], res[1], False, self._model(i, model)
+            if err is None:
+                # Finished before its cancel was seen; the streamed winner's answer is the one delivered
+                continue
+            last_error = err
+            self._count(i, model, "errors")
+            if is_quota_error(err):
+                self._count(i, model, "quota_errors", park=True)
+            if winner == i:
+                # Tokens were already delivered to the caller; another provider cannot continue them
+                cancel_others(i)
+                raise err
+            if launched < len(order) and winner is None:
+                LLM_HEDGES.inc(outcome="failover")
+                launch()
+            elif pending == 0:
+                raise err
+
+
+def _secondary_from_env():
+    provider = os.environ.get("MIGRATION_LLM_SECONDARY_PROVIDER")
+    if not provider:
+        return None
+    return {
+        "provider": provider,
+        "api_key": os.environ.get("MIGRATION_LLM_SECONDARY_API_KEY"),
+        "base_url": os.environ.get("MIGRATION_LLM_SECONDARY_BASE_URL"),
+        "model": os.environ.get("MIGRATION_LLM_SECONDARY_MODEL"),
+    }
+
+
+def hedged_client(primary, primary_name, secondaries, hedge_percentile=None):
+    """
+    Wraps primary in a HedgedClient over the configured secondaries
+    ([{provider, api_key, base_url, model}]); secondaries without a usable
+    key are skipped, and primary is returned unchanged if none remain.
+    """
+    from migration_tool.ai_agent.llm_utils import _single_client
+
+    providers = [{"client": primary, "model": None, "name": primary_name}]
+    for s in secondaries or []:
+        c = _single_client(s.get("api_key"), s.get("provider") or "openai", s.get("base_url"))
+        if c is not None:
+            providers.append({"client": c, "model": s.get("model") or None, "name": f"{s.get('provider') or 'openai'}/{s.get('model') or '*'}"})
+    if len(providers) == 1:
+        return primary
+    return HedgedClient(providers, hedge_percentile=hedge_percentile)
@@ -0,0 +1,132 @@
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_SESSIONS = {}
+_LIMITS = {}
+_LOCK = threading.Lock()
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name) or default)
+    except ValueError:
+        return default
+
+
+def _origin(url: str):
+    m = re.match(r"^(https?://[^/]+)", url or "")
+    return (m.group(1) if m else url or "").lower()
+
+
+def get_session(base_url: str):
+    """
+    Shared keep-alive session per endpoint (scheme://host:port), so calls to
+    the same provider reuse pooled TCP/TLS connections across threads.
+    """
+    key = _origin(base_url)
+    with _LOCK:
+        s = _SESSIONS.get(key)
+        if s is None:
+            size = _env_int("MIGRATION_LLM_POOL_SIZE", 16)
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _SESSIONS[key] = s
+        return s
+
+
+def close_sessions():
+    with _LOCK:
+        for s in _SESSIONS.values():
+            s.close()
+        _SESSIONS.clear()
+        _LIMITS.clear()
+
+
+def parse_duration(v):
+    """Seconds from rate-limit reset values such as "20ms", "1.5s", "6m0s", "1h2m" or a bare number."""
+    if v is None:
+        return None
+    v = str(v).strip().lower()
+    if not v:
+        return None
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        pass
+    total = 0.0
+    matched = False
+    for num, unit in re.findall(r"([\d.]+)\s*(ms|h|m|s)", v):
+        matched = True
+        total += float(num) * {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}[unit]
+    return total if matched else None
+
+
+def ratelimit_wait(headers) -> float:
+    """
+    Seconds the server asks us to wait: the larger of Retry-After and the
+    x-ratelimit-reset-* of whichever x-ratelimit-remaining-* is exhausted.
+    """
+    h = {k.lower(): v for k, v in (headers or {}).items()}
+    wait = parse_duration(h.get("retry-after")) or 0.0
+    for kind in ("requests", "tokens"):
+        remaining = h.get(f"x-ratelimit-remaining-{kind}")
+        try:
+            exhausted = remaining is not None and float(remaining) <= 0
+        except ValueError:
+            exhausted = False
+        if exhausted:
+            wait = max(wait, parse_duration(h.get(f"x-ratelimit-reset-{kind}")) or 0.0)
+    return wait
+
+
+def _backoff(attempt: int, base_delay: float, max_delay: float):
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def post_json(url: str, headers: dict, payload: dict, timeout: float = 30, max_retries: int | None = None, base_delay: float = 0.5, max_delay: float = 30.0, stream: bool = False):
+    """
+    POST through the pooled session for url's endpoint. 429/5xx responses and
+    connection errors are retried up to max_retries times with full-jitter
+    exponential backoff, never sooner than Retry-After / x-ratelimit-reset-*.
+    When a response reports an exhausted x-ratelimit-remaining-* budget, later
+    calls to the same endpoint wait for the reset before sending.
+    Returns the last response (with stream=True the body is left unread);
+    raises the last connection error.
+    """
+    if max_retries is None:
+        max_retries = _env_int("MIGRATION_LLM_MAX_RETRIES", 4)
+    key = _origin(url)
+    session = get_session(url)
+    attempt = 0
+    while True:
+        with _LOCK:
+            blocked = _LIMITS.get(key, 0.0) - time.monotonic()
+        if blocked > 0:
+            time.sleep(min(blocked, max_delay))
+        try:
+            r = session.post(url, headers=headers, json=payload, timeout=timeout, stream=stream)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= max_retries:
+                raise
+            time.sleep(_backoff(attempt, base_delay, max_delay))
+            attempt += 1
+            continue
+        wait = ratelimit_wait(r.headers)
+        if wait > 0:
+            with _LOCK:
+                _LIMITS[key] = max(_LIMITS.get(key, 0.0), time.monotonic() + min(wait, max_delay))
+        if r.status_code not in RETRY_STATUS or attempt >= max_retries:
+            return r
+        r.close()
+        time.sleep(_backoff(attempt, base_delay, max_delay))
+        attempt += 1
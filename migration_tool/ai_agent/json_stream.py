@@ -0,0 +1,128 @@
+import json
+
+_WS = " \t\r\n"
+
+
+class JSONFieldStream:
+    """
+    Incremental extractor for the top-level fields of a JSON object that
+    arrives in chunks (e.g. a streamed reviewer answer). feed() returns the
+    (key, value) pairs completed by that chunk, so "score" can be shown
+    before "issues" is finished. Leading text such as a ```json fence is
+    skipped; anything else that is not valid JSON sets failed, so the caller
+    can abort the stream.
+    """
+
+    def __init__(self, max_preamble: int = 200):
+        self.buf = ""
+        self.pos = 0
+        self.fields = {}
+        self.done = False
+        self.failed = False
+        self.max_preamble = max_preamble
+        self._started = False
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._role = None
+        self._expect = "key"
+        self._key = None
+        self._start = 0
+
+    def feed(self, chunk: str):
+        out = []
+        if self.done or self.failed or not chunk:
+            return out
+        self.buf += chunk
+        while self.pos < len(self.buf) and not self.done and not self.failed:
+            self._step(self.buf[self.pos], out)
+            self.pos += 1
+        return out
+
+    def _emit(self, text, out):
+        try:
+            v = json.loads(text)
+        except ValueError:
+            self.failed = True
+            return
+        self.fields[self._key] = v
+        out.append((self._key, v))
+
+    def _step(self, c, out):
+        i = self.pos
+        if not self._started:
+            if c == "{":
+                self._started = True
+                self._depth = 1
+            elif i >= self.max_preamble:
+                self.failed = True
+            return
+        if self._in_str:
+            if self._esc:
+                self._esc = False
+            elif c == "\\":
+                self._esc = True
+            elif c == '"':
+                self._in_str = False
+                if self._role == "key":
+                    try:
+                        self._key = json.loads(self.buf[self._start:i + 1])
+                    except ValueError:
+                        self.failed = True
+                    self._expect = "colon"
+                elif self._role == "value":
+                    self._emit(self.buf[self._start:i + 1], out)
+                    self._expect = "after"
+            return
+        if self._expect == "nested":
+            if c == '"':
+                self._in_str = True
+                self._role = "inner"
+            elif c in "{[":
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._emit(self.buf[self._start:i + 1], out)
+                    self._expect = "after"
+            return
+        if self._expect == "scalar":
+            if c == "," or c == "}":
+                self._emit(self.buf[self._start:i].strip(), out)
+                self._expect = "key"
+                if c == "}":
+                    self.done = True
+            return
+        if c in _WS:
+            return
+        if self._expect == "key":
+            if c == '"':
+                self._in_str = True
+                self._role = "key"
+                self._start = i
+            elif c == "}":
+                self.done = True
+            else:
+                self.failed = True
+        elif self._expect == "colon":
+            if c == ":":
+                self._expect = "value"
+            else:
+                self.failed = True
+        elif self._expect == "value":
+            self._start = i
+            if c == '"':
+                self._in_str = True
+                self._role = "value"
+            elif c in "{[":
+                self._depth = 2
+                self._expect = "nested"
+            else:
+                self._expect = "scalar"
+        elif self._expect == "after":
+            if c == ",":
+                self._expect = "key"
+            elif c == "}":
+                self.done = True
+            else:
+                self.failed = True
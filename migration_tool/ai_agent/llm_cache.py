@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from migration_tool.metrics import REGISTRY
+
+CACHE_LOOKUPS = REGISTRY.counter("migration_llm_cache_total", "LLM response cache lookups by result.", ("result",))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    provider TEXT,
+    model TEXT,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL,
+    response TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access);
+"""
+
+
+def default_cache_path():
+    return os.path.join(os.path.dirname(os.path.dirname(__file__)), "state", "llm_cache.db")
+
+
+def client_endpoint(client):
+    """Provider identity of a client: its base_url (OpenAI SDK client or HTTP fallback dict)."""
+    if isinstance(client, dict):
+        return str(client.get("base_url") or "https://api.openai.com/v1").rstrip("/")
+    return str(getattr(client, "base_url", None) or "https://api.openai.com/v1").rstrip("/")
+
+
+def cache_key(provider: str, model: str, messages, temperature):
+    blob = json.dumps(
+        {"provider": provider, "model": model, "messages": messages, "temperature": float(temperature or 0)},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Disk-backed (SQLite) cache of chat completion results. Entries expire
+    after ttl seconds; when the stored responses exceed max_bytes the least
+    recently used ones are evicted. hits/misses count lookups in this process.
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 86400, max_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT created, response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl and now - row[0] > self.ttl:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            CACHE_LOOKUPS.inc(result="hit")
+            return json.loads(row[1])
+
+    def put(self, key: str, response, provider: str = None, model: str = None):
+        blob = json.dumps(response, ensure_ascii=False, default=str)
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses(key, provider, model, created, last_access, hits, size, response) "
+                "VALUES (?, ?, ?, ?, ?, 0, ?, ?)",
+                (key, provider, model, now, now, len(blob), blob),
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        if self.ttl:
+            self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        if not self.max_bytes:
+            return
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        drop = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            if total <= self.max_bytes:
+                break
+            drop.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", drop)
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+
+    def stats(self):
+        with self._lock:
+            n, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": n,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "ttl_seconds": self.ttl,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache():
+    """
+    Process-wide cache, or None when disabled. Configured by MIGRATION_LLM_CACHE
+    (1/0), MIGRATION_LLM_CACHE_PATH, MIGRATION_LLM_CACHE_TTL (seconds) and
+    MIGRATION_LLM_CACHE_MAX_BYTES.
+    """
+    global _CACHE
+    if os.environ.get("MIGRATION_LLM_CACHE", "1") == "0":
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            try:
+                ttl = float(os.environ.get("MIGRATION_LLM_CACHE_TTL") or 7 * 86400)
+            except ValueError:
+                ttl = 7 * 86400
+            try:
+                max_bytes = int(os.environ.get("MIGRATION_LLM_CACHE_MAX_BYTES") or 50 * 1024 * 1024)
+            except ValueError:
+                max_bytes = 50 * 1024 * 1024
+            _CACHE = LLMCache(os.environ.get("MIGRATION_LLM_CACHE_PATH") or default_cache_path(), ttl, max_bytes)
+        return _CACHE
@@ -1,12 +1,33 @@
 import os
-import requests
+import time
 import json
 
-def get_llm_client(api_key=None, provider="openai", base_url=None):
+from migration_tool.ai_agent.http_pool import post_json
+from migration_tool.ai_agent.llm_cache import cache_key, client_endpoint, get_cache
+from migration_tool.ai_agent.usage import usage_tokens
+from migration_tool.metrics import LLM_REQUESTS, LLM_SECONDS
+
+def get_llm_client(api_key=None, provider="openai", base_url=None, secondary=None, hedge_percentile=None):
     """
     Returns an initialized OpenAI client or a dict configuration for HTTP fallback.
     Handles environment variables if api_key is not provided.
+    With secondary ({provider, api_key, base_url, model} or a list of them; by
+    default read from MIGRATION_LLM_SECONDARY_*, False disables) the client is
+    a HedgedClient that hedges slow calls and fails over to the secondaries.
     """
+    client = _single_client(api_key, provider, base_url)
+    if client is None or secondary is False:
+        return client
+    from migration_tool.ai_agent.hedging import _secondary_from_env, hedged_client
+
+    if secondary is None:
+        secondary = _secondary_from_env()
+    if not secondary:
+        return client
+    return hedged_client(client, provider, secondary if isinstance(secondary, list) else [secondary], hedge_percentile)
+
+
+def _single_client(api_key=None, provider="openai", base_url=None):
     if not api_key:
         if provider == "dashscope":
             api_key = os.environ.get("DASHSCOPE_API_KEY") or os.environ.get("QWEN_API_KEY")
@@ -30,12 +51,185 @@ def get_llm_client(api_key=None, provider="openai", base_url=None):
              "is_http_fallback": True
          }
 
-def simple_chat(client, model, messages, temperature=0):
+def estimate_tokens(*texts):
+    """Rough token estimate (~4 characters per token) for budgeting prompts."""
+    return sum(len(str(t or "")) for t in texts) // 4 + 1
+
+
+COMPLETION_ESTIMATE = 512
+
+
+def _reserve(tracker, model, messages):
+    if tracker is None:
+        return 0
+    return tracker.reserve(estimate_tokens(*(m.get("content") for m in messages)) + COMPLETION_ESTIMATE, model, COMPLETION_ESTIMATE)
+
+
+def _record(tracker, role, model, messages, content, usage, latency_s, reserved, cached=False):
+    if tracker is None:
+        return
+    p, c = usage_tokens(usage)
+    estimated = p is None or c is None
+    if p is None:
+        p = estimate_tokens(*(m.get("content") for m in messages))
+    if c is None:
+        c = estimate_tokens(content)
+    tracker.record(role, model, p, c, int(latency_s * 1000), cached=cached, reserved=reserved, estimated=estimated)
+
+
+def _transport(client):
+    return "http" if isinstance(client, dict) and client.get("is_http_fallback") else "sdk"
+
+
+def _observe_llm(client, model, start, status):
+    LLM_SECONDS.observe(time.perf_counter() - start, model=model, transport=_transport(client))
+    LLM_REQUESTS.inc(model=model, transport=_transport(client), status=status)
+
+
+def simple_chat(client, model, messages, temperature=0, use_cache=True, tracker=None, role=None):
     """
     Simple wrapper for chat completions with error handling.
     Supports both OpenAI client and HTTP fallback.
+    Answers are cached on disk by endpoint, model, messages and temperature;
+    use_cache=False bypasses the cache for this call.
+    With a UsageTracker, token usage is recorded under role and the call is
+    refused (BudgetExceeded) if it would cross the tracker's budget.
     Returns content string or raises exception.
     """
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        key = cache_key(client_endpoint(client), model, messages, temperature)
+        hit = cache.get(key)
+        if hit is not None:
+            _record(tracker, role, model, messages, hit, None, 0, 0, cached=True)
+            return hit
+    reserved = _reserve(tracker, model, messages)
+    start = time.perf_counter()
+    try:
+        if getattr(client, "is_hedged", False):
+            # Usage is priced under the model that answered, which may be a secondary's
+            content, usage, _, used = client.stream(model, messages, temperature)
+        else:
+            content, usage = _chat(client, model, messages, temperature)
+            used = model
+    except Exception:
+        if tracker is not None:
+            tracker.release(reserved)
+        raise
+    _record(tracker, role, used, messages, content, usage, time.perf_counter() - start, reserved)
+    if cache is not None and content:
+        cache.put(key, content, client_endpoint(client), model)
+    return content
+
+
+def stream_chat(client, model, messages, temperature=0, on_token=None, use_cache=True, tracker=None, role=None):
+    """
+    Streaming variant of simple_chat (OpenAI client stream=True, or SSE over
+    the HTTP fallback). on_token(delta, text_so_far) is called per chunk; if
+    it returns False the stream is closed early and the partial text returned.
+    A cached answer is delivered as a single chunk.
+    """
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        key = cache_key(client_endpoint(client), model, messages, temperature)
+        hit = cache.get(key)
+        if hit is not None:
+            _record(tracker, role, model, messages, hit, None, 0, 0, cached=True)
+            if on_token is not None:
+                on_token(hit, hit)
+            return hit
+    reserved = _reserve(tracker, model, messages)
+    start = time.perf_counter()
+    try:
+        if getattr(client, "is_hedged", False):
+            content, usage, aborted, used = client.stream(model, messages, temperature, on_token=on_token)
+        else:
+            content, usage, aborted = _stream(client, model, messages, temperature, on_token)
+            used = model
+    except Exception:
+        if tracker is not None:
+            tracker.release(reserved)
+        raise
+    _record(tracker, role, used, messages, content, usage, time.perf_counter() - start, reserved)
+    if cache is not None and content and not aborted:
+        cache.put(key, content, client_endpoint(client), model)
+    return content
+
+
+def _stream(client, model, messages, temperature=0, on_token=None, max_retries=None):
+    """One streamed completion on a single client: (content, usage, aborted)."""
+    start = time.perf_counter()
+    parts = []
+    usage = None
+    aborted = False
+    try:
+        if isinstance(client, dict) and client.get("is_http_fallback"):
+            url = client["base_url"].rstrip("/") + "/chat/completions"
+            headers = {
+                "Authorization": f"Bearer {client['api_key']}",
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream",
+            }
+            payload = {"model": model, "messages": messages, "temperature": temperature, "stream": True, "stream_options": {"include_usage": True}}
+            r = post_json(url, headers, payload, timeout=30, max_retries=max_retries, stream=True)
+            try:
+                if r.status_code != 200:
+                    raise Exception(f"HTTP Error {r.status_code}: {r.text}")
+                if "event-stream" not in (r.headers.get("Content-Type") or ""):
+                    # Server ignored stream=True: deliver the whole answer at once
+                    data = r.json()
+                    content = data.get("choices", [{}])[0].get("message", {}).get("content", "") or ""
+                    usage = data.get("usage")
+                    parts.append(content)
+                    if on_token is not None:
+                        on_token(content, content)
+                else:
+                    for line in r.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        event = json.loads(data)
+                        usage = event.get("usage") or usage
+                        delta = ((event.get("choices") or [{}])[0].get("delta") or {}).get("content") or ""
+                        if not delta:
+                            continue
+                        parts.append(delta)
+                        if on_token is not None and on_token(delta, "".join(parts)) is False:
+                            aborted = True
+                            break
+            finally:
+                r.close()
+        else:
+            if max_retries is not None and hasattr(client, "with_options"):
+                client = client.with_options(max_retries=max_retries)
+            stream = client.chat.completions.create(
+                model=model, messages=messages, temperature=temperature, stream=True, stream_options={"include_usage": True}
+            )
+            try:
+                for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    delta = (chunk.choices[0].delta.content if chunk.choices else None) or ""
+                    if not delta:
+                        continue
+                    parts.append(delta)
+                    if on_token is not None and on_token(delta, "".join(parts)) is False:
+                        aborted = True
+                        break
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+    except Exception as e:
+        _observe_llm(client, model, start, "error")
+        raise e
+    _observe_llm(client, model, start, "aborted" if aborted else "ok")
+    return "".join(parts), usage, aborted
+
+
+def _chat(client, model, messages, temperature=0):
+    start = time.perf_counter()
     try:
         if isinstance(client, dict) and client.get("is_http_fallback"):
             # HTTP Fallback implementation
@@ -49,9 +243,12 @@ def simple_chat(client, model, messages, temperature=0):
                 "messages": messages,
                 "temperature": temperature
             }
-            r = requests.post(url, headers=headers, json=payload, timeout=30)
+            r = post_json(url, headers, payload, timeout=30)
             if r.status_code == 200:
-                return r.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+                data = r.json()
+                content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+                _observe_llm(client, model, start, "ok")
+                return content, data.get("usage")
             else:
                 raise Exception(f"HTTP Error {r.status_code}: {r.text}")
         else:
@@ -61,11 +258,14 @@ def simple_chat(client, model, messages, temperature=0):
                 messages=messages,
                 temperature=temperature
             )
-            return resp.choices[0].message.content
+            _observe_llm(client, model, start, "ok")
+            return resp.choices[0].message.content, getattr(resp, "usage", None)
     except Exception as e:
+        _observe_llm(client, model, start, "error")
         raise e
 
 def simple_chat_raw(client, model, messages, temperature=0):
+    start = time.perf_counter()
     try:
         if isinstance(client, dict) and client.get("is_http_fallback"):
             url = client["base_url"].rstrip("/") + "/chat/completions"
@@ -78,7 +278,8 @@ def simple_chat_raw(client, model, messages, temperature=0):
                 "messages": messages,
                 "temperature": temperature
             }
-            r = requests.post(url, headers=headers, json=payload, timeout=30)
+            r = post_json(url, headers, payload, timeout=30)
+            _observe_llm(client, model, start, "ok" if r.status_code == 200 else "error")
             return r.json()
         else:
             resp = client.chat.completions.create(
@@ -90,8 +291,10 @@ def simple_chat_raw(client, model, messages, temperature=0):
                 "choices": [{"message": {"content": resp.choices[0].message.content}}],
                 "usage": getattr(resp, "usage", None)
             }
+            _observe_llm(client, model, start, "ok")
             return data
     except Exception as e:
+        _observe_llm(client, model, start, "error")
         raise e
 def probe_quota(provider="openai", api_key=None, base_url=None, model=None, timeout=15):
     if not api_key:
@@ -107,7 +310,7 @@ def probe_quota(provider="openai", api_key=None, base_url=None, model=None, time
     headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
     payload = {"model": model or "qwen-plus", "messages": [{"role": "user", "content": "ping"}], "temperature": 0}
     try:
-        r = requests.post(url, headers=headers, json=payload, timeout=timeout)
+        r = post_json(url, headers, payload, timeout=timeout, max_retries=0)
         hdr = {k.lower(): v for k, v in r.headers.items()}
         fields = {}
         for k, v in hdr.items():
@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LocalLLMServer:
+    """
+    OpenAI-compatible stand-in for /chat/completions on 127.0.0.1, for tests
+    and offline runs. reply(messages, model) produces the content (default:
+    echo of the last message). The first rate_limit_first requests get 429
+    with Retry-After/x-ratelimit-* headers, and every response carries
+    x-ratelimit-remaining-requests. Requests with "stream": true get an SSE
+    answer in chunk_size pieces, chunk_delay seconds apart. Counts requests
+    and distinct client connections, so keep-alive reuse can be checked.
+
+        with LocalLLMServer(rate_limit_first=2) as srv:
+            client = {"api_key": "x", "base_url": srv.base_url, "is_http_fallback": True}
+    """
+
+    def __init__(self, port: int = 0, reply=None, rate_limit_first: int = 0, reset: str = "200ms", latency: float = 0.0, chunk_size: int = 8, chunk_delay: float = 0.0):
+        self.reply = reply or (lambda messages, model: (messages[-1].get("content") if messages else ""))
+        self.rate_limit_first = rate_limit_first
+        self.reset = reset
+        self.latency = latency
+        self.chunk_size = max(1, chunk_size)
+        self.chunk_delay = chunk_delay
+        self.requests = 0
+        self.connections = set()
+        self.bodies = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def do_POST(self):
+                n = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(n) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                    seq = server.requests
+                    server.connections.add(self.client_address)
+                    server.bodies.append(body)
+                if server.latency:
+                    time.sleep(server.latency)
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": "not found"}})
+                    return
+                if seq <= server.rate_limit_first:
+                    self._send(
+                        429,
+                        {"error": {"message": "rate limited", "type": "rate_limit_exceeded"}},
+                        {"Retry-After": "0", "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": server.reset},
+                    )
+                    return
+                content = server.reply(body.get("messages") or [], body.get("model"))
+                if body.get("stream"):
+                    self._stream(str(content), seq, body.get("model"))
+                    return
+                prompt_tokens = sum(len(str(m.get("content") or "")) // 4 for m in body.get("messages") or [])
+                self._send(200, {
+                    "id": f"local-{seq}",
+                    "object": "chat.completion",
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(str(content)) // 4, "total_tokens": prompt_tokens + len(str(content)) // 4},
+                }, {"x-ratelimit-remaining-requests": "100", "x-ratelimit-reset-requests": "1s"})
+
+            def _stream(self, content, seq, model):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                pieces = [content[i:i + server.chunk_size] for i in range(0, len(content), server.chunk_size)]
+                try:
+                    for piece in pieces:
+                        chunk = {"id": f"local-{seq}", "object": "chat.completion.chunk", "model": model, "choices": [{"index": 0, "delta": {"content": piece}}]}
+                        self._chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                        if server.chunk_delay:
+                            time.sleep(server.chunk_delay)
+                    self._chunk("data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def _chunk(self, text):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="local-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--rate-limit-first", type=int, default=0)
+    args = ap.parse_args()
+    srv = LocalLLMServer(port=args.port, rate_limit_first=args.rate_limit_first).start()
+    print(f"serving on {srv.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.stop()
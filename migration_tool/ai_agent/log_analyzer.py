@@ -1,8 +1,17 @@
 import os
 import json
+import tempfile
 from collections import Counter, defaultdict
 from datetime import datetime
 
+from migration_tool.ai_agent.llm_cache import cache_key, get_cache
+from migration_tool.ai_agent.llm_utils import simple_chat, stream_chat
+from migration_tool.logstore.archive import default_archive_dir, iter_archived_events
+from migration_tool.logstore.sqltext import HASH_SUFFIX, get_text_store
+from migration_tool.logstore.writer import rotated_segments
+
+REPORT_PROMPT = "请根据如下统计生成一份简要迁移报告，包含关键失败原因与下一步建议：\n汇总: {summary}\n建议: {suggestions}\n"
+
 
 def _classify_error(msg: str):
     m = msg.lower()
@@ -33,38 +42,186 @@ def _read_logs(path: str):
     return items
 
 
+SAMPLES_PER_CATEGORY = 5
+
+
+def _sql_sample(e: dict, *fields):
+    """Inline SQL of the first set field, or {"sql_hash": h} for interned SQL (resolved when reporting)."""
+    for f in fields:
+        if e.get(f):
+            return e[f]
+        if e.get(f + HASH_SUFFIX):
+            return {"sql_hash": e[f + HASH_SUFFIX]}
+    return None
+
+
+def _empty_state():
+    return {
+        "inode": None,
+        "offset": 0,
+        "events": 0,
+        "convert_fail": 0,
+        "exec_fail": 0,
+        "error_counter": {},
+        "per_type_counter": {},
+        "samples": {},
+    }
+
+
+def _fold(state: dict, e: dict):
+    state["events"] += 1
+    ec = state["error_counter"]
+    pc = state["per_type_counter"]
+    samples = state["samples"]
+    if e.get("event") == "convert":
+        ws = e.get("warnings") or []
+        if e.get("error") or ws:
+            state["convert_fail"] += 1
+            if e.get("error"):
+                k = _classify_error(e["error"])
+                ec[k] = ec.get(k, 0) + 1
+                pc["转换失败"] = pc.get("转换失败", 0) + 1
+                lst = samples.setdefault(k, [])
+                if len(lst) < SAMPLES_PER_CATEGORY:
+                    lst.append(_sql_sample(e, "input_sql", "executed_sql"))
+    elif e.get("event") == "execute":
+        if e.get("error"):
+            state["exec_fail"] += 1
+            k = _classify_error(e["error"])
+            ec[k] = ec.get(k, 0) + 1
+            pc["执行失败"] = pc.get("执行失败", 0) + 1
+            lst = samples.setdefault(k, [])
+            if len(lst) < SAMPLES_PER_CATEGORY:
+                lst.append(_sql_sample(e, "executed_sql"))
+
+
+def _checkpoint_path(log_path: str):
+    return log_path + ".analysis.json"
+
+
+def _load_checkpoint(log_path: str):
+    p = _checkpoint_path(log_path)
+    if not os.path.exists(p):
+        return _empty_state()
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        base = _empty_state()
+        base.update(state)
+        return base
+    except Exception:
+        return _empty_state()
+
+
+def _save_checkpoint(log_path: str, state: dict):
+    p = _checkpoint_path(log_path)
+    tmp = None
+    try:
+        # Unique temp name: concurrent analyses of the same log must not share it
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(p) + ".", suffix=".tmp", dir=os.path.dirname(p) or ".")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, p)
+    except Exception:
+        if tmp and os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def aggregate_logs(log_path: str, incremental: bool = True):
+    """
+    Failure aggregates over the log file. With incremental=True the aggregates
+    are persisted next to the log together with the inode and byte offset
+    already processed, so each call only parses events appended since. A new
+    inode (rotation) or a file shorter than the offset (truncation) resets
+    the aggregates, so the result always equals a full rescan of the file.
+    """
+    state = _load_checkpoint(log_path) if incremental else _empty_state()
+    if not os.path.exists(log_path):
+        return _empty_state()
+    st = os.stat(log_path)
+    inode = f"{st.st_dev}:{st.st_ino}"
+    if state.get("inode") != inode or st.st_size < int(state.get("offset") or 0):
+        state = _empty_state()
+        state["inode"] = inode
+    with open(log_path, "rb") as f:
+        f.seek(int(state["offset"]))
+        data = f.read()
+    end = data.rfind(b"\n")
+    if end >= 0:
+        for line in data[: end + 1].decode("utf-8", errors="replace").splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                e = json.loads(line)
+            except Exception:
+                continue
+            if isinstance(e, dict):
+                _fold(state, e)
+        state["offset"] = int(state["offset"]) + end + 1
+        if incremental:
+            _save_checkpoint(log_path, state)
+    return state
+
+
+def _in_range(e: dict, start: str | None, end: str | None):
+    ts = e.get("timestamp")
+    if start and (not isinstance(ts, str) or ts < start):
+        return False
+    if end and (not isinstance(ts, str) or ts > end):
+        return False
+    return True
+
+
+def aggregate_range(log_path: str, start: str | None = None, end: str | None = None, include_archive: bool = False):
+    """
+    Aggregates over a time window (ISO strings). With include_archive the
+    compacted archive is read too, opening only partitions that overlap the
+    window, plus rotated segments not yet compacted.
+    """
+    state = _empty_state()
+    paths = [log_path]
+    if include_archive:
+        for e in iter_archived_events(default_archive_dir(log_path), start, end):
+            _fold(state, e)
+        paths = rotated_segments(log_path) + paths
+    for p in paths:
+        for e in _read_logs(p):
+            if _in_range(e, start, end):
+                _fold(state, e)
+    return state
+
+
 def analyze_logs(
     log_path: str = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs", "migration.log"),
     api_key: str | None = None,
     provider: str | None = None,
     model_name: str | None = None,
     base_url: str | None = None,
+    incremental: bool = True,
+    start: str | None = None,
+    end: str | None = None,
+    include_archive: bool = False,
+    use_cache: bool = True,
+    on_token=None,
+    tracker=None,
 ):
+    """
+    Failure statistics plus an LLM-written report. on_token(delta, text)
+    streams the report as it is generated; tracker (UsageTracker) accounts
+    the call under the "log_analyst" role.
+    """
     provider = (provider or "").lower() or None
-    events = _read_logs(log_path)
-    convert_fail = []
-    exec_fail = []
-    error_counter = Counter()
-    per_type_counter = defaultdict(int)
-    samples = defaultdict(list)
-
-    for e in events:
-        if e.get("event") == "convert":
-            ws = e.get("warnings") or []
-            if e.get("error") or ws:
-                convert_fail.append(e)
-                if e.get("error"):
-                    k = _classify_error(e["error"])
-                    error_counter[k] += 1
-                    per_type_counter["转换失败"] += 1
-                    samples[k].append(e.get("input_sql") or e.get("executed_sql"))
-        elif e.get("event") == "execute":
-            if e.get("error"):
-                exec_fail.append(e)
-                k = _classify_error(e["error"])
-                error_counter[k] += 1
-                per_type_counter["执行失败"] += 1
-                samples[k].append(e.get("executed_sql"))
+    if start or end or include_archive:
+        state = aggregate_range(log_path, start, end, include_archive)
+    else:
+        state = aggregate_logs(log_path, incremental=incremental)
+    error_counter = Counter(state["error_counter"])
+    per_type_counter = defaultdict(int, state["per_type_counter"])
+    samples = defaultdict(list, state["samples"])
 
     suggestions = []
     if error_counter["语法差异"]:
@@ -79,16 +236,19 @@ def analyze_logs(
         suggestions.append("当前未发现显著问题或日志不足以诊断")
 
     summary = {
-        "总事件数": len(events),
-        "转换失败数": len(convert_fail),
-        "执行失败数": len(exec_fail),
+        "总事件数": state["events"],
+        "转换失败数": state["convert_fail"],
+        "执行失败数": state["exec_fail"],
         "错误分类统计": error_counter,
         "失败类型统计": per_type_counter,
     }
 
     top_failed_sql = []
+    texts = get_text_store(log_path)
     for k, lst in samples.items():
         for s in lst[:5]:
+            if isinstance(s, dict):
+                s = texts.get(s.get("sql_hash"))
             if s:
                 top_failed_sql.append({"类别": k, "SQL": s})
 
@@ -109,14 +269,26 @@ def analyze_logs(
             llm_provider = "openai"
     if not api_key and provider in ("dashscope", "openai"):
         llm_error = "缺少密钥：请在 UI 输入或设置环境变量"
+    prompt = REPORT_PROMPT.format(
+        summary=json.dumps(summary, ensure_ascii=False), suggestions=json.dumps(suggestions, ensure_ascii=False)
+    )
+    cache = None
+    cached = None
+    report_key = None
     if api_key and (provider == "dashscope" or provider == "openai"):
+        cache = get_cache() if use_cache else None
+        if cache is not None:
+            endpoint = (base_url or "https://dashscope.aliyuncs.com/compatible-mode/v1") if provider == "dashscope" else "https://api.openai.com/v1"
+            report_model = model_name or ("qwen-plus" if provider == "dashscope" else "gpt-4o-mini")
+            report_key = cache_key(endpoint.rstrip("/"), report_model, [{"role": "user", "content": prompt}], 0.2)
+            cached = cache.get(report_key)
+            if cached is not None:
+                llm_report = cached
+                llm_provider = provider
+                llm_model = report_model
+    if api_key and (provider == "dashscope" or provider == "openai") and cached is None:
         try:
             from openai import OpenAI
-            prompt = (
-                "请根据如下统计生成一份简要迁移报告，包含关键失败原因与下一步建议：\n"
-                f"汇总: {json.dumps(summary, ensure_ascii=False)}\n"
-                f"建议: {json.dumps(suggestions, ensure_ascii=False)}\n"
-            )
             if provider == "dashscope":
                 bu = base_url or "https://dashscope.aliyuncs.com/compatible-mode/v1"
                 client = OpenAI(api_key=api_key, base_url=bu)
@@ -128,20 +300,15 @@ def analyze_logs(
                 model = model_name or "gpt-4o-mini"
                 llm_provider = "openai"
                 llm_model = model
-            resp = client.chat.completions.create(
-                model=model, messages=[{"role": "user", "content": prompt}], temperature=0.2
-            )
-            llm_report = resp.choices[0].message.content
+            messages = [{"role": "user", "content": prompt}]
+            if on_token is not None:
+                llm_report = stream_chat(client, model, messages, 0.2, on_token=on_token, use_cache=False, tracker=tracker, role="log_analyst")
+            else:
+                llm_report = simple_chat(client, model, messages, 0.2, use_cache=False, tracker=tracker, role="log_analyst")
         except Exception as e:
             llm_report = None
             llm_error = str(e)
             try:
-                import requests
-                prompt = (
-                    "请根据如下统计生成一份简要迁移报告，包含关键失败原因与下一步建议：\n"
-                    f"汇总: {json.dumps(summary, ensure_ascii=False)}\n"
-                    f"建议: {json.dumps(suggestions, ensure_ascii=False)}\n"
-                )
                 if provider == "dashscope":
                     bu = base_url or "https://dashscope.aliyuncs.com/compatible-mode/v1"
                     url = bu.rstrip("/") + "/chat/completions"
@@ -153,17 +320,17 @@ def analyze_logs(
                     model = model_name or "gpt-4o-mini"
                     llm_provider = "openai"
                     llm_model = model
-                headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-                payload = {"model": model, "messages": [{"role": "user", "content": prompt}], "temperature": 0.2}
-                r = requests.post(url, headers=headers, json=payload, timeout=20)
-                if r.status_code == 200:
-                    data = r.json()
-                    llm_report = data.get("choices", [{}])[0].get("message", {}).get("content")
-                    llm_error = None
+                http_client = {"api_key": api_key, "base_url": url[: -len("/chat/completions")], "is_http_fallback": True}
+                messages = [{"role": "user", "content": prompt}]
+                if on_token is not None:
+                    llm_report = stream_chat(http_client, model, messages, 0.2, on_token=on_token, use_cache=False, tracker=tracker, role="log_analyst")
                 else:
-                    llm_error = f"{r.status_code}: {r.text}"
+                    llm_report = simple_chat(http_client, model, messages, 0.2, use_cache=False, tracker=tracker, role="log_analyst")
+                llm_error = None
             except Exception as e2:
                 llm_error = llm_error or str(e2)
+        if llm_report and cache is not None:
+            cache.put(report_key, llm_report, llm_provider, llm_model)
 
     return {
         "summary": summary,
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import re
+
+from migration_tool.logstore.archive import default_archive_dir, iter_archived_events
+from migration_tool.logstore.sqltext import event_sql, get_text_store
+from migration_tool.logstore.writer import rotated_segments
+
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WS = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str):
+    """Comments dropped, literals replaced by ?, IN-lists collapsed, whitespace and case folded."""
+    s = _COMMENT.sub(" ", sql or "")
+    s = _STRING.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    s = _IN_LIST.sub("(?)", s)
+    s = _WS.sub(" ", s).strip().rstrip(";").strip()
+    return s.lower()
+
+
+def fingerprint(sql: str):
+    return hashlib.blake2b(normalize_sql(sql).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _iter_events(log_path: str, start: str | None, end: str | None, include_archive: bool):
+    if include_archive:
+        yield from iter_archived_events(default_archive_dir(log_path), start, end)
+    paths = (rotated_segments(log_path) if include_archive else []) + [log_path]
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    e = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(e, dict):
+                    continue
+                ts = e.get("timestamp")
+                if start and (not isinstance(ts, str) or ts < start):
+                    continue
+                if end and (not isinstance(ts, str) or ts > end):
+                    continue
+                yield e
+
+
+def _failure(e: dict, store):
+    """(oracle_sql, reason) when the event is a conversion-related failure, else None."""
+    kind = e.get("event")
+    if kind == "convert":
+        ws = e.get("warnings") or []
+        err = e.get("error")
+        if ws or err:
+            return event_sql(e, "input_sql", store), str(err) if err else "; ".join(str(w) for w in ws)
+    elif kind == "execute":
+        # Only Snowflake runs of converted SQL point at the converter; they carry the Oracle source
+        if e.get("error") and e.get("db") == "snowflake":
+            return event_sql(e, "source_sql", store), str(e["error"])
+    elif kind == "consistency":
+        # Table-mode checks (source_table/mode set) compare data the converter never produced
+        if e.get("source_table") or e.get("mode"):
+            return None
+        err = e.get("error") or {}
+        if isinstance(err, dict) and err.get("snowflake") and not err.get("oracle"):
+            return event_sql(e, "source_sql", store), str(err["snowflake"])
+        summary = e.get("summary") or {}
+        if summary.get("row_match") is False and not any(err.values() if isinstance(err, dict) else [err]):
+            return event_sql(e, "source_sql", store), "row mismatch between Oracle and Snowflake"
+    return None
+
+
+def mine_failing_sql(log_path: str, start: str | None = None, end: str | None = None, include_archive: bool = False, limit: int | None = 50, min_count: int = 1):
+    """
+    Distinct Oracle statements behind conversion warnings/errors, failed
+    Snowflake executions of converted SQL and SQL-mode consistency failures,
+    grouped by fingerprint (literals and whitespace normalised) and ranked by
+    frequency, then recency. Each item: fingerprint, oracle_sql (latest
+    occurrence), count, reasons (top 3 with counts), events, first_seen,
+    last_seen. Interned SQL is resolved through the log's text store.
+    """
+    store = get_text_store(log_path)
+    groups = {}
+    for e in _iter_events(log_path, start, end, include_archive):
+        hit = _failure(e, store)
+        if hit is None or not (hit[0] or "").strip():
+            continue
+        sql, reason = hit
+        fp = fingerprint(sql)
+        g = groups.get(fp)
+        ts = e.get("timestamp") or ""
+        if g is None:
+            g = groups[fp] = {"fingerprint": fp, "oracle_sql": sql, "count": 0, "reasons": {}, "events": {}, "first_seen": ts, "last_seen": ts}
+        g["count"] += 1
+        g["reasons"][reason] = g["reasons"].get(reason, 0) + 1
+        g["events"][e.get("event")] = g["events"].get(e.get("event"), 0) + 1
+        if ts >= g["last_seen"]:
+            g["last_seen"] = ts
+            g["oracle_sql"] = sql
+        if ts and ts < g["first_seen"]:
+            g["first_seen"] = ts
+    items = [g for g in groups.values() if g["count"] >= min_count]
+    items.sort(key=lambda g: (g["count"], g["last_seen"]), reverse=True)
+    for g in items:
+        g["reasons"] = sorted(g["reasons"].items(), key=lambda kv: kv[1], reverse=True)[:3]
+    return items[:limit] if limit else items
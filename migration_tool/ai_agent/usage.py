@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+from migration_tool.metrics import REGISTRY
+
+LLM_TOKENS = REGISTRY.counter("migration_llm_tokens_total", "LLM tokens by agent role and kind.", ("role", "kind"))
+
+ROLES = ("generator", "reviewer", "optimizer", "log_analyst")
+
+# USD per 1K tokens (prompt, completion); override or extend with MIGRATION_LLM_PRICES='{"model": [p, c]}'
+DEFAULT_PRICES = {
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "qwen-plus": (0.0004, 0.0012),
+    "qwen-turbo": (0.00005, 0.0002),
+    "qwen-max": (0.0016, 0.0064),
+}
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def prices():
+    p = dict(DEFAULT_PRICES)
+    raw = os.environ.get("MIGRATION_LLM_PRICES")
+    if raw:
+        try:
+            p.update({k: tuple(v) for k, v in json.loads(raw).items()})
+        except Exception:
+            pass
+    return p
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int):
+    table = prices()
+    rate = table.get(model)
+    if rate is None:
+        rate = next((v for k, v in table.items() if model and model.startswith(k)), None)
+    if rate is None:
+        return None
+    return prompt_tokens / 1000.0 * rate[0] + completion_tokens / 1000.0 * rate[1]
+
+
+def usage_tokens(usage):
+    """(prompt, completion) from an OpenAI usage object or dict; (None, None) when absent."""
+    if usage is None:
+        return None, None
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+
+class UsageTracker:
+    """
+    Per-run LLM accounting: calls, prompt/completion tokens, latency and
+    estimated cost by agent role. With budget_tokens / budget_cost set,
+    reserve() raises BudgetExceeded before a call that would cross the budget
+    (using an estimate of its tokens), and exhausted turns True.
+    """
+
+    def __init__(self, run_id: str | None = None, budget_tokens: int | None = None, budget_cost: float | None = None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.budget_tokens = budget_tokens or None
+        self.budget_cost = budget_cost or None
+        self.started_at = time.time()
+        self.exhausted = False
+        self.roles = {}
+        self._reserved = 0
+        self._reserved_cost = 0.0
+        self._lock = threading.Lock()
+
+    def _role(self, role):
+        r = self.roles.get(role)
+        if r is None:
+            r = {"calls": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_ms": 0, "cost": 0.0, "estimated": 0}
+            self.roles[role] = r
+        return r
+
+    def totals(self):
+        with self._lock:
+            return self._totals()
+
+    def _totals(self):
+        t = {"calls": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_ms": 0, "cost": 0.0, "estimated": 0}
+        for r in self.roles.values():
+            for k in t:
+                t[k] += r[k]
+        t["total_tokens"] = t["prompt_tokens"] + t["completion_tokens"]
+        return t
+
+    def reserve(self, est_tokens: int, model: str | None = None, completion_tokens: int = 0):
+        """
+        Claims est_tokens (of which completion_tokens are the expected answer)
+        and their estimated cost for an upcoming call; in-flight claims count
+        against both budgets until record() or release() returns the handle.
+        """
+        completion_tokens = min(max(0, completion_tokens), est_tokens)
+        est_cost = estimate_cost(model, est_tokens - completion_tokens, completion_tokens) or 0.0
+        with self._lock:
+            t = self._totals()
+            used = t["total_tokens"] + self._reserved
+            if self.budget_tokens and used + est_tokens > self.budget_tokens:
+                self.exhausted = True
+                raise BudgetExceeded(f"token budget {self.budget_tokens} would be exceeded ({used} used/reserved + ~{est_tokens})")
+            spent = t["cost"] + self._reserved_cost
+            if self.budget_cost and spent + est_cost > self.budget_cost:
+                self.exhausted = True
+                raise BudgetExceeded(f"cost budget {self.budget_cost} would be exceeded ({spent:.4f} used/reserved + ~{est_cost:.4f})")
+            self._reserved += est_tokens
+            self._reserved_cost += est_cost
+        return (est_tokens, est_cost)
+
+    def _unreserve(self, reserved):
+        tokens, cost = reserved if isinstance(reserved, tuple) else (reserved or 0, 0.0)
+        self._reserved = max(0, self._reserved - tokens)
+        self._reserved_cost = max(0.0, self._reserved_cost - cost)
+
+    def record(self, role: str, model: str, prompt_tokens, completion_tokens, latency_ms: int, cached: bool = False, reserved=0, estimated: bool = False):
+        with self._lock:
+            self._unreserve(reserved)
+            r = self._role(role or "other")
+            r["calls"] += 1
+            r["latency_ms"] += int(latency_ms or 0)
+            if cached:
+                r["cached"] += 1
+                return
+            p = int(prompt_tokens or 0)
+            c = int(completion_tokens or 0)
+            r["prompt_tokens"] += p
+            r["completion_tokens"] += c
+            r["estimated"] += int(bool(estimated))
+            r["cost"] += estimate_cost(model, p, c) or 0.0
+        LLM_TOKENS.inc(p, role=role or "other", kind="prompt")
+        LLM_TOKENS.inc(c, role=role or "other", kind="completion")
+
+    def release(self, reserved):
+        with self._lock:
+            self._unreserve(reserved)
+
+    def summary(self):
+        with self._lock:
+            roles = {k: dict(v) for k, v in self.roles.items()}
+            t = self._totals()
+        for v in roles.values():
+            v["cost"] = round(v["cost"], 6)
+        t["cost"] = round(t["cost"], 6)
+        return {
+            "run_id": self.run_id,
+            "roles": roles,
+            "total": t,
+            "budget_tokens": self.budget_tokens,
+            "budget_cost": self.budget_cost,
+            "exhausted": self.exhausted,
+            "elapsed_s": round(time.time() - self.started_at, 2),
+        }
+
+    def rows(self):
+        """Per-role table for the UI."""
+        s = self.summary()
+        out = [dict(role=k, **v) for k, v in s["roles"].items()]
+        out.append(dict(role="合计", **{k: v for k, v in s["total"].items() if k != "total_tokens"}))
+        return out
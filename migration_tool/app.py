@@ -1,7 +1,21 @@
 import os
 import json
+import time
 from datetime import datetime
 
+try:
+    from migration_tool.logstore.writer import get_writer
+    from migration_tool.logstore.sqlite_store import get_store
+    from migration_tool.logstore.sqltext import get_text_store, resolve_event
+    from migration_tool.logstore.archive import compact_rotated, default_archive_dir, iter_archived_events
+    from migration_tool.metrics import REGISTRY, consistency_result, observe_consistency, start_from_env
+except ImportError:
+    from logstore.writer import get_writer
+    from logstore.sqlite_store import get_store
+    from logstore.sqltext import get_text_store, resolve_event
+    from logstore.archive import compact_rotated, default_archive_dir, iter_archived_events
+    from metrics import REGISTRY, consistency_result, observe_consistency, start_from_env
+
 
 def _log_path():
     base = os.path.dirname(__file__)
@@ -11,25 +25,44 @@ def _log_path():
 
 
 def write_log(event: dict):
-    p = _log_path()
-    with open(p, "a", encoding="utf-8") as f:
-        f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    get_writer(_log_path()).write(event)
+
+
+def flush_logs():
+    get_writer(_log_path()).flush()
 
 
 def main():
     import streamlit as st
     try:
         from migration_tool.converter.oracle_to_snowflake import convert
+        from migration_tool.converter.rule_registry import get_registry
         from migration_tool.db.oracle_client import OracleClient
         from migration_tool.db.snowflake_client import SnowflakeClient
         from migration_tool.ai_agent.log_analyzer import analyze_logs
+        from migration_tool.consistency.compare import compare_rows
+        from migration_tool.consistency.normalize import make_normalizer
+        from migration_tool.consistency.incremental import incremental_validate
+        from migration_tool.consistency.batch import BatchRunner, start_background, get_running, load_manifest, manifest_id
+        from migration_tool.consistency.sampling import sampled_compare, sample_sql
+        from migration_tool.consistency.profile import profile_compare
+        from migration_tool.consistency.digest import compare_digests
     except ImportError:
         from converter.oracle_to_snowflake import convert
+        from converter.rule_registry import get_registry
         from db.oracle_client import OracleClient
         from db.snowflake_client import SnowflakeClient
         from ai_agent.log_analyzer import analyze_logs
+        from consistency.compare import compare_rows
+        from consistency.normalize import make_normalizer
+        from consistency.incremental import incremental_validate
+        from consistency.batch import BatchRunner, start_background, get_running, load_manifest, manifest_id
+        from consistency.sampling import sampled_compare, sample_sql
+        from consistency.profile import profile_compare
+        from consistency.digest import compare_digests
 
     st.set_page_config(page_title="Oracle → Snowflake Migration Tool", page_icon="🧭", layout="wide")
+    start_from_env()
     st.title("Oracle → Snowflake SQL 转换与测试工具(BETA)")
     st.markdown(
         """
@@ -201,10 +234,14 @@ def main():
                                     {"pattern": r"\bCONNECT\s+BY\b", "message": "CONNECT BY detected; manual rewrite to WITH RECURSIVE required"},
                                 ],
                             }
-                        os.makedirs(os.path.dirname(rules_path), exist_ok=True)
-                        with open(rules_path, "w", encoding="utf-8") as f:
-                            json.dump(data, f, ensure_ascii=False, indent=2)
-                        st.success(f"规则已保存到: {rules_path}")
+                        if os.path.abspath(rules_path) == get_registry().path:
+                            gen = get_registry().publish(data, note="保存当前规则")
+                            st.success(f"规则已发布为版本 #{gen}: {rules_path}")
+                        else:
+                            os.makedirs(os.path.dirname(rules_path), exist_ok=True)
+                            with open(rules_path, "w", encoding="utf-8") as f:
+                                json.dump(data, f, ensure_ascii=False, indent=2)
+                            st.success(f"规则已保存到: {rules_path}")
                     except Exception as e:
                         st.error(f"保存失败: {e}")
             with c3:
@@ -228,10 +265,14 @@ def main():
                                 {"pattern": r"\bCONNECT\s+BY\b", "message": "CONNECT BY detected; manual rewrite to WITH RECURSIVE required"},
                             ],
                         }
-                        os.makedirs(os.path.dirname(rules_path), exist_ok=True)
-                        with open(rules_path, "w", encoding="utf-8") as f:
-                            json.dump(sample, f, ensure_ascii=False, indent=2)
-                        st.success(f"示例规则文件已生成: {rules_path}")
+                        if os.path.abspath(rules_path) == get_registry().path:
+                            gen = get_registry().publish(sample, note="示例规则")
+                            st.success(f"示例规则已发布为版本 #{gen}: {rules_path}")
+                        else:
+                            os.makedirs(os.path.dirname(rules_path), exist_ok=True)
+                            with open(rules_path, "w", encoding="utf-8") as f:
+                                json.dump(sample, f, ensure_ascii=False, indent=2)
+                            st.success(f"示例规则文件已生成: {rules_path}")
                     except Exception as e:
                         st.error(f"生成失败: {e}")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -381,6 +422,7 @@ def main():
                 "event": "execute",
                 "db": exec_db,
                 "executed_sql": exec_sql,
+                "source_sql": (oracle_sql or "") if exec_sql_src == "转换后 Snowflake SQL" else None,
                 "elapsed_ms": ms,
                 "rows": len(data),
                 "error": err,
@@ -442,15 +484,43 @@ def main():
         trunc_ts = st.checkbox("时间比较截断到秒", value=True, key="cons_trunc_ts")
         nfkc_norm = st.checkbox("字符归一化(NFKC)", value=True, key="cons_nfkc")
         tz_offset_min = st.number_input("时区偏移(分钟，JST=540)", min_value=-720.0, max_value=840.0, value=540.0, step=1.0, key="cons_tz_offset")
+        cons_digest = False
+        if compare_mode == "按SQL对比":
+            cons_digest = st.checkbox("先比较流式摘要(无排序列/主键时)", value=True, key="cons_digest", help="两侧边读边计算与行顺序无关的摘要，摘要一致即判定结果集相同，仅在摘要不同时才拉取全量做明细对比")
         src_table = ""
         tgt_table = ""
         sel_cols = ""
         where_clause = ""
+        cons_incremental = False
+        cons_wm_col = ""
+        cons_buckets = 64
+        cons_force_full = False
+        cons_sample = False
+        cons_sample_mod = 100
+        cons_sample_res = 0
+        cons_sample_conf = 0.95
         if compare_mode == "按表对比":
             src_table = st.text_input("源表(可含schema)", "", key="cons_src_table")
             tgt_table = st.text_input("目标表(可含db.schema)", "", key="cons_tgt_table")
             sel_cols = st.text_input("列选择(逗号，默认*)", "", key="cons_sel_cols")
             where_clause = st.text_input("条件(不含WHERE，选填)", "", key="cons_where")
+            with st.expander("增量校验(分桶校验和 + 水位线)", expanded=False):
+                cons_incremental = st.checkbox("启用增量校验", value=False, key="cons_incremental", help="按主键分桶保存校验和，后续运行只重算水位线之后有变更的桶；需填写主键列")
+                cons_wm_col = st.text_input("水位线列(选填，如 LAST_UPDATED)", "", key="cons_wm_col", help="不填则每次全量重算，但仍报告与上次相比的漂移")
+                cons_buckets = st.number_input("分桶数", min_value=1, max_value=1000, value=64, step=1, key="cons_buckets")
+                cons_force_full = st.checkbox("强制全量重算", value=False, key="cons_force_full")
+            with st.expander("抽样对比(哈希对齐，快速近似)", expanded=False):
+                cons_sample = st.checkbox("启用抽样对比", value=False, key="cons_sample", disabled=cons_incremental, help="两侧按主键哈希取同一批行(约 1/N)，按主键对比并估算不一致率；需填写主键列；与增量校验互斥")
+                if cons_incremental and cons_sample:
+                    st.warning("已启用增量校验：增量校验优先，本次不使用抽样设置")
+                    cons_sample = False
+                sc_1, sc_2, sc_3 = st.columns(3)
+                with sc_1:
+                    cons_sample_mod = st.number_input("N(取 1/N)", min_value=1, max_value=100000, value=100, step=1, key="cons_sample_mod")
+                with sc_2:
+                    cons_sample_res = st.number_input("余数 k", min_value=0, max_value=99999, value=0, step=1, key="cons_sample_res")
+                with sc_3:
+                    cons_sample_conf = st.selectbox("置信度", [0.9, 0.95, 0.99], index=1, key="cons_sample_conf")
         if oracle_sql:
             if compare_mode == "按SQL对比":
                 preview_sql, _ = convert(oracle_sql or "")
@@ -464,10 +534,15 @@ def main():
                 if tgt_full and "." not in tgt_full and (s_database and s_schema):
                     tgt_full = f"{s_database}.{s_schema}.{tgt_full}"
                 tgt_preview = f"SELECT {scols} FROM {tgt_full}" + (f" WHERE {w}" if w else "")
+                if cons_sample and pk_cols.strip():
+                    keys = [c.strip() for c in pk_cols.split(",") if c.strip()]
+                    src_preview = sample_sql("oracle", src_table, keys, cons_sample_mod, cons_sample_res, scols, w)
+                    tgt_preview = sample_sql("snowflake", tgt_full, keys, cons_sample_mod, cons_sample_res, scols, w)
                 st.caption("预览：源/目标对比 SQL")
                 st.code(src_preview or "", language="sql")
                 st.code(tgt_preview or "", language="sql")
         if st.button("开始一致性测试", key="btn_consistency"):
+            run_start = time.perf_counter()
             o_client = OracleClient({
                 "host": o_host,
                 "port": o_port,
@@ -501,169 +576,99 @@ def main():
                 tgt_sql = f"SELECT {scols} FROM {tgt_full}" + (f" WHERE {w}" if w else "")
                 src_tbl_meta = src_table
                 tgt_tbl_meta = tgt_full
-            o_data, o_ms, o_err = o_client.execute(src_sql)
-            s_data, s_ms, s_err = s_client.execute(tgt_sql)
-            def _normalize(v):
-                import unicodedata as _ud
-                from datetime import datetime as _dt, date as _date, timedelta as _td
-                if v is None:
-                    return None
-                if isinstance(v, (int, float)):
-                    x = float(v)
-                    t = None
-                    if x >= 1e11:
-                        t = _dt.utcfromtimestamp(x / 1000.0)
-                    elif x >= 1e9:
-                        t = _dt.utcfromtimestamp(x)
-                    if t is not None:
-                        d = t.replace(microsecond=0) if trunc_ts else t
-                        try:
-                            off = int(tz_offset_min)
-                            d = d + _td(minutes=off) if off != 0 else d
-                        except Exception:
-                            pass
-                        return d
-                    return x
-                if isinstance(v, _dt):
-                    d = v.replace(microsecond=0) if trunc_ts else v
-                    try:
-                        off = int(tz_offset_min)
-                        d = d + _td(minutes=off) if off != 0 else d
-                    except Exception:
-                        pass
-                    return d
-                if isinstance(v, _date):
-                    t = _dt(v.year, v.month, v.day)
-                    d = t.replace(microsecond=0) if trunc_ts else t
-                    try:
-                        off = int(tz_offset_min)
-                        d = d + _td(minutes=off) if off != 0 else d
-                    except Exception:
-                        pass
-                    return d
-                if isinstance(v, str):
-                    s0 = v.strip()
-                    t = None
-                    try:
-                        t = _dt.fromisoformat(s0)
-                    except Exception:
-                        t = None
-                    if t is None:
-                        try:
-                            t = _dt.strptime(s0, "%Y-%m-%d")
-                        except Exception:
-                            t = None
-                    if t is not None:
-                        d = t.replace(microsecond=0) if trunc_ts else t
-                        try:
-                            off = int(tz_offset_min)
-                            d = d + _td(minutes=off) if off != 0 else d
-                        except Exception:
-                            pass
-                        return d
-                    s = _ud.normalize("NFKC", v) if nfkc_norm else v
-                    return s.lower() if ignore_case else s
-                try:
-                    return float(v)
-                except Exception:
-                    s = str(v)
-                    s = _ud.normalize("NFKC", s) if nfkc_norm else s
-                    return s.lower() if ignore_case else s
-            def _sort_rows(rows, cols):
-                cs = [c.strip() for c in (cols or "").split(",") if c.strip()]
-                if not cs or not rows:
-                    return rows
-                def kf(r):
-                    return tuple(_normalize(r.get(c)) for c in cs)
-                try:
-                    return sorted(rows, key=kf)
-                except Exception:
-                    return rows
-            def _keyed_map(rows, cols):
-                cs = [c.strip() for c in (cols or "").split(",") if c.strip()]
-                if not cs or not rows:
-                    return {}
-                m = {}
-                for r in rows:
-                    k = tuple(_normalize(r.get(c)) for c in cs)
-                    m[k] = {kk.lower(): _normalize(vv) for kk, vv in r.items()}
-                return m
-            report = {
-                "source_rows": len(o_data),
-                "target_rows": len(s_data),
-                "source_error": o_err,
-                "target_error": s_err,
-                "row_match": None,
-                "columns_match": None,
-                "source_columns": [],
-                "target_columns": [],
-                "column_diff": {"missing_in_target": [], "missing_in_source": []},
-                "missing_keys_in_target": [],
-                "missing_keys_in_source": [],
-                "samples_mismatch": [],
-                "elapsed_ms": {"oracle": o_ms, "snowflake": s_ms},
-            }
-            if not o_err and not s_err:
-                o_cols = list(o_data[0].keys()) if o_data else []
-                s_cols = list(s_data[0].keys()) if s_data else []
-                report["source_columns"] = o_cols
-                report["target_columns"] = s_cols
-                o_set = {c.lower() for c in o_cols}
-                s_set = {c.lower() for c in s_cols}
-                report["columns_match"] = o_set == s_set
-                report["column_diff"]["missing_in_target"] = sorted(list(o_set - s_set))
-                report["column_diff"]["missing_in_source"] = sorted(list(s_set - o_set))
-                if pk_cols.strip():
-                    om = _keyed_map(o_data, pk_cols)
-                    sm = _keyed_map(s_data, pk_cols)
-                    ko = set(om.keys())
-                    ks = set(sm.keys())
-                    report["missing_keys_in_target"] = sorted(list(ko - ks))
-                    report["missing_keys_in_source"] = sorted(list(ks - ko))
-                    report["row_match"] = len(report["missing_keys_in_target"]) == 0 and len(report["missing_keys_in_source"]) == 0 and len(ko) == len(ks)
-                    inter = sorted(list(ko & ks))[:50]
-                    for i, k in enumerate(inter):
-                        so = om.get(k) or {}
-                        stg = sm.get(k) or {}
-                        all_keys = sorted(set(so.keys()) | set(stg.keys()))
-                        mismatch = False
-                        for kk in all_keys:
-                            a = so.get(kk)
-                            b = stg.get(kk)
-                            if isinstance(a, float) and isinstance(b, float) and num_tol > 0:
-                                if abs(a - b) > num_tol:
-                                    mismatch = True
-                                    break
-                            else:
-                                if a != b:
-                                    mismatch = True
-                                    break
-                        if mismatch:
-                            report["samples_mismatch"].append({"index": i, "key": k, "source": so, "target": stg})
+            _normalize = make_normalizer(ignore_case=ignore_case, trunc_ts=trunc_ts, nfkc_norm=nfkc_norm, tz_offset_min=tz_offset_min)
+            inc_report = None
+            sample_report = None
+            digest_report = None
+            if compare_mode == "按表对比" and cons_sample and not pk_cols.strip():
+                st.warning("抽样对比需要主键列，已改为全量对比")
+            if compare_mode == "按表对比" and cons_sample and pk_cols.strip() and not cons_incremental:
+                sample_report = sampled_compare(
+                    o_client,
+                    s_client,
+                    src_table,
+                    tgt_full,
+                    pk_cols,
+                    _normalize,
+                    modulus=int(cons_sample_mod),
+                    residue=int(cons_sample_res),
+                    columns=sel_cols,
+                    where=where_clause,
+                    num_tol=num_tol,
+                    confidence=float(cons_sample_conf),
+                )
+                o_err = sample_report["source_error"]
+                s_err = sample_report["target_error"]
+                src_sql = sample_report["source_sql"]
+                tgt_sql = sample_report["target_sql"]
+                report = dict(sample_report)
+                report.setdefault("column_diff", {"missing_in_target": [], "missing_in_source": []})
+                report.setdefault("samples_mismatch", [])
+            elif compare_mode == "按表对比" and cons_incremental:
+                inc_report = incremental_validate(
+                    o_client,
+                    s_client,
+                    src_table,
+                    tgt_full,
+                    pk_cols,
+                    _normalize,
+                    watermark_col=cons_wm_col,
+                    buckets=int(cons_buckets),
+                    columns=sel_cols,
+                    where=where_clause,
+                    num_tol=num_tol,
+                    force_full=cons_force_full,
+                )
+                o_err = inc_report["error"]["oracle"]
+                s_err = inc_report["error"]["snowflake"]
+                report = dict(inc_report)
+                report["source_error"] = o_err
+                report["target_error"] = s_err
+            else:
+                digest_report = None
+                if compare_mode == "按SQL对比" and cons_digest and not sort_cols.strip() and not pk_cols.strip():
+                    digest_report = compare_digests(o_client, s_client, src_sql, tgt_sql, _normalize)
+                if digest_report is not None and digest_report["match"]:
+                    o_err = None
+                    s_err = None
+                    o_set = {c.lower() for c in digest_report["source_columns"]}
+                    s_set = {c.lower() for c in digest_report["target_columns"]}
+                    report = {
+                        "source_rows": digest_report["source"]["count"],
+                        "target_rows": digest_report["target"]["count"],
+                        "source_error": None,
+                        "target_error": None,
+                        "row_match": True,
+                        "columns_match": o_set == s_set,
+                        "source_columns": digest_report["source_columns"],
+                        "target_columns": digest_report["target_columns"],
+                        "column_diff": {"missing_in_target": sorted(list(o_set - s_set)), "missing_in_source": sorted(list(s_set - o_set))},
+                        "missing_keys_in_target": [],
+                        "missing_keys_in_source": [],
+                        "samples_mismatch": [],
+                        "elapsed_ms": digest_report["elapsed_ms"],
+                    }
                 else:
-                    od = _sort_rows(o_data, sort_cols)
-                    sd = _sort_rows(s_data, sort_cols)
-                    report["row_match"] = len(od) == len(sd)
-                    n = min(20, len(od), len(sd))
-                    for i in range(n):
-                        so = {k.lower(): _normalize(v) for k, v in od[i].items()}
-                        stg = {k.lower(): _normalize(v) for k, v in sd[i].items()}
-                        all_keys = sorted(set(so.keys()) | set(stg.keys()))
-                        mismatch = False
-                        for k in all_keys:
-                            a = so.get(k)
-                            b = stg.get(k)
-                            if isinstance(a, float) and isinstance(b, float) and num_tol > 0:
-                                if abs(a - b) > num_tol:
-                                    mismatch = True
-                                    break
-                            else:
-                                if a != b:
-                                    mismatch = True
-                                    break
-                        if mismatch:
-                            report["samples_mismatch"].append({"index": i, "source": so, "target": stg})
-            write_log({
+                    o_data, o_ms, o_err = o_client.execute(src_sql)
+                    s_data, s_ms, s_err = s_client.execute(tgt_sql)
+                    report = {
+                        "source_rows": len(o_data),
+                        "target_rows": len(s_data),
+                        "source_error": o_err,
+                        "target_error": s_err,
+                        "row_match": None,
+                        "columns_match": None,
+                        "source_columns": [],
+                        "target_columns": [],
+                        "column_diff": {"missing_in_target": [], "missing_in_source": []},
+                        "missing_keys_in_target": [],
+                        "missing_keys_in_source": [],
+                        "samples_mismatch": [],
+                        "elapsed_ms": {"oracle": o_ms, "snowflake": s_ms},
+                    }
+                    if not o_err and not s_err:
+                        report.update(compare_rows(o_data, s_data, _normalize, pk_cols=pk_cols, sort_cols=sort_cols, num_tol=num_tol))
+            cons_event = {
                 "timestamp": datetime.utcnow().isoformat(),
                 "event": "consistency",
                 "source_sql": src_sql,
@@ -677,7 +682,27 @@ def main():
                     "target_rows": report["target_rows"],
                 },
                 "error": {"oracle": o_err, "snowflake": s_err},
-            })
+            }
+            if inc_report is not None:
+                cons_event["incremental"] = {
+                    "mode": inc_report["mode"],
+                    "buckets_total": inc_report["buckets_total"],
+                    "buckets_rechecked": inc_report["buckets_rechecked"],
+                    "rows_fetched": inc_report["rows_fetched"],
+                    "mismatched_buckets": inc_report["mismatched_buckets"],
+                    "drift_buckets": {db: len(v) for db, v in inc_report["drift"].items()},
+                }
+            if compare_mode == "按SQL对比" and digest_report is not None:
+                cons_event["digest"] = {"match": digest_report["match"], "source": digest_report["source"], "target": digest_report["target"]}
+            if sample_report is not None:
+                cons_event["sample"] = {k: v for k, v in sample_report["sample"].items() if k != "elapsed_ms"}
+            write_log(cons_event)
+            run_mode = "sample" if sample_report is not None else "incremental" if inc_report is not None else "digest" if digest_report is not None and digest_report["match"] else "full"
+            observe_consistency(
+                run_mode,
+                time.perf_counter() - run_start,
+                consistency_result(report["row_match"], len(report.get("samples_mismatch") or []), bool(o_err or s_err)),
+            )
             if o_err or s_err:
                 if o_err:
                     st.error(f"源库执行失败：{o_err}")
@@ -708,6 +733,39 @@ def main():
                     "列差异": report["column_diff"],
                     "耗时ms": report["elapsed_ms"],
                 })
+            if digest_report is not None:
+                if digest_report["match"]:
+                    st.success(f"流式摘要一致：{digest_report['source']['count']} 行，未拉取结果集做明细对比")
+                else:
+                    st.info("流式摘要不一致，已回退到全量明细对比")
+            if sample_report is not None and "sampled_keys" in sample_report["sample"]:
+                smp = sample_report["sample"]
+                st.markdown("#### 🎯 抽样估计")
+                e1, e2, e3 = st.columns(3)
+                with e1:
+                    st.metric("抽样主键数", smp["sampled_keys"], delta=f"1/{smp['modulus']}", delta_color="off")
+                with e2:
+                    st.metric("不一致率", f"{smp['mismatch_rate']:.4%}")
+                with e3:
+                    st.metric(f"{int(smp['confidence'] * 100)}% 置信区间", f"{smp['rate_low']:.4%} ~ {smp['rate_high']:.4%}")
+                st.caption(f"按抽样外推：全表约 {smp['estimated_total_keys']} 个主键，其中约 {smp['estimated_mismatched_keys']} 个不一致")
+            if inc_report is not None:
+                st.markdown("#### 🔁 增量校验")
+                i1, i2, i3 = st.columns(3)
+                with i1:
+                    st.metric("模式", "增量" if inc_report["mode"] == "incremental" else "全量")
+                with i2:
+                    st.metric("重算桶数", f"{inc_report['buckets_rechecked']}/{inc_report['buckets_total']}")
+                with i3:
+                    st.metric("不一致桶数", len(inc_report["mismatched_buckets"]))
+                with st.expander("与上次运行相比的漂移", expanded=bool(inc_report["drift"]["oracle"] or inc_report["drift"]["snowflake"])):
+                    st.json({
+                        "水位线": inc_report["watermark"],
+                        "拉取行数": inc_report["rows_fetched"],
+                        "源库漂移桶": inc_report["drift"]["oracle"],
+                        "目标库漂移桶": inc_report["drift"]["snowflake"],
+                        "不一致桶": inc_report["mismatched_buckets"],
+                    })
             if report["samples_mismatch"]:
                 st.write("样例不一致行")
                 st.dataframe(report["samples_mismatch"])
@@ -727,27 +785,178 @@ def main():
                     csv = "\n".join([",".join(row) for row in rows])
                     st.download_button("下载不一致样例 CSV", csv, file_name="cons_mismatch.csv", mime="text/csv", key="dl_cons_csv")
 
+        if compare_mode == "按表对比" and st.button("列画像对比(仅聚合查询)", key="btn_profile", help="每侧一条聚合 SQL：行数、空值数、最小/最大、近似去重数、数值 sum/avg、字符串最大长度"):
+            o_client = OracleClient({
+                "host": o_host,
+                "port": o_port,
+                "service_name": o_service,
+                "sid": o_sid,
+                "connect_string": o_ez,
+                "user": o_user,
+                "password": o_password,
+            })
+            s_client = SnowflakeClient({
+                "account": s_account,
+                "user": s_user,
+                "password": s_password,
+                "warehouse": s_warehouse,
+                "database": s_database,
+                "schema": s_schema,
+                "role": s_role,
+            })
+            tgt_full = tgt_table.strip()
+            if tgt_full and "." not in tgt_full and (s_database and s_schema):
+                tgt_full = f"{s_database}.{s_schema}.{tgt_full}"
+            _normalize = make_normalizer(ignore_case=ignore_case, trunc_ts=trunc_ts, nfkc_norm=nfkc_norm, tz_offset_min=tz_offset_min)
+            prof = profile_compare(o_client, s_client, src_table.strip(), tgt_full, _normalize, where=where_clause, num_tol=num_tol)
+            observe_consistency("profile", prof["elapsed_ms"] / 1000.0, consistency_result(prof["match"], error=bool(prof["source_error"] or prof["target_error"])))
+            write_log({
+                "timestamp": datetime.utcnow().isoformat(),
+                "event": "consistency",
+                "mode": "profile",
+                "source_sql": prof["sql"]["oracle"],
+                "target_sql": prof["sql"]["snowflake"],
+                "source_table": src_table,
+                "target_table": tgt_full,
+                "summary": {
+                    "match": prof["match"],
+                    "source_rows": prof["row_count"]["oracle"],
+                    "target_rows": prof["row_count"]["snowflake"],
+                    "mismatched_columns": prof["mismatched_columns"],
+                },
+                "elapsed_ms": prof["elapsed_ms"],
+                "error": {"oracle": prof["source_error"], "snowflake": prof["target_error"]},
+            })
+            if prof["source_error"]:
+                st.error(f"源库画像失败：{prof['source_error']}")
+            if prof["target_error"]:
+                st.error(f"目标库画像失败：{prof['target_error']}")
+            if prof["match"] is not None:
+                p1, p2, p3 = st.columns(3)
+                with p1:
+                    st.metric("源库行数", prof["row_count"]["oracle"])
+                with p2:
+                    st.metric("目标库行数", prof["row_count"]["snowflake"], delta=(prof["row_count"]["snowflake"] or 0) - (prof["row_count"]["oracle"] or 0))
+                with p3:
+                    st.metric("差异列数", len(prof["mismatched_columns"]), delta="✅" if prof["match"] else "❌", delta_color="off")
+                if prof["missing_in_target"] or prof["missing_in_source"]:
+                    st.warning(f"列缺失 — 目标缺少: {prof['missing_in_target']}；源缺少: {prof['missing_in_source']}")
+                st.dataframe([
+                    {
+                        "列": c["column"],
+                        "类型(源/目标)": f"{c['source_type']} / {c['target_type']}",
+                        "差异项": ", ".join(c["diffs"]),
+                        "源": json.dumps(c["source"], ensure_ascii=False, default=str),
+                        "目标": json.dumps(c["target"], ensure_ascii=False, default=str),
+                    }
+                    for c in prof["columns"]
+                ])
+                st.download_button("下载画像对比 JSON", json.dumps(prof, ensure_ascii=False, indent=2, default=str), file_name="cons_profile.json", mime="application/json", key="dl_profile_json")
+
+        with st.expander("📦 批量校验(清单驱动，可断点续跑)", expanded=False):
+            st.caption('清单格式: {"defaults": {"tz_offset_min": 540}, "jobs": [{"source_table": "HR.EMP", "target_table": "DB.HR.EMP", "pk_cols": "ID"}]}，也可填写 JSON 文件路径')
+            batch_manifest = st.text_area("批量清单(JSON 或文件路径)", "", height=140, key="batch_manifest")
+            bc1, bc2 = st.columns(2)
+            with bc1:
+                batch_max_o = st.number_input("Oracle 最大并发查询", min_value=1, max_value=64, value=4, step=1, key="batch_max_oracle")
+            with bc2:
+                batch_max_s = st.number_input("Snowflake 最大并发查询", min_value=1, max_value=64, value=4, step=1, key="batch_max_snowflake")
+
+            def _batch_client(db):
+                if db == "oracle":
+                    return OracleClient({
+                        "host": o_host,
+                        "port": o_port,
+                        "service_name": o_service,
+                        "sid": o_sid,
+                        "connect_string": o_ez,
+                        "user": o_user,
+                        "password": o_password,
+                    })
+                return SnowflakeClient({
+                    "account": s_account,
+                    "user": s_user,
+                    "password": s_password,
+                    "warehouse": s_warehouse,
+                    "database": s_database,
+                    "schema": s_schema,
+                    "role": s_role,
+                })
+
+            runner = None
+            if batch_manifest.strip():
+                try:
+                    mf = load_manifest(batch_manifest)
+                    runner = get_running(manifest_id(mf)) or BatchRunner(mf, _batch_client, max_oracle=batch_max_o, max_snowflake=batch_max_s)
+                except Exception as e:
+                    st.error(f"清单解析失败: {e}")
+            bb1, bb2, bb3 = st.columns(3)
+            with bb1:
+                if st.button("开始/继续批量校验", key="btn_batch_start") and runner is not None:
+                    runner = start_background(runner)
+                    write_log({
+                        "timestamp": datetime.utcnow().isoformat(),
+                        "event": "consistency_batch",
+                        "run_id": runner.run_id,
+                        "jobs": len(runner.manifest["jobs"]),
+                        "error": None,
+                    })
+                    st.success(f"批量任务已在后台运行 (run_id={runner.run_id})")
+            with bb2:
+                if st.button("停止", key="btn_batch_stop") and runner is not None:
+                    runner.stop_event.set()
+                    st.info("已请求停止，正在运行的表完成后退出")
+            with bb3:
+                st.button("刷新进度", key="btn_batch_refresh")
+            if runner is not None:
+                bst = runner.status()
+                st.progress(bst["finished"] / bst["total"] if bst["total"] else 0.0, text=f"{bst['finished']}/{bst['total']} 已完成 · 失败 {bst['failed']} · 不一致 {bst['mismatched']}" + (" · 运行中" if bst["running"] else ""))
+                if bst.get("last_error"):
+                    st.error(f"批量任务异常终止: {bst['last_error']}")
+                done = list(runner.finished().values())
+                if done:
+                    st.dataframe([
+                        {k: r.get(k) for k in ["id", "status", "row_match", "columns_match", "source_rows", "target_rows", "elapsed_ms", "finished_at"]}
+                        for r in done
+                    ])
+                    st.download_button("下载批量结果 JSON", json.dumps(done, ensure_ascii=False, indent=2, default=str), file_name=f"batch_{runner.run_id}.json", mime="application/json", key="dl_batch_json")
+
+    from migration_tool.ai_agent.usage import UsageTracker
+
+    def _finish_usage(tracker, context):
+        """Shows a run's LLM usage, logs it and adds it to the session totals."""
+        summary = tracker.summary()
+        if not summary["roles"]:
+            return
+        st.caption(f"LLM 用量（运行 {summary['run_id']}）：{summary['total']['total_tokens']} tokens，估算成本 ${summary['total']['cost']:.4f}" + ("，已达预算上限" if summary["exhausted"] else ""))
+        st.dataframe(tracker.rows())
+        st.session_state.setdefault("llm_usage_runs", []).append(dict(summary, context=context))
+        write_log({"timestamp": datetime.utcnow().isoformat(), "event": "llm_usage", "context": context, **summary})
+
     st.subheader("📜 日志与分析")
-    t_logs_view, t_logs_ai = st.tabs(["查看与筛选", "AI 分析与图表"])
+    t_logs_view, t_logs_ai, t_metrics = st.tabs(["查看与筛选", "AI 分析与图表", "运行指标"])
+    with t_metrics:
+        st.caption("Prometheus 文本格式；设置 MIGRATION_METRICS_PORT 可在本地端口暴露 /metrics，MIGRATION_METRICS_FILE 可定期写入文件")
+        m_path = st.text_input("导出文件路径", os.path.join(os.path.dirname(_log_path()), "metrics.prom"), key="metrics_file_path")
+        if st.button("导出指标到文件", key="btn_metrics_export"):
+            try:
+                REGISTRY.write_textfile(m_path.strip())
+                st.success(f"已写入 {m_path.strip()}")
+            except Exception as e:
+                st.error(f"导出失败: {e}")
+        st.code(REGISTRY.render(), language="text")
     with t_logs_view:
         c_lv1, c_lv2 = st.columns([1,1])
         with c_lv1:
             if st.button("查看日志", key="btn_view_logs"):
                 try:
-                    p = _log_path()
-                    items = []
-                    if os.path.exists(p):
-                        with open(p, "r", encoding="utf-8") as f:
-                            for line in f:
-                                line = line.strip()
-                                if not line:
-                                    continue
-                                try:
-                                    items.append(json.loads(line))
-                                except Exception:
-                                    pass
+                    flush_logs()
+                    store = get_store(_log_path())
+                    store.sync(_log_path())
+                    texts = get_text_store(_log_path())
+                    items = [resolve_event(e, texts) for e in store.query(limit=100, newest_first=True)[::-1]]
                     if items:
-                        st.dataframe(items[-100:])
+                        st.dataframe(items)
                     else:
                         st.info("暂无日志")
                 except Exception as e:
@@ -757,97 +966,98 @@ def main():
                 write_log({"timestamp": datetime.utcnow().isoformat(), "event": "convert", "input_sql": "SELECT * FROM t CONNECT BY PRIOR id=pid", "converted_sql": "", "warnings": ["CONNECT BY detected; manual rewrite to WITH RECURSIVE required"], "error": None})
                 write_log({"timestamp": datetime.utcnow().isoformat(), "event": "execute", "db": "oracle", "executed_sql": "SELECT bad_col FROM dual", "elapsed_ms": 12, "rows": 0, "error": "ORA-00904: invalid identifier"})
                 st.success("已写入示例日志")
+            imp_path = st.text_input("导入历史 JSONL 日志(文件路径)", "", key="log_import_path", help="将旧的/轮转后的 JSONL 日志导入索引库，重复导入同一文件只追加新增部分")
+            if st.button("导入到日志索引", key="btn_import_logs"):
+                try:
+                    n = get_store(_log_path()).import_jsonl(imp_path.strip(), get_text_store(_log_path()))
+                    st.success(f"已导入 {n} 条事件")
+                except Exception as e:
+                    st.error(f"导入失败: {e}")
+            if st.button("压缩归档轮转日志", key="btn_compact_logs", help="将超过 24 小时的轮转日志按日期分区压缩到 logs/archive，并删除原始文件"):
+                try:
+                    flush_logs()
+                    store = get_store(_log_path())
+                    store.sync(_log_path())
+                    done = compact_rotated(_log_path())
+                    if done:
+                        st.success(f"已归档 {len(done)} 个轮转文件，共 {sum(d['rows'] for d in done)} 条事件")
+                        st.dataframe(done)
+                    else:
+                        st.info("没有需要归档的轮转日志")
+                except Exception as e:
+                    st.error(f"归档失败: {e}")
         with c_lv2:
             selected_events = st.multiselect("事件类型", ["convert", "execute", "test_connection", "consistency"], default=["convert", "execute"], key="log_events")
             keyword = st.text_input("关键字过滤", "", key="log_keyword", help="按 SQL/错误信息包含关键字过滤")
             start_iso = st.text_input("起始时间(ISO，可选)", "", key="log_start_iso", help="例如 2025-12-15T00:00:00")
             end_iso = st.text_input("结束时间(ISO，可选)", "", key="log_end_iso", help="例如 2025-12-15T23:59:59")
+            pg1, pg2 = st.columns(2)
+            with pg1:
+                page_size = st.selectbox("每页条数", [50, 200, 1000], index=1, key="log_page_size")
+            with pg2:
+                page_no = st.number_input("页码", min_value=1, value=1, step=1, key="log_page_no")
+            include_archive = st.checkbox("同时检索归档日志(需设置时间范围)", value=False, key="log_include_archive", help="只读取与时间范围重叠的日期分区")
             if st.button("筛选日志", key="btn_filter_logs"):
                 try:
-                    p = _log_path()
-                    items = []
-                    if os.path.exists(p):
-                        with open(p, "r", encoding="utf-8") as f:
-                            for line in f:
-                                line = line.strip()
-                                if not line:
-                                    continue
-                                try:
-                                    items.append(json.loads(line))
-                                except Exception:
-                                    pass
-                    if items:
-                        fs = []
+                    from datetime import datetime as _dt
+                    flush_logs()
+                    store = get_store(_log_path())
+                    store.sync(_log_path())
+                    sdt = None
+                    edt = None
+                    if start_iso.strip():
+                        try:
+                            sdt = _dt.fromisoformat(start_iso.strip()).isoformat()
+                        except Exception:
+                            st.warning("起始时间解析失败，忽略时间筛选")
+                            sdt = None
+                    if end_iso.strip():
+                        try:
+                            edt = _dt.fromisoformat(end_iso.strip()).isoformat()
+                        except Exception:
+                            st.warning("结束时间解析失败，忽略时间筛选")
+                            edt = None
+                    total = store.count(events=selected_events, keyword=keyword, start=sdt, end=edt)
+                    texts = get_text_store(_log_path())
+                    fs = store.query(events=selected_events, keyword=keyword, start=sdt, end=edt, limit=page_size, offset=(int(page_no) - 1) * page_size)
+                    fs = [resolve_event(e, texts) for e in fs]
+                    if fs:
+                        pages = (total + page_size - 1) // page_size
+                        st.caption(f"共 {total} 条匹配，第 {int(page_no)}/{pages} 页（按时间倒序）")
+                        st.dataframe(fs)
+                        st.download_button("下载本页日志 JSON", json.dumps(fs, ensure_ascii=False, indent=2), file_name="filtered_logs.json", mime="application/json", key="dl_logs_json")
+                    elif total:
+                        st.info(f"共 {total} 条匹配，当前页码超出范围")
+                    else:
+                        st.info("无匹配日志")
+                    if include_archive and (sdt or edt):
                         kw = keyword.strip().lower()
-                        from datetime import datetime as _dt
-                        sdt = None
-                        edt = None
-                        if start_iso.strip():
-                            try:
-                                sdt = _dt.fromisoformat(start_iso.strip())
-                            except Exception:
-                                st.warning("起始时间解析失败，忽略时间筛选")
-                                sdt = None
-                        if end_iso.strip():
-                            try:
-                                edt = _dt.fromisoformat(end_iso.strip())
-                            except Exception:
-                                st.warning("结束时间解析失败，忽略时间筛选")
-                                edt = None
-                        for it in items:
-                            if selected_events and it.get("event") not in selected_events:
+                        archived = []
+                        for it in iter_archived_events(default_archive_dir(_log_path()), sdt, edt, selected_events):
+                            # Segments synced before compaction are already shown from the store above
+                            if store.contains(it):
                                 continue
-                            if kw:
-                                blob = json.dumps(it, ensure_ascii=False).lower()
-                                if kw not in blob:
-                                    continue
-                            if sdt or edt:
-                                ts = it.get("timestamp")
-                                ok = True
-                                try:
-                                    tdt = _dt.fromisoformat(ts) if isinstance(ts, str) else None
-                                except Exception:
-                                    tdt = None
-                                if sdt and tdt and tdt < sdt:
-                                    ok = False
-                                if edt and tdt and tdt > edt:
-                                    ok = False
-                                if sdt and not tdt:
-                                    ok = False
-                                if not ok:
-                                    continue
-                            fs.append(it)
-                        if fs:
-                            st.dataframe(fs[-200:])
-                            st.download_button("下载筛选日志 JSON", json.dumps(fs, ensure_ascii=False, indent=2), file_name="filtered_logs.json", mime="application/json", key="dl_logs_json")
+                            it = resolve_event(it, texts)
+                            if kw and kw not in json.dumps(it, ensure_ascii=False).lower():
+                                continue
+                            archived.append(it)
+                            if len(archived) >= page_size:
+                                break
+                        st.caption(f"仅存在于归档中的匹配日志（最多 {page_size} 条）")
+                        if archived:
+                            st.dataframe(archived)
                         else:
-                            st.info("无匹配日志")
-                    else:
-                        st.info("暂无日志")
+                            st.info("归档中无匹配日志")
+                    elif include_archive:
+                        st.warning("检索归档日志需要设置起始或结束时间")
                 except Exception as e:
                     st.error(str(e))
             if st.button("生成错误分类图表", key="btn_chart_logs"):
                 try:
-                    from collections import Counter
-                    p = _log_path()
-                    items = []
-                    if os.path.exists(p):
-                        with open(p, "r", encoding="utf-8") as f:
-                            for line in f:
-                                line = line.strip()
-                                if not line:
-                                    continue
-                                try:
-                                    items.append(json.loads(line))
-                                except Exception:
-                                    pass
-                    errs = []
-                    for it in items:
-                        if it.get("event") == "execute" and it.get("error"):
-                            errs.append("执行失败")
-                        if it.get("event") == "convert" and (it.get("error") or it.get("warnings")):
-                            errs.append("转换失败")
-                    cnt = Counter(errs)
+                    flush_logs()
+                    store = get_store(_log_path())
+                    store.sync(_log_path())
+                    cnt = store.failure_counts()
                     chart_data = {"类型": list(cnt.keys()), "数量": list(cnt.values())}
                     try:
                         import pandas as pd  # type: ignore
@@ -867,6 +1077,17 @@ def main():
         use_env = st.checkbox("使用环境变量", value=True)
         api_key_input = st.text_input("LLM API Key", "", type="password", key="llm_api_key")
         model_name = st.text_input("LLM 模型", "qwen-plus" if provider_key == "dashscope" else "gpt-4o-mini", key="llm_model")
+        secondary = None
+        hedge_percentile = None
+        with st.expander("🔀 备用提供方 (对冲请求 / 故障转移)", expanded=False):
+            st.caption("主提供方超过其近期延迟分位数仍未返回时，向备用提供方发送同一请求，取先返回的有效答案并取消另一路；主提供方报错或额度耗尽时立即切换。未启用时读取 MIGRATION_LLM_SECONDARY_* 环境变量。")
+            if st.checkbox("启用备用提供方", value=False, key="llm_secondary_on"):
+                sec_provider = st.selectbox("备用提供方", ["OpenAI", "DashScope"], index=0, key="llm_secondary_provider").lower()
+                sec_base_url = st.text_input("备用 Base URL (留空用默认)", "", key="llm_secondary_base_url")
+                sec_key = st.text_input("备用 API Key (留空读环境变量)", "", type="password", key="llm_secondary_api_key")
+                sec_model = st.text_input("备用模型", "gpt-4o-mini" if sec_provider == "openai" else "qwen-plus", key="llm_secondary_model")
+                hedge_percentile = st.slider("对冲延迟分位数 (p)", min_value=50, max_value=99, value=95, key="llm_hedge_percentile")
+                secondary = {"provider": sec_provider, "api_key": sec_key or None, "base_url": sec_base_url.strip() or None, "model": sec_model or None}
         
         # Shared context for Evolution Lab
         if "llm_config" not in st.session_state:
@@ -876,7 +1097,9 @@ def main():
             "api_key": api_key_input if not use_env else None,
             "model": model_name,
             "use_env": use_env,
-            "base_url": base_url_input if provider_key == "dashscope" else None
+            "base_url": base_url_input if provider_key == "dashscope" else None,
+            "secondary": secondary,
+            "hedge_percentile": hedge_percentile,
         }
 
         if use_env:
@@ -965,10 +1188,37 @@ def main():
             except Exception as e:
                 st.error(str(e))
 
+        an1, an2, an3 = st.columns([1, 1, 1])
+        with an1:
+            an_start = st.text_input("分析起始时间(ISO，可选)", "", key="an_start_iso")
+        with an2:
+            an_end = st.text_input("分析结束时间(ISO，可选)", "", key="an_end_iso")
+        with an3:
+            an_archive = st.checkbox("包含归档日志", value=False, key="an_include_archive")
+            an_cache = st.checkbox("使用 LLM 响应缓存", value=True, key="an_use_cache")
         if st.button("AI Agent 分析日志", key="btn_llm_analyze"):
             base_url = st.session_state["llm_config"].get("base_url") if provider_key == "dashscope" else None
             ak = None if use_env else (api_key_input or None)
-            report = analyze_logs(api_key=ak, provider=provider_key, model_name=model_name or None, base_url=base_url)
+            flush_logs()
+            from datetime import datetime as _dt
+            a_start = None
+            a_end = None
+            try:
+                a_start = _dt.fromisoformat(an_start.strip()).isoformat() if an_start.strip() else None
+                a_end = _dt.fromisoformat(an_end.strip()).isoformat() if an_end.strip() else None
+            except Exception:
+                st.warning("时间解析失败，忽略时间范围")
+                a_start = None
+                a_end = None
+            live_report = st.empty()
+            an_tracker = UsageTracker()
+            report = analyze_logs(
+                api_key=ak, provider=provider_key, model_name=model_name or None, base_url=base_url,
+                start=a_start, end=a_end, include_archive=an_archive, use_cache=an_cache,
+                on_token=lambda delta, text: live_report.markdown(text), tracker=an_tracker,
+            )
+            live_report.empty()
+            _finish_usage(an_tracker, "log_analysis")
             st.json(report.get("summary"))
             st.write("建议")
             st.write("\n".join(report.get("suggestions", [])))
@@ -1006,7 +1256,15 @@ def main():
     
     with col_mode2:
         st.write("") # Spacer
-        st.write("") 
+        evo_use_cache = st.checkbox("使用 LLM 响应缓存", value=True, key="evo_use_cache", help="相同提示词直接复用已缓存的回答；取消勾选则强制重新请求")
+        evo_static_first = st.checkbox("静态预审 (无残留时跳过 LLM 审查)", value=True, key="evo_static_first", help="先用本地规则检查 NVL/SYSDATE/ROWNUM/DECODE/(+)/VARCHAR2 等残留与括号配对，干净的转换不再调用 Reviewer")
+        from migration_tool.ai_agent.llm_cache import get_cache
+        llm_cache = get_cache()
+        if llm_cache is not None:
+            cs = llm_cache.stats()
+            st.caption(f"缓存: {cs['entries']} 条 / {cs['bytes'] // 1024} KB，本进程命中 {cs['hits']}，未命中 {cs['misses']}")
+            if st.button("清空缓存", key="btn_clear_llm_cache"):
+                llm_cache.clear()
         
     if selected_preset == "自定义场景":
         evo_topic = st.text_input("输入测试场景/关注点", "Oracle 复杂日期函数与NVL组合", key="evo_topic_input")
@@ -1025,14 +1283,16 @@ def main():
         st.session_state["evo_state"] = {}
         
     if st.button("开始进化循环", key="btn_start_evo"):
-        from migration_tool.ai_agent.evolution import EvolutionManager
+        from migration_tool.ai_agent.evolution import CHUNK_REVIEW_TOKENS, EvolutionManager
+        from migration_tool.ai_agent.llm_utils import estimate_tokens
         
         cfg = st.session_state.get("llm_config", {})
         prov = cfg.get("provider", "dashscope")
         ak = cfg.get("api_key")
         model = cfg.get("model")
         
-        em = EvolutionManager(api_key=ak, provider=prov, model=model, base_url=cfg.get("base_url"))
+        evo_tracker = UsageTracker()
+        em = EvolutionManager(api_key=ak, provider=prov, model=model, base_url=cfg.get("base_url"), use_cache=evo_use_cache, tracker=evo_tracker, static_first=evo_static_first, secondary=cfg.get("secondary"), hedge_percentile=cfg.get("hedge_percentile"))
         
         with st.status("正在运行 AI 进化循环...", expanded=True) as status:
             st.write("1. Generator: 生成 Oracle SQL 测试用例...")
@@ -1048,7 +1308,27 @@ def main():
             st.session_state["evo_state"]["snowflake_sql"] = sf_sql
             
             st.write("3. Reviewer: 审查转换结果...")
-            review = em.review_conversion(oracle_sql, sf_sql)
+            review_live = st.empty()
+            review_fields = st.container()
+
+            def _on_review_field(key, value):
+                if key == "score":
+                    review_fields.metric("评分", value)
+                elif key == "issues":
+                    review_fields.write(value)
+
+            if estimate_tokens(oracle_sql, sf_sql) > CHUNK_REVIEW_TOKENS:
+                review_live.info("对象较大，按语句/块分片并发审查...")
+                review = em.review_conversion_chunked(oracle_sql, sf_sql)
+            else:
+                review = em.review_conversion(
+                    oracle_sql, sf_sql,
+                    on_token=lambda delta, text: review_live.code(text, language="json"),
+                    on_field=_on_review_field,
+                )
+            review_live.empty()
+            if review.get("static") and review.get("clean"):
+                st.info("静态预审通过，未发现 Oracle 残留，已跳过 LLM 审查。")
             st.json(review)
             st.session_state["evo_state"]["review"] = review
             
@@ -1067,6 +1347,18 @@ def main():
                 st.session_state["evo_state"]["proposal"] = None
                 
             status.update(label="进化循环完成", state="complete", expanded=True)
+        _finish_usage(evo_tracker, "evolution")
+
+    def _show_gate(gate):
+        st.caption(f"规则校验: {'通过' if gate['ok'] else '未通过'} · 新规则最长耗时 {gate['max_rule_ms']}ms / 预算 {gate['budget_ms']}ms · 输出变化 {len(gate['diffs'])} 条 · 用时 {gate.get('elapsed_ms', 0)}ms")
+        if gate["diffs"]:
+            with st.expander(f"输出差异 ({len(gate['diffs'])})", expanded=not gate["ok"]):
+                for d in gate["diffs"]:
+                    st.write(f"{d['source']}#{d['index']}")
+                    st.code(f"- {d['before']}\n+ {d['after']}", language="diff")
+        if gate["timings"]:
+            with st.expander("逐条耗时", expanded=False):
+                st.dataframe(gate["timings"])
 
     if st.session_state.get("evo_state", {}).get("proposal"):
         st.info("检测到待应用的优化规则")
@@ -1075,22 +1367,205 @@ def main():
             st.write("建议规则")
             st.json(st.session_state["evo_state"]["proposal"])
         with col_evo2:
+            evo_force_apply = st.checkbox("忽略回归/性能校验强制应用", value=False, key="evo_force_apply")
             if st.button("✅ 接受并应用规则", key="btn_apply_rule"):
                 from migration_tool.ai_agent.evolution import EvolutionManager
                 cfg = st.session_state.get("llm_config", {})
                 em = EvolutionManager(api_key=cfg.get("api_key"), provider=cfg.get("provider"), base_url=cfg.get("base_url"))
                 
-                # Save snapshot
-                idx = em.save_rule_snapshot(
-                    st.session_state["evo_state"]["proposal"],
-                    st.session_state["evo_state"]["oracle_sql"],
-                    st.session_state["evo_state"]["snowflake_sql"],
-                    st.session_state["evo_state"]["review"]
-                )
-                # Apply
-                em.apply_rule(st.session_state["evo_state"]["proposal"])
-                st.success(f"规则已应用并归档 (版本 #{idx})")
-                st.session_state["evo_state"]["proposal"] = None # Clear after apply
+                with st.spinner("回放黄金语料与历史触发 SQL 校验规则..."):
+                    gate = em.gate_rule(st.session_state["evo_state"]["proposal"], trigger_sql=st.session_state["evo_state"].get("oracle_sql"))
+                _show_gate(gate)
+                if not gate["ok"] and not evo_force_apply:
+                    st.error("规则未通过校验，未应用：" + "; ".join(gate["reasons"]))
+                else:
+                    # Save snapshot
+                    idx = em.save_rule_snapshot(
+                        st.session_state["evo_state"]["proposal"],
+                        st.session_state["evo_state"]["oracle_sql"],
+                        st.session_state["evo_state"]["snowflake_sql"],
+                        st.session_state["evo_state"]["review"],
+                        status="applied",
+                    )
+                    # Apply
+                    gen = em.apply_rule(st.session_state["evo_state"]["proposal"])
+                    st.success(f"规则已应用并归档 (历史 #{idx}，规则版本 #{gen})")
+                    st.session_state["evo_state"]["proposal"] = None # Clear after apply
+
+    with st.expander("🚀 批量并发进化(多主题)", expanded=False):
+        st.caption("每行一个测试主题；各主题并发运行生成→转换→审查→优化，受每分钟请求数与 token 数限制，完成一个展示一个")
+        eb_source = st.radio("用例来源", ["AI 生成(按主题)", "日志中的真实失败 SQL"], horizontal=True, key="evo_batch_source")
+        if eb_source == "AI 生成(按主题)":
+            default_topics = "\n".join(p.split("(")[0].strip() + " 相关语法的复杂用法测试" for p in presets if p not in ("自定义场景", "随机探索 (AI 自动决定)"))
+            eb_topics = st.text_area("主题列表", default_topics, height=160, key="evo_batch_topics")
+        else:
+            st.caption("从日志中挑出带告警/错误的转换、Snowflake 执行失败及一致性失败对应的 Oracle SQL，按指纹去重、按出现次数排序；直接进入转换→审查→优化，不再调用生成器")
+            em1, em2 = st.columns(2)
+            with em1:
+                eb_mine_limit = st.number_input("最多条数", min_value=1, max_value=1000, value=30, step=5, key="evo_batch_mine_limit")
+            with em2:
+                eb_mine_archive = st.checkbox("包含已归档日志", value=False, key="evo_batch_mine_archive")
+            from migration_tool.ai_agent.log_corpus import mine_failing_sql
+            flush_logs()
+            eb_mined = mine_failing_sql(_log_path(), include_archive=eb_mine_archive, limit=int(eb_mine_limit))
+            if eb_mined:
+                st.dataframe([
+                    {"次数": m["count"], "指纹": m["fingerprint"], "原因": "; ".join(f"{r} ×{n}" for r, n in m["reasons"]), "最近": m["last_seen"], "SQL": " ".join(m["oracle_sql"].split())[:160]}
+                    for m in eb_mined
+                ])
+            else:
+                st.info("日志中没有找到失败的转换相关 SQL")
+        eb1, eb2, eb3 = st.columns(3)
+        with eb1:
+            eb_conc = st.number_input("并发数", min_value=1, max_value=64, value=8, step=1, key="evo_batch_conc")
+        with eb2:
+            eb_rpm = st.number_input("每分钟请求数上限", min_value=1, value=60, step=10, key="evo_batch_rpm")
+        with eb3:
+            eb_tpm = st.number_input("每分钟 token 上限", min_value=1000, value=100000, step=10000, key="evo_batch_tpm")
+        eb4, eb5 = st.columns(2)
+        with eb4:
+            eb_budget_tokens = st.number_input("本次 token 预算(0 不限)", min_value=0, value=0, step=10000, key="evo_batch_budget_tokens")
+        with eb5:
+            eb_budget_cost = st.number_input("本次成本预算 USD(0 不限)", min_value=0.0, value=0.0, step=0.5, key="evo_batch_budget_cost")
+        if st.button("开始批量进化", key="btn_evo_batch"):
+            from migration_tool.ai_agent.evolution import EvolutionManager
+            from migration_tool.ai_agent.evolution_batch import run_evolution_batch
+
+            cfg = st.session_state.get("llm_config", {})
+            eb_tracker = UsageTracker(budget_tokens=int(eb_budget_tokens), budget_cost=float(eb_budget_cost))
+            em = EvolutionManager(api_key=cfg.get("api_key"), provider=cfg.get("provider", "dashscope"), model=cfg.get("model"), base_url=cfg.get("base_url"), use_cache=evo_use_cache, tracker=eb_tracker, static_first=evo_static_first, secondary=cfg.get("secondary"), hedge_percentile=cfg.get("hedge_percentile"))
+            if eb_source == "AI 生成(按主题)":
+                topics = [t.strip() for t in eb_topics.splitlines() if t.strip()]
+            else:
+                topics = eb_mined
+            progress = st.progress(0.0, text=f"0/{len(topics)}")
+            feed = st.container()
+            done = []
+
+            def _on_result(res):
+                done.append(res)
+                progress.progress(len(done) / len(topics), text=f"{len(done)}/{len(topics)}")
+                score = (res.get("review") or {}).get("score")
+                mark = "⏭️" if res.get("skipped") else "❌" if res.get("error") else ("🛠️" if res.get("proposal") else "✅")
+                feed.write(f"{mark} {res['topic']} — score: {score}，耗时 {res['elapsed_ms']} ms" + (f"，错误: {res['error']}" if res.get("error") else ""))
+
+            results = run_evolution_batch(em, topics, concurrency=int(eb_conc), requests_per_min=float(eb_rpm), tokens_per_min=float(eb_tpm), on_result=_on_result)
+            st.session_state["evo_batch"] = results
+            write_log({
+                "timestamp": datetime.utcnow().isoformat(),
+                "event": "evolution_batch",
+                "source": "logs" if eb_source != "AI 生成(按主题)" else "generated",
+                "topics": len(topics),
+                "proposals": sum(1 for r in results if r.get("proposal")),
+                "errors": sum(1 for r in results if r.get("error")),
+                "skipped": sum(1 for r in results if r.get("skipped")),
+            })
+            _finish_usage(eb_tracker, "evolution_batch")
+            if getattr(em.client, "is_hedged", False):
+                st.caption("提供方对冲/故障转移统计")
+                st.dataframe(em.client.stats(em.model))
+        batch_results = [r for r in st.session_state.get("evo_batch") or [] if r.get("proposal")]
+        if batch_results:
+            st.write(f"待审核规则: {len(batch_results)} 条")
+            picked = []
+            for i, r in enumerate(batch_results):
+                with st.container():
+                    if st.checkbox(f"{r['topic']} — {json.dumps(r['proposal'], ensure_ascii=False)}", value=False, key=f"evo_batch_pick_{i}"):
+                        picked.append(r)
+                    st.caption("问题: " + "; ".join(str(x) for x in ((r.get("review") or {}).get("issues") or [])))
+            bb1, bb2 = st.columns(2)
+            with bb1:
+                if st.button("✅ 应用选中规则", key="btn_evo_batch_apply"):
+                    from migration_tool.ai_agent.evolution import EvolutionManager
+                    cfg = st.session_state.get("llm_config", {})
+                    em = EvolutionManager(api_key=cfg.get("api_key"), provider=cfg.get("provider"), base_url=cfg.get("base_url"))
+                    applied = []
+                    for r in picked:
+                        gate = em.gate_rule(r["proposal"], trigger_sql=r["oracle_sql"])
+                        if not gate["ok"]:
+                            if r.get("history_id"):
+                                em.mark_rule(r["history_id"], "rejected")
+                            st.warning(f"{r['topic']}: 未通过校验，已跳过 — " + "; ".join(gate["reasons"]))
+                            continue
+                        if r.get("history_id"):
+                            em.mark_rule(r["history_id"], "applied")
+                        else:
+                            em.save_rule_snapshot(r["proposal"], r["oracle_sql"], r["snowflake_sql"], r["review"] or {}, status="applied")
+                        em.apply_rule(r["proposal"])
+                        applied.append(r)
+                    st.session_state["evo_batch"] = [r for r in st.session_state["evo_batch"] if not any(r is p for p in applied)]
+                    st.success(f"已应用 {len(applied)} 条规则")
+            with bb2:
+                if st.button("清空待审核列表", key="btn_evo_batch_clear"):
+                    st.session_state["evo_batch"] = []
+
+    with st.expander("🏷️ 规则版本", expanded=False):
+        rule_reg = get_registry()
+        live = rule_reg.current()
+        st.caption(f"当前生效版本: #{live.generation if live.generation is not None else '-'} · 文件 {rule_reg.path} · 本进程加载 {rule_reg.reloads} 次")
+        if live.errors or live.skipped:
+            st.warning("以下规则无效，生效版本中已跳过: " + "; ".join(live.errors + live.skipped))
+        rule_versions = rule_reg.versions()
+        if rule_versions:
+            st.dataframe(list(reversed(rule_versions)))
+            rv1, rv2 = st.columns(2)
+            with rv1:
+                rb_gen = st.selectbox("回滚到版本", [v["generation"] for v in reversed(rule_versions) if not v["current"]] or [None], key="rules_rollback_gen")
+            with rv2:
+                st.write("")
+                if st.button("↩️ 回滚", key="btn_rules_rollback", disabled=rb_gen is None):
+                    new_gen = rule_reg.rollback(rb_gen)
+                    st.success(f"已回滚到 #{rb_gen}，发布为版本 #{new_gen}；运行中的转换进程将自动热加载")
+        else:
+            st.caption("尚无发布记录；应用规则或保存规则文件后自动建立版本")
+        if st.button("🔍 分析冗余/被遮蔽规则", key="btn_rules_analyze"):
+            from migration_tool.converter.rule_analyzer import analyze_rules
+            from migration_tool.converter.rule_gate import load_corpus
+            with st.spinner("在黄金语料与历史触发 SQL 上回放全部规则..."):
+                st.session_state["rule_analysis"] = analyze_rules(rule_reg.rules(), [c[2] for c in load_corpus()])
+        ra = st.session_state.get("rule_analysis")
+        if ra:
+            st.caption(f"语料 {ra['corpus_size']} 条 · 用户规则扫描 {ra['scans_before']} → {ra['scans_after']} 次 · 可移除 {len(ra['removed'])} 条（输出与告警完全一致）")
+            st.dataframe([{k: (", ".join(v) if k == "issues" else v) for k, v in e.items() if k != "repl"} for e in ra["rules"]])
+            if ra["removed"]:
+                st.write("可移除: " + ", ".join(ra["removed"]))
+                with st.expander("精简后的规则集", expanded=False):
+                    st.json(ra["minimal_rules"])
+                if st.button("发布精简规则集", key="btn_rules_publish_minimal"):
+                    new_gen = rule_reg.publish(ra["minimal_rules"], note=f"minimal rule set (removed {len(ra['removed'])})")
+                    st.session_state["rule_analysis"] = None
+                    st.success(f"已发布为版本 #{new_gen}，可在上方回滚")
+
+    with st.expander("🗂️ 规则历史", expanded=False):
+        from migration_tool.converter.rule_history import STATUSES, get_history_store
+        rh_store = get_history_store()
+        rh_counts = rh_store.counts()
+        st.caption("按状态统计: " + ", ".join(f"{k} {v}" for k, v in rh_counts.items()) if rh_counts else "暂无记录")
+        rh1, rh2 = st.columns(2)
+        with rh1:
+            rh_status = st.selectbox("状态", ["全部"] + list(STATUSES), key="rules_history_status")
+        with rh2:
+            rh_id = st.number_input("按 ID 查看 (0 为列表)", min_value=0, value=0, step=1, key="rules_history_id")
+        if rh_id:
+            st.json(rh_store.get(rh_id) or {})
+        else:
+            rh_rows = rh_store.list(None if rh_status == "全部" else rh_status, limit=200)
+            st.dataframe([
+                {"id": e["id"], "timestamp": e["timestamp"], "status": e["status"], "rule": json.dumps(e["proposed_rule"], ensure_ascii=False), "trigger_sql": (e["trigger_sql"] or "")[:200]}
+                for e in rh_rows
+            ])
+
+    usage_runs = st.session_state.get("llm_usage_runs") or []
+    if usage_runs:
+        with st.expander(f"💰 本会话 LLM 用量（{len(usage_runs)} 次运行）", expanded=False):
+            by_role = {}
+            for run in usage_runs:
+                for role, v in run["roles"].items():
+                    agg = by_role.setdefault(role, {"role": role, "calls": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+                    for k in ("calls", "cached", "prompt_tokens", "completion_tokens", "cost"):
+                        agg[k] += v[k]
+            st.dataframe(list(by_role.values()))
+            st.dataframe([{"run_id": r["run_id"], "context": r["context"], "tokens": r["total"]["total_tokens"], "cost": r["total"]["cost"], "exhausted": r["exhausted"]} for r in usage_runs])
 
     st.caption("日志文件位置: " + _log_path())
     owner = 'Yuzh'
@@ -0,0 +1,323 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from migration_tool.consistency.catalog import estimate_rows
+from migration_tool.consistency.compare import compare_rows
+from migration_tool.consistency.incremental import incremental_validate
+from migration_tool.consistency.normalize import make_normalizer
+from migration_tool.metrics import consistency_result, observe_consistency
+
+DEFAULT_OPTIONS = {
+    "pk_cols": "",
+    "sort_cols": "",
+    "columns": "*",
+    "where": "",
+    "ignore_case": True,
+    "trunc_ts": True,
+    "nfkc_norm": True,
+    "tz_offset_min": 0.0,
+    "num_tol": 0.0,
+    "incremental": False,
+    "watermark_col": "",
+    "buckets": 64,
+}
+
+_RUNNING = {}
+_RUNNING_LOCK = threading.Lock()
+
+
+def _default_batch_dir():
+    return os.path.join(os.path.dirname(os.path.dirname(__file__)), "state", "batches")
+
+
+def load_manifest(source):
+    """
+    Accepts a manifest dict, a JSON string or a path to a JSON file:
+    {"defaults": {...options}, "jobs": [{"source_table", "target_table", "pk_cols", ...}]}
+    A bare list is treated as the job list.
+    """
+    data = source
+    if isinstance(source, str):
+        text = source.strip()
+        if text and text[0] not in "[{" and os.path.exists(text):
+            with open(text, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        else:
+            data = json.loads(text)
+    if isinstance(data, list):
+        data = {"jobs": data}
+    defaults = dict(DEFAULT_OPTIONS)
+    defaults.update(data.get("defaults") or {})
+    jobs = []
+    seen = set()
+    for it in data.get("jobs") or []:
+        if not it.get("source_table") or not it.get("target_table"):
+            raise ValueError(f"job missing source_table/target_table: {it}")
+        job = dict(defaults)
+        job.update(it.get("options") or {})
+        job.update({k: v for k, v in it.items() if k != "options"})
+        job["id"] = str(it.get("id") or f"{job['source_table'].strip()}->{job['target_table'].strip()}")
+        if job["id"] in seen:
+            raise ValueError(f"duplicate job id: {job['id']}")
+        seen.add(job["id"])
+        jobs.append(job)
+    return {"defaults": defaults, "jobs": jobs}
+
+
+def manifest_id(manifest: dict):
+    blob = json.dumps(manifest.get("jobs") or [], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:12]
+
+
+def _estimate(client, dialect: str, table: str):
+    """estimate_rows, or None when the query itself raises (e.g. connect() fails)."""
+    try:
+        return estimate_rows(client, dialect, table)
+    except Exception:
+        return None
+
+
+def _close(client):
+    try:
+        client.close()
+    except Exception:
+        pass
+
+
+class _LimitedClient:
+    """Wraps a DB client so every query holds a per-database concurrency slot."""
+
+    def __init__(self, client, slots: threading.Semaphore):
+        self.client = client
+        self.slots = slots
+
+    def execute(self, sql: str):
+        with self.slots:
+            return self.client.execute(sql)
+
+    def close(self):
+        self.client.close()
+
+
+class BatchRunner:
+    """
+    Runs a manifest of table comparisons largest-first with a cap on concurrent
+    queries per database. Each finished job is appended to a checkpoint file,
+    so a rerun with the same manifest skips what is already done.
+    """
+
+    def __init__(self, manifest, client_factory, root=None, max_oracle=4, max_snowflake=4):
+        self.manifest = load_manifest(manifest)
+        self.client_factory = client_factory
+        self.run_id = manifest_id(self.manifest)
+        self.dir = os.path.join(root or _default_batch_dir(), self.run_id)
+        self.checkpoint_path = os.path.join(self.dir, "checkpoint.jsonl")
+        self.plan_path = os.path.join(self.dir, "plan.json")
+        self.slots = {"oracle": threading.Semaphore(max(1, int(max_oracle))), "snowflake": threading.Semaphore(max(1, int(max_snowflake)))}
+        self.workers = max(1, int(max_oracle), int(max_snowflake))
+        self._lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.running = False
+        self.last_error = None
+
+    def _clients(self):
+        o = _LimitedClient(self.client_factory("oracle"), self.slots["oracle"])
+        s = _LimitedClient(self.client_factory("snowflake"), self.slots["snowflake"])
+        return o, s
+
+    def finished(self):
+        done = {}
+        if not os.path.exists(self.checkpoint_path):
+            return done
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    it = json.loads(line)
+                except Exception:
+                    continue
+                done[it.get("id")] = it
+        return done
+
+    def _checkpoint(self, result: dict):
+        with self._lock:
+            os.makedirs(self.dir, exist_ok=True)
+            with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def plan(self):
+        """Job ids ordered by estimated size, largest first; estimates are cached on disk."""
+        sizes = {}
+        if os.path.exists(self.plan_path):
+            try:
+                with open(self.plan_path, "r", encoding="utf-8") as f:
+                    sizes = json.load(f).get("sizes") or {}
+            except Exception:
+                sizes = {}
+        missing = [j for j in self.manifest["jobs"] if j["id"] not in sizes]
+        guessed = {}
+        if missing:
+            o, s = self._clients()
+            try:
+                for j in missing:
+                    n_o = _estimate(o, "oracle", j["source_table"])
+                    n_s = _estimate(s, "snowflake", j["target_table"])
+                    if n_o is None or n_s is None:
+                        # Unreachable database: order it as 0 now, estimate again next run
+                        guessed[j["id"]] = max(n_o or 0, n_s or 0)
+                    else:
+                        sizes[j["id"]] = max(n_o, n_s)
+            finally:
+                _close(o)
+                _close(s)
+            os.makedirs(self.dir, exist_ok=True)
+            tmp = self.plan_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"created_at": datetime.utcnow().isoformat(), "sizes": sizes}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.plan_path)
+        sizes = dict(sizes, **guessed)
+        jobs = sorted(self.manifest["jobs"], key=lambda j: -int(sizes.get(j["id"]) or 0))
+        return [(j, int(sizes.get(j["id"]) or 0)) for j in jobs]
+
+    def _run_job(self, job: dict, est_rows: int):
+        start = time.perf_counter()
+        result = {"id": job["id"], "source_table": job["source_table"], "target_table": job["target_table"], "estimated_rows": est_rows}
+        normalize = make_normalizer(
+            ignore_case=job["ignore_case"], trunc_ts=job["trunc_ts"], nfkc_norm=job["nfkc_norm"], tz_offset_min=job["tz_offset_min"]
+        )
+        o, s = self._clients()
+        try:
+            if job["incremental"] and job["pk_cols"]:
+                rep = incremental_validate(
+                    o, s, job["source_table"], job["target_table"], job["pk_cols"], normalize,
+                    watermark_col=job["watermark_col"], buckets=job["buckets"], columns=job["columns"],
+                    where=job["where"], num_tol=job["num_tol"],
+                )
+                errs = rep["error"]
+            else:
+                cols = (job["columns"] or "").strip() or "*"
+                w = (job["where"] or "").strip()
+                tail = f" WHERE {w}" if w else ""
+                o_data, _, o_err = o.execute(f"SELECT {cols} FROM {job['source_table']}" + tail)
+                s_data, _, s_err = s.execute(f"SELECT {cols} FROM {job['target_table']}" + tail)
+                errs = {"oracle": o_err, "snowflake": s_err}
+                rep = {"row_match": None, "columns_match": None, "source_rows": len(o_data), "target_rows": len(s_data), "samples_mismatch": []}
+                if not o_err and not s_err:
+                    rep = compare_rows(o_data, s_data, normalize, pk_cols=job["pk_cols"], sort_cols=job["sort_cols"], num_tol=job["num_tol"])
+            result.update({
+                "status": "error" if (errs["oracle"] or errs["snowflake"]) else "ok",
+                "row_match": rep.get("row_match"),
+                "columns_match": rep.get("columns_match"),
+                "source_rows": rep.get("source_rows"),
+                "target_rows": rep.get("target_rows"),
+                "mismatch_samples": len(rep.get("samples_mismatch") or []),
+                "error": errs,
+            })
+        except Exception as e:
+            result.update({"status": "error", "error": {"oracle": None, "snowflake": None, "job": str(e)}})
+        finally:
+            o.close()
+            s.close()
+        result["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+        observe_consistency(
+            "batch_incremental" if job["incremental"] and job["pk_cols"] else "batch_full",
+            time.perf_counter() - start,
+            consistency_result(result.get("row_match"), result.get("mismatch_samples"), result["status"] == "error"),
+        )
+        result["finished_at"] = datetime.utcnow().isoformat()
+        return result
+
+    def run(self, on_result=None, retry_errors=False):
+        """
+        Runs every job not yet checkpointed; returns the results of this
+        invocation. An error that aborts the whole run is kept in last_error
+        (and re-raised) so a background run's failure shows up in status().
+        """
+        self.running = True
+        self.last_error = None
+        try:
+            done = self.finished()
+            todo = [(j, n) for j, n in self.plan() if j["id"] not in done or (retry_errors and done[j["id"]].get("status") != "ok")]
+            results = []
+            with ThreadPoolExecutor(max_workers=self.workers) as ex:
+                futures = {}
+                for j, n in todo:
+                    if self.stop_event.is_set():
+                        break
+                    futures[ex.submit(self._guarded, j, n)] = j["id"]
+                for fut in as_completed(futures):
+                    res = fut.result()
+                    if res is None:
+                        continue
+                    self._checkpoint(res)
+                    results.append(res)
+                    if on_result:
+                        on_result(res)
+            return results
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.running = False
+
+    def _guarded(self, job, est_rows):
+        if self.stop_event.is_set():
+            return None
+        return self._run_job(job, est_rows)
+
+    def status(self):
+        done = self.finished()
+        total = len(self.manifest["jobs"])
+        ok = sum(1 for r in done.values() if r.get("status") == "ok")
+        failed = sum(1 for r in done.values() if r.get("status") != "ok")
+        mismatched = sum(1 for r in done.values() if r.get("status") == "ok" and (not r.get("row_match") or r.get("mismatch_samples")))
+        return {
+            "run_id": self.run_id,
+            "total": total,
+            "finished": len(done),
+            "ok": ok,
+            "failed": failed,
+            "mismatched": mismatched,
+            "running": self.running,
+            "last_error": self.last_error,
+            "checkpoint": self.checkpoint_path,
+        }
+
+
+def _run_quietly(runner: BatchRunner):
+    try:
+        runner.run()
+    except Exception:
+        # Already recorded in runner.last_error for status()
+        pass
+
+
+def start_background(runner: BatchRunner):
+    """
+    Starts runner.run() on a daemon thread unless a run with the same manifest
+    is already active in this process, so a Streamlit rerun reattaches to it.
+    """
+    with _RUNNING_LOCK:
+        cur = _RUNNING.get(runner.run_id)
+        if cur is not None and cur.running:
+            return cur
+        runner.stop_event.clear()
+        runner.running = True
+        t = threading.Thread(target=_run_quietly, args=(runner,), name=f"consistency-batch-{runner.run_id}", daemon=True)
+        _RUNNING[runner.run_id] = runner
+        t.start()
+        return runner
+
+
+def get_running(run_id: str):
+    with _RUNNING_LOCK:
+        return _RUNNING.get(run_id)
@@ -0,0 +1,54 @@
+def split_table(table: str):
+    parts = [p.strip().strip('"') for p in table.strip().split(".")]
+    return parts[:-1], parts[-1]
+
+
+def _oracle_owner(prefix):
+    return f"'{prefix[-1].upper()}'" if prefix else "SYS_CONTEXT('USERENV', 'CURRENT_SCHEMA')"
+
+
+def _snowflake_info(prefix, view: str):
+    info = f"{prefix[0]}.INFORMATION_SCHEMA.{view}" if len(prefix) >= 2 else f"INFORMATION_SCHEMA.{view}"
+    schema = f"'{prefix[-1].upper()}'" if prefix else "CURRENT_SCHEMA()"
+    return info, schema
+
+
+def estimate_rows(client, dialect: str, table: str):
+    """Cheap row estimate from optimizer statistics / table metadata; 0 when unknown."""
+    prefix, name = split_table(table)
+    if dialect == "oracle":
+        sql = f"SELECT NUM_ROWS AS N FROM ALL_TABLES WHERE OWNER = {_oracle_owner(prefix)} AND TABLE_NAME = '{name.upper()}'"
+    else:
+        info, schema = _snowflake_info(prefix, "TABLES")
+        sql = f"SELECT ROW_COUNT AS N FROM {info} WHERE TABLE_SCHEMA = {schema} AND TABLE_NAME = '{name.upper()}'"
+    data, _, err = client.execute(sql)
+    if err or not data:
+        return 0
+    try:
+        return int(list(data[0].values())[0] or 0)
+    except Exception:
+        return 0
+
+
+def describe_columns(client, dialect: str, table: str):
+    """Returns ([(column_name, data_type), ...], error) in table order."""
+    prefix, name = split_table(table)
+    if dialect == "oracle":
+        sql = (
+            "SELECT COLUMN_NAME AS C, DATA_TYPE AS T FROM ALL_TAB_COLUMNS "
+            f"WHERE OWNER = {_oracle_owner(prefix)} AND TABLE_NAME = '{name.upper()}' ORDER BY COLUMN_ID"
+        )
+    else:
+        info, schema = _snowflake_info(prefix, "COLUMNS")
+        sql = (
+            f"SELECT COLUMN_NAME AS C, DATA_TYPE AS T FROM {info} "
+            f"WHERE TABLE_SCHEMA = {schema} AND TABLE_NAME = '{name.upper()}' ORDER BY ORDINAL_POSITION"
+        )
+    data, _, err = client.execute(sql)
+    if err:
+        return [], err
+    cols = []
+    for r in data:
+        vals = list(r.values())
+        cols.append((str(vals[0]), str(vals[1] or "")))
+    return cols, None
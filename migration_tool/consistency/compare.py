@@ -0,0 +1,85 @@
+from migration_tool.consistency.normalize import normalize_row, rows_differ
+
+
+def split_cols(cols):
+    return [c.strip() for c in (cols or "").split(",") if c.strip()]
+
+
+def sort_rows(rows, cols, normalize):
+    cs = split_cols(cols)
+    if not cs or not rows:
+        return rows
+
+    def kf(r):
+        return tuple(normalize(r.get(c)) for c in cs)
+
+    try:
+        return sorted(rows, key=kf)
+    except Exception:
+        return rows
+
+
+def keyed_map(rows, cols, normalize):
+    cs = split_cols(cols)
+    if not cs or not rows:
+        return {}
+    m = {}
+    for r in rows:
+        k = tuple(normalize(r.get(c)) for c in cs)
+        m[k] = normalize_row(r, normalize)
+    return m
+
+
+def compare_rows(o_data, s_data, normalize, pk_cols="", sort_cols="", num_tol=0.0, max_samples=50):
+    """
+    Compares two fetched result sets and returns the row/column part of the
+    consistency report. Keyed by pk_cols when given, else positional after
+    sorting by sort_cols.
+    """
+    report = {
+        "source_rows": len(o_data),
+        "target_rows": len(s_data),
+        "row_match": None,
+        "columns_match": None,
+        "source_columns": [],
+        "target_columns": [],
+        "column_diff": {"missing_in_target": [], "missing_in_source": []},
+        "missing_keys_in_target": [],
+        "missing_keys_in_source": [],
+        "samples_mismatch": [],
+    }
+    o_cols = list(o_data[0].keys()) if o_data else []
+    s_cols = list(s_data[0].keys()) if s_data else []
+    report["source_columns"] = o_cols
+    report["target_columns"] = s_cols
+    o_set = {c.lower() for c in o_cols}
+    s_set = {c.lower() for c in s_cols}
+    report["columns_match"] = o_set == s_set
+    report["column_diff"]["missing_in_target"] = sorted(list(o_set - s_set))
+    report["column_diff"]["missing_in_source"] = sorted(list(s_set - o_set))
+    if (pk_cols or "").strip():
+        om = keyed_map(o_data, pk_cols, normalize)
+        sm = keyed_map(s_data, pk_cols, normalize)
+        ko = set(om.keys())
+        ks = set(sm.keys())
+        report["missing_keys_in_target"] = sorted(list(ko - ks))
+        report["missing_keys_in_source"] = sorted(list(ks - ko))
+        report["row_match"] = len(report["missing_keys_in_target"]) == 0 and len(report["missing_keys_in_source"]) == 0 and len(ko) == len(ks)
+        report["common_keys"] = len(ko & ks)
+        inter = sorted(list(ko & ks))[:max_samples]
+        for i, k in enumerate(inter):
+            so = om.get(k) or {}
+            stg = sm.get(k) or {}
+            if rows_differ(so, stg, num_tol):
+                report["samples_mismatch"].append({"index": i, "key": k, "source": so, "target": stg})
+    else:
+        od = sort_rows(o_data, sort_cols, normalize)
+        sd = sort_rows(s_data, sort_cols, normalize)
+        report["row_match"] = len(od) == len(sd)
+        n = min(20, len(od), len(sd))
+        for i in range(n):
+            so = normalize_row(od[i], normalize)
+            stg = normalize_row(sd[i], normalize)
+            if rows_differ(so, stg, num_tol):
+                report["samples_mismatch"].append({"index": i, "source": so, "target": stg})
+    return report
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import time
+
+from migration_tool.consistency.normalize import normalize_row
+
+_MASK = (1 << 128) - 1
+
+
+def row_hash(row: dict) -> int:
+    """128-bit hash of an already normalized row, independent of column order."""
+    items = [[k, row[k]] for k in sorted(row.keys())]
+    blob = json.dumps(items, ensure_ascii=False, default=str, separators=(",", ":"))
+    return int.from_bytes(hashlib.blake2b(blob.encode("utf-8"), digest_size=16).digest(), "big")
+
+
+class RowDigest:
+    """
+    Order-independent digest of a multiset of rows: row count plus the sum
+    (mod 2^128) and XOR of the row hashes. Equal multisets give equal digests.
+    """
+
+    def __init__(self, count=0, total=0, xor=0):
+        self.count = count
+        self.total = total
+        self.xor = xor
+
+    def add(self, h: int):
+        self.count += 1
+        self.total = (self.total + h) & _MASK
+        self.xor ^= h
+
+    def add_row(self, row: dict):
+        self.add(row_hash(row))
+
+    def merge(self, other: "RowDigest"):
+        self.count += other.count
+        self.total = (self.total + other.total) & _MASK
+        self.xor ^= other.xor
+
+    def __eq__(self, other):
+        if not isinstance(other, RowDigest):
+            return NotImplemented
+        return (self.count, self.total, self.xor) == (other.count, other.total, other.xor)
+
+    def __repr__(self):
+        return f"RowDigest(count={self.count}, total={self.total:032x}, xor={self.xor:032x})"
+
+    def to_dict(self):
+        return {"count": self.count, "sum": f"{self.total:032x}", "xor": f"{self.xor:032x}"}
+
+    @classmethod
+    def from_dict(cls, d: dict | None):
+        d = d or {}
+        return cls(int(d.get("count") or 0), int(d.get("sum") or "0", 16), int(d.get("xor") or "0", 16))
+
+
+def stream_digest(client, sql: str, normalize, batch_size: int = 10000):
+    """
+    Streams a query through client.iter_rows and folds every normalized row
+    into a RowDigest, keeping O(1) rows in memory.
+    Returns (digest, columns, elapsed_ms, error).
+    """
+    start = time.perf_counter()
+    d = RowDigest()
+    cols = []
+    try:
+        for r in client.iter_rows(sql, batch_size=batch_size):
+            if not cols:
+                cols = list(r.keys())
+            d.add_row(normalize_row(r, normalize))
+    except Exception as e:
+        return d, cols, int((time.perf_counter() - start) * 1000), str(e)
+    return d, cols, int((time.perf_counter() - start) * 1000), None
+
+
+def compare_digests(o_client, s_client, src_sql: str, tgt_sql: str, normalize, batch_size: int = 10000):
+    """Order-independent multiset comparison of two result sets without sorting or indexing them."""
+    o_d, o_cols, o_ms, o_err = stream_digest(o_client, src_sql, normalize, batch_size)
+    s_d, s_cols, s_ms, s_err = stream_digest(s_client, tgt_sql, normalize, batch_size)
+    return {
+        "match": (not o_err and not s_err) and o_d == s_d,
+        "source": o_d.to_dict(),
+        "target": s_d.to_dict(),
+        "source_columns": o_cols,
+        "target_columns": s_cols,
+        "source_error": o_err,
+        "target_error": s_err,
+        "elapsed_ms": {"oracle": o_ms, "snowflake": s_ms},
+    }
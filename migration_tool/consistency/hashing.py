@@ -0,0 +1,26 @@
+MAX_BUCKETS = 1000
+
+
+def _key_text(dialect: str, key_cols):
+    if dialect == "oracle":
+        parts = [f"TO_CHAR({c})" for c in key_cols]
+    else:
+        parts = [f"COALESCE(TO_VARCHAR({c}), '')" for c in key_cols]
+    return " || '|' || ".join(parts)
+
+
+def hash_expr(dialect: str, key_cols):
+    """
+    SQL expression giving the same 32-bit integer for the same key on both sides.
+    ORA_HASH has no Snowflake counterpart, so both dialects take the first
+    8 hex digits of MD5 over the key text instead. Keys should be integers or
+    strings so that TO_CHAR and TO_VARCHAR render them identically.
+    """
+    text = _key_text(dialect, key_cols)
+    if dialect == "oracle":
+        return f"TO_NUMBER(SUBSTR(RAWTOHEX(STANDARD_HASH({text}, 'MD5')), 1, 8), 'XXXXXXXX')"
+    return f"TO_NUMBER(SUBSTR(UPPER(MD5({text})), 1, 8), 'XXXXXXXX')"
+
+
+def bucket_expr(dialect: str, key_cols, buckets: int):
+    return f"MOD({hash_expr(dialect, key_cols)}, {int(buckets)})"
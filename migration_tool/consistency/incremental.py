@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime, date
+from decimal import Decimal
+
+from migration_tool.consistency.compare import compare_rows, split_cols
+from migration_tool.consistency.digest import RowDigest
+from migration_tool.consistency.hashing import MAX_BUCKETS, bucket_expr
+from migration_tool.consistency.normalize import normalize_row
+
+BUCKET_COL = "MT_BUCKET_ID"
+
+
+def _default_store_dir():
+    return os.path.join(os.path.dirname(os.path.dirname(__file__)), "state", "checksums")
+
+
+class ChecksumStore:
+    """One JSON file per source/target table pair, replaced atomically on save."""
+
+    def __init__(self, root=None):
+        self.root = root or _default_store_dir()
+
+    def path(self, src_table, tgt_table):
+        key = f"{src_table.strip()}->{tgt_table.strip()}"
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", key.replace("->", "__"))[:80]
+        suffix = hashlib.sha1(key.lower().encode("utf-8")).hexdigest()[:10]
+        return os.path.join(self.root, f"{name}.{suffix}.json")
+
+    def load(self, src_table, tgt_table):
+        p = self.path(src_table, tgt_table)
+        if not os.path.exists(p):
+            return None
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def save(self, src_table, tgt_table, state):
+        p = self.path(src_table, tgt_table)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = p + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, p)
+        return p
+
+    def delete(self, src_table, tgt_table):
+        p = self.path(src_table, tgt_table)
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def _wm_encode(v):
+    if v is None:
+        return None
+    if isinstance(v, datetime):
+        return {"type": "datetime", "value": v.replace(tzinfo=None).isoformat(sep=" ")}
+    if isinstance(v, date):
+        return {"type": "date", "value": v.isoformat()}
+    if isinstance(v, (int, float, Decimal)):
+        return {"type": "number", "value": str(v)}
+    return {"type": "string", "value": str(v)}
+
+
+def _wm_literal(dialect: str, wm: dict):
+    t = wm.get("type")
+    v = wm.get("value")
+    if t == "datetime":
+        ts = datetime.fromisoformat(v).strftime("%Y-%m-%d %H:%M:%S.%f")
+        if dialect == "oracle":
+            return f"TO_TIMESTAMP('{ts}', 'YYYY-MM-DD HH24:MI:SS.FF6')"
+        return f"TO_TIMESTAMP('{ts}')"
+    if t == "date":
+        return f"DATE '{v}'"
+    if t == "number":
+        return v
+    return "'" + str(v).replace("'", "''") + "'"
+
+
+def _and(where: str, cond: str):
+    w = (where or "").strip()
+    return f" WHERE ({w}) AND {cond}" if w else f" WHERE {cond}"
+
+
+def _where(where: str):
+    w = (where or "").strip()
+    return f" WHERE {w}" if w else ""
+
+
+def _config(src_table, tgt_table, key_cols, watermark_col, buckets, columns, where):
+    return {
+        "source_table": src_table.strip(),
+        "target_table": tgt_table.strip(),
+        "key_cols": [c.lower() for c in key_cols],
+        "watermark_col": (watermark_col or "").strip() or None,
+        "buckets": buckets,
+        "columns": (columns or "").strip() or "*",
+        "where": (where or "").strip(),
+    }
+
+
+def _select_buckets(dialect, table, key_cols, buckets, columns, where, only=None):
+    bx = bucket_expr(dialect, key_cols, buckets)
+    cols = (columns or "").strip() or "*"
+    if cols == "*":
+        cols = "mt_src.*"
+    sql = f"SELECT {cols}, {bx} AS {BUCKET_COL} FROM {table} mt_src"
+    if only is None:
+        return sql + _where(where)
+    ids = ", ".join(str(b) for b in sorted(only))
+    return sql + _and(where, f"{bx} IN ({ids})")
+
+
+def _pop_bucket(row: dict):
+    for k in list(row.keys()):
+        if k.upper() == BUCKET_COL:
+            return int(row.pop(k))
+    return None
+
+
+def incremental_validate(
+    o_client,
+    s_client,
+    src_table: str,
+    tgt_table: str,
+    key_cols: str,
+    normalize,
+    watermark_col: str | None = None,
+    buckets: int = 64,
+    columns: str = "*",
+    where: str = "",
+    num_tol: float = 0.0,
+    verify_counts: bool = True,
+    force_full: bool = False,
+    store: ChecksumStore | None = None,
+):
+    """
+    Bucketed table validation that persists per-bucket checksums between runs.
+    The first run (or a changed configuration) fetches everything; later runs
+    only refetch buckets holding rows at or past the stored watermark, plus
+    buckets whose server-side row count changed (deletes), and report how the
+    stored checksums drifted since the previous run.
+    """
+    start = time.perf_counter()
+    store = store or ChecksumStore()
+    keys = split_cols(key_cols)
+    buckets = max(1, min(int(buckets or 1), MAX_BUCKETS))
+    clients = {"oracle": o_client, "snowflake": s_client}
+    tables = {"oracle": src_table.strip(), "snowflake": tgt_table.strip()}
+    report = {
+        "mode": "full",
+        "buckets_total": buckets,
+        "buckets_rechecked": 0,
+        "rows_fetched": {"oracle": 0, "snowflake": 0},
+        "source_rows": 0,
+        "target_rows": 0,
+        "row_match": None,
+        "columns_match": None,
+        "source_columns": [],
+        "target_columns": [],
+        "column_diff": {"missing_in_target": [], "missing_in_source": []},
+        "mismatched_buckets": [],
+        "missing_keys_in_target": [],
+        "missing_keys_in_source": [],
+        "samples_mismatch": [],
+        "drift": {"oracle": [], "snowflake": []},
+        "watermark": {"previous": None, "current": None},
+        "error": {"oracle": None, "snowflake": None},
+        "elapsed_ms": 0,
+    }
+    if not keys:
+        report["error"]["oracle"] = "key columns required for incremental validation"
+        return report
+
+    cfg = _config(src_table, tgt_table, keys, watermark_col, buckets, columns, where)
+    prev = store.load(src_table, tgt_table)
+    if prev and prev.get("config") != cfg:
+        prev = None
+    full = force_full or prev is None or not cfg["watermark_col"]
+
+    def _run(db, sql):
+        data, _, err = clients[db].execute(sql)
+        if err and not report["error"][db]:
+            report["error"][db] = err
+        return data
+
+    wm_now = {"oracle": None, "snowflake": None}
+    if cfg["watermark_col"]:
+        for db in clients:
+            data = _run(db, f"SELECT MAX({cfg['watermark_col']}) AS MT_WM FROM {tables[db]}" + _where(where))
+            if data:
+                wm_now[db] = _wm_encode(list(data[0].values())[0])
+    report["watermark"]["current"] = wm_now
+    if prev:
+        report["watermark"]["previous"] = prev.get("watermark")
+
+    dirty = set(range(buckets))
+    if not full:
+        dirty = set()
+        prev_wm = prev.get("watermark") or {}
+        for db in clients:
+            if not prev_wm.get(db):
+                dirty = set(range(buckets))
+                break
+            bx = bucket_expr(db, keys, buckets)
+            cond = f"{cfg['watermark_col']} >= {_wm_literal(db, prev_wm[db])}"
+            data = _run(db, f"SELECT DISTINCT {bx} AS {BUCKET_COL} FROM {tables[db]}" + _and(where, cond))
+            dirty |= {int(_pop_bucket(dict(r)) or 0) for r in data}
+        if verify_counts and len(dirty) < buckets:
+            for db in clients:
+                bx = bucket_expr(db, keys, buckets)
+                data = _run(db, f"SELECT {bx} AS {BUCKET_COL}, COUNT(*) AS MT_CNT FROM {tables[db]}" + _where(where) + f" GROUP BY {bx}")
+                counts = {}
+                for r in data:
+                    r = dict(r)
+                    b = _pop_bucket(r)
+                    counts[b] = int(list(r.values())[0] or 0)
+                stored = (prev.get("checksums") or {}).get(db) or {}
+                for b in range(buckets):
+                    if counts.get(b, 0) != int((stored.get(str(b)) or {}).get("count") or 0):
+                        dirty.add(b)
+        report["mode"] = "incremental"
+    if report["error"]["oracle"] or report["error"]["snowflake"]:
+        report["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+        return report
+
+    rows_by_bucket = {"oracle": {}, "snowflake": {}}
+    fresh = {"oracle": {}, "snowflake": {}}
+    seen_cols = dict((prev or {}).get("row_columns") or {"oracle": [], "snowflake": []})
+    if dirty:
+        only = None if len(dirty) == buckets else dirty
+        for db in clients:
+            data = _run(db, _select_buckets(db, tables[db], keys, buckets, columns, where, only))
+            report["rows_fetched"][db] = len(data)
+            if data:
+                seen_cols[db] = [k for k in data[0].keys() if k.upper() != BUCKET_COL]
+            for r in data:
+                r = dict(r)
+                b = _pop_bucket(r)
+                rows_by_bucket[db].setdefault(b, []).append(r)
+                fresh[db].setdefault(b, RowDigest()).add_row(normalize_row(r, normalize))
+    if report["error"]["oracle"] or report["error"]["snowflake"]:
+        report["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+        return report
+    report["buckets_rechecked"] = len(dirty)
+
+    prev_sums = (prev or {}).get("checksums") or {}
+    prev_status = (prev or {}).get("bucket_match") or {}
+    checksums = {"oracle": {}, "snowflake": {}}
+    for db in clients:
+        for b in range(buckets):
+            old = RowDigest.from_dict((prev_sums.get(db) or {}).get(str(b)))
+            new = fresh[db].get(b, RowDigest()) if b in dirty else old
+            checksums[db][str(b)] = new.to_dict()
+            if prev and new != old:
+                report["drift"][db].append({"bucket": b, "previous_rows": old.count, "rows": new.count})
+
+    bucket_match = {}
+    for b in range(buckets):
+        if b not in dirty:
+            bucket_match[str(b)] = prev_status.get(str(b), True)
+            continue
+        if fresh["oracle"].get(b, RowDigest()) == fresh["snowflake"].get(b, RowDigest()):
+            bucket_match[str(b)] = True
+            continue
+        part = compare_rows(
+            rows_by_bucket["oracle"].get(b, []),
+            rows_by_bucket["snowflake"].get(b, []),
+            normalize,
+            pk_cols=",".join(keys),
+            num_tol=num_tol,
+            max_samples=None,
+        )
+        ok = bool(part["row_match"]) and not part["samples_mismatch"]
+        bucket_match[str(b)] = ok
+        report["missing_keys_in_target"].extend(part["missing_keys_in_target"])
+        report["missing_keys_in_source"].extend(part["missing_keys_in_source"])
+        for m in part["samples_mismatch"]:
+            m["bucket"] = b
+            report["samples_mismatch"].append(m)
+
+    report["mismatched_buckets"] = sorted(int(b) for b, ok in bucket_match.items() if not ok)
+    report["row_match"] = not report["mismatched_buckets"]
+    o_set = {c.lower() for c in seen_cols.get("oracle") or []}
+    s_set = {c.lower() for c in seen_cols.get("snowflake") or []}
+    report["source_columns"] = seen_cols.get("oracle") or []
+    report["target_columns"] = seen_cols.get("snowflake") or []
+    report["columns_match"] = o_set == s_set
+    report["column_diff"]["missing_in_target"] = sorted(list(o_set - s_set))
+    report["column_diff"]["missing_in_source"] = sorted(list(s_set - o_set))
+    report["source_rows"] = sum(d["count"] for d in checksums["oracle"].values())
+    report["target_rows"] = sum(d["count"] for d in checksums["snowflake"].values())
+    report["missing_keys_in_target"] = report["missing_keys_in_target"][:50]
+    report["missing_keys_in_source"] = report["missing_keys_in_source"][:50]
+    report["samples_mismatch"] = report["samples_mismatch"][:50]
+
+    store.save(src_table, tgt_table, {
+        "config": cfg,
+        "updated_at": datetime.utcnow().isoformat(),
+        "watermark": wm_now,
+        "checksums": checksums,
+        "bucket_match": bucket_match,
+        "row_columns": seen_cols,
+    })
+    report["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+    return report
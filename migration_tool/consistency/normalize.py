@@ -0,0 +1,76 @@
+import unicodedata
+from datetime import datetime, date, timedelta
+
+
+def make_normalizer(ignore_case=True, trunc_ts=True, nfkc_norm=True, tz_offset_min=0.0):
+    """
+    Returns a value normalizer bound to the consistency options of the UI.
+    Epoch numbers and date-like strings become datetimes, other numbers become
+    floats, strings are NFKC-normalized / lower-cased when requested.
+    """
+    try:
+        off = int(tz_offset_min)
+    except Exception:
+        off = 0
+
+    def _shift(t):
+        d = t.replace(microsecond=0) if trunc_ts else t
+        return d + timedelta(minutes=off) if off != 0 else d
+
+    def _normalize(v):
+        if v is None:
+            return None
+        if isinstance(v, (int, float)):
+            x = float(v)
+            t = None
+            if x >= 1e11:
+                t = datetime.utcfromtimestamp(x / 1000.0)
+            elif x >= 1e9:
+                t = datetime.utcfromtimestamp(x)
+            if t is not None:
+                return _shift(t)
+            return x
+        if isinstance(v, datetime):
+            return _shift(v)
+        if isinstance(v, date):
+            return _shift(datetime(v.year, v.month, v.day))
+        if isinstance(v, str):
+            s0 = v.strip()
+            t = None
+            try:
+                t = datetime.fromisoformat(s0)
+            except Exception:
+                t = None
+            if t is None:
+                try:
+                    t = datetime.strptime(s0, "%Y-%m-%d")
+                except Exception:
+                    t = None
+            if t is not None:
+                return _shift(t)
+            s = unicodedata.normalize("NFKC", v) if nfkc_norm else v
+            return s.lower() if ignore_case else s
+        try:
+            return float(v)
+        except Exception:
+            s = str(v)
+            s = unicodedata.normalize("NFKC", s) if nfkc_norm else s
+            return s.lower() if ignore_case else s
+
+    return _normalize
+
+
+def normalize_row(row: dict, normalize):
+    return {k.lower(): normalize(v) for k, v in row.items()}
+
+
+def rows_differ(so: dict, stg: dict, num_tol=0.0):
+    for k in sorted(set(so.keys()) | set(stg.keys())):
+        a = so.get(k)
+        b = stg.get(k)
+        if isinstance(a, float) and isinstance(b, float) and num_tol > 0:
+            if abs(a - b) > num_tol:
+                return True
+        elif a != b:
+            return True
+    return False
@@ -0,0 +1,218 @@
+import time
+
+from migration_tool.consistency.catalog import describe_columns
+
+_NUMERIC = ("NUMBER", "NUMERIC", "DECIMAL", "INT", "INTEGER", "BIGINT", "SMALLINT", "TINYINT", "BYTEINT", "FLOAT", "DOUBLE", "REAL", "BINARY_FLOAT", "BINARY_DOUBLE")
+_TEXT = ("VARCHAR2", "NVARCHAR2", "VARCHAR", "CHAR", "NCHAR", "CHARACTER", "STRING", "TEXT")
+_LOB = ("CLOB", "NCLOB", "BLOB", "LONG", "RAW", "BFILE", "BINARY", "VARBINARY", "VARIANT", "OBJECT", "ARRAY", "GEOGRAPHY", "GEOMETRY", "XMLTYPE")
+
+
+def column_kind(data_type: str):
+    t = (data_type or "").upper().split("(")[0].strip()
+    if t in _LOB or t.startswith("LONG"):
+        return "lob"
+    if t in _NUMERIC:
+        return "numeric"
+    if t in _TEXT:
+        return "text"
+    if t.startswith("DATE") or t.startswith("TIMESTAMP") or t.startswith("TIME"):
+        return "temporal"
+    return "other"
+
+
+# Oracle rejects more than 1000 select-list expressions (ORA-01792); stay well below it
+MAX_SELECT_EXPRS = 900
+
+
+def _column_exprs(i: int, name: str, kind: str):
+    parts = [f"COUNT({name}) AS NN{i}"]
+    if kind == "lob":
+        return parts
+    parts.append(f"MIN({name}) AS MN{i}")
+    parts.append(f"MAX({name}) AS MX{i}")
+    parts.append(f"APPROX_COUNT_DISTINCT({name}) AS ND{i}")
+    if kind == "numeric":
+        parts.append(f"SUM({name}) AS SM{i}")
+        parts.append(f"AVG({name}) AS AV{i}")
+    elif kind == "text":
+        parts.append(f"MAX(LENGTH({name})) AS ML{i}")
+    return parts
+
+
+def profile_sqls(table: str, columns, where: str = "", max_exprs: int = MAX_SELECT_EXPRS):
+    """
+    Aggregate SELECTs over the whole table, as few as fit max_exprs select
+    expressions each. Aliases are positional over all columns (N0, MN0, ...)
+    to stay within Oracle identifier limits, so the rows merge by key.
+    """
+    w = (where or "").strip()
+    tail = f" FROM {table}" + (f" WHERE {w}" if w else "")
+    out = []
+    parts = ["COUNT(*) AS ROW_CNT"]
+    for i, (name, kind) in enumerate(columns):
+        exprs = _column_exprs(i, name, kind)
+        if len(parts) > 1 and len(parts) + len(exprs) > max_exprs:
+            out.append(f"SELECT {', '.join(parts)}" + tail)
+            parts = ["COUNT(*) AS ROW_CNT"]
+        parts.extend(exprs)
+    out.append(f"SELECT {', '.join(parts)}" + tail)
+    return out
+
+
+def profile_sql(table: str, columns, where: str = ""):
+    """One aggregate SELECT over the whole table (see profile_sqls for wide tables)."""
+    return profile_sqls(table, columns, where, max_exprs=10 ** 9)[0]
+
+
+def _run_profile(client, sqls):
+    """Executes the profile statements and merges their single rows; (row, error)."""
+    row = {}
+    for sql in sqls:
+        data, _, err = client.execute(sql)
+        if err:
+            return None, err
+        row.update(data[0] if data else {})
+    return row, None
+
+
+def _unpack(row: dict, columns):
+    r = {k.upper(): v for k, v in (row or {}).items()}
+    total = int(r.get("ROW_CNT") or 0)
+    out = {}
+    for i, (name, kind) in enumerate(columns):
+        nn = int(r.get(f"NN{i}") or 0)
+        p = {"count": total, "null_count": total - nn}
+        if kind != "lob":
+            p["min"] = r.get(f"MN{i}")
+            p["max"] = r.get(f"MX{i}")
+            p["distinct"] = int(r.get(f"ND{i}") or 0)
+        if kind == "numeric":
+            p["sum"] = r.get(f"SM{i}")
+            p["avg"] = r.get(f"AV{i}")
+        elif kind == "text":
+            p["max_len"] = r.get(f"ML{i}")
+        out[name.lower()] = p
+    return total, out
+
+
+def _to_float(v):
+    try:
+        return None if v is None else float(v)
+    except Exception:
+        return None
+
+
+def diff_profiles(src: dict, tgt: dict, normalize, num_tol: float = 0.0, distinct_tol: float = 0.02):
+    """
+    Returns the list of stat names that differ for one column. Min/max go
+    through the consistency normalizer; distinct counts are approximate on
+    both sides, so they only differ beyond distinct_tol (relative).
+    """
+    diffs = []
+    for k in ("count", "null_count", "max_len"):
+        if k in src and k in tgt and src.get(k) != tgt.get(k):
+            diffs.append(k)
+    for k in ("min", "max"):
+        if k not in src or k not in tgt:
+            continue
+        a = normalize(src.get(k))
+        b = normalize(tgt.get(k))
+        if isinstance(a, float) and isinstance(b, float):
+            if abs(a - b) > num_tol:
+                diffs.append(k)
+        elif a != b:
+            diffs.append(k)
+    if "distinct" in src and "distinct" in tgt:
+        a, b = src["distinct"], tgt["distinct"]
+        if abs(a - b) > distinct_tol * max(a, b, 1):
+            diffs.append("distinct")
+    for k in ("sum", "avg"):
+        if k not in src or k not in tgt:
+            continue
+        a = _to_float(src.get(k))
+        b = _to_float(tgt.get(k))
+        if a is None or b is None:
+            if a != b:
+                diffs.append(k)
+            continue
+        tol = num_tol * max(int(src.get("count") or 0), 1) if k == "sum" else num_tol
+        if abs(a - b) > max(tol, 1e-9 * max(abs(a), abs(b), 1.0)):
+            diffs.append(k)
+    return diffs
+
+
+def profile_compare(o_client, s_client, src_table: str, tgt_table: str, normalize, where: str = "", num_tol: float = 0.0, distinct_tol: float = 0.02):
+    """
+    Profiles every column shared by both tables with one aggregate query per
+    side, split into several for wide tables (count, nulls, min/max,
+    approximate distinct, sum/avg for numbers, max length for strings) and
+    diffs the profiles column by column.
+    """
+    start = time.perf_counter()
+    report = {
+        "source_error": None,
+        "target_error": None,
+        "row_count": {"oracle": None, "snowflake": None},
+        "missing_in_target": [],
+        "missing_in_source": [],
+        "columns": [],
+        "mismatched_columns": [],
+        "match": None,
+        "sql": {"oracle": None, "snowflake": None},
+        "elapsed_ms": 0,
+    }
+    o_cols, o_err = describe_columns(o_client, "oracle", src_table)
+    s_cols, s_err = describe_columns(s_client, "snowflake", tgt_table)
+    if o_err or s_err or not o_cols or not s_cols:
+        report["source_error"] = o_err or (None if o_cols else f"no columns found for {src_table}")
+        report["target_error"] = s_err or (None if s_cols else f"no columns found for {tgt_table}")
+        return report
+    s_map = {n.lower(): (n, t) for n, t in s_cols}
+    o_map = {n.lower(): (n, t) for n, t in o_cols}
+    report["missing_in_target"] = sorted(set(o_map) - set(s_map))
+    report["missing_in_source"] = sorted(set(s_map) - set(o_map))
+    common = [n.lower() for n, _ in o_cols if n.lower() in s_map]
+    o_spec = []
+    s_spec = []
+    for c in common:
+        ok, sk = column_kind(o_map[c][1]), column_kind(s_map[c][1])
+        kind = ok if ok == sk else ("lob" if "lob" in (ok, sk) else "other")
+        o_spec.append((o_map[c][0], kind))
+        s_spec.append((s_map[c][0], kind))
+    o_sqls = profile_sqls(src_table, o_spec, where)
+    s_sqls = profile_sqls(tgt_table, s_spec, where)
+    report["sql"]["oracle"] = ";\n".join(o_sqls)
+    report["sql"]["snowflake"] = ";\n".join(s_sqls)
+    o_row, o_err = _run_profile(o_client, o_sqls)
+    s_row, s_err = _run_profile(s_client, s_sqls)
+    report["source_error"] = o_err
+    report["target_error"] = s_err
+    if o_err or s_err:
+        report["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+        return report
+    o_total, o_prof = _unpack(o_row, o_spec)
+    s_total, s_prof = _unpack(s_row, s_spec)
+    report["row_count"] = {"oracle": o_total, "snowflake": s_total}
+    for (name, kind), c in zip(o_spec, common):
+        a = o_prof.get(c) or {}
+        b = s_prof.get(c) or {}
+        diffs = diff_profiles(a, b, normalize, num_tol, distinct_tol)
+        report["columns"].append({
+            "column": c,
+            "kind": kind,
+            "source_type": o_map[c][1],
+            "target_type": s_map[c][1],
+            "source": a,
+            "target": b,
+            "diffs": diffs,
+        })
+        if diffs:
+            report["mismatched_columns"].append(c)
+    report["match"] = (
+        o_total == s_total
+        and not report["mismatched_columns"]
+        and not report["missing_in_target"]
+        and not report["missing_in_source"]
+    )
+    report["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+    return report
@@ -0,0 +1,86 @@
+import math
+import time
+from statistics import NormalDist
+
+from migration_tool.consistency.compare import compare_rows, split_cols
+from migration_tool.consistency.hashing import hash_expr
+
+
+def sample_sql(dialect: str, table: str, key_cols, modulus: int, residue: int = 0, columns: str = "*", where: str = ""):
+    """SELECT of the rows whose key hash falls in residue class `residue` mod `modulus`."""
+    cols = (columns or "").strip() or "*"
+    cond = f"MOD({hash_expr(dialect, key_cols)}, {int(modulus)}) = {int(residue)}"
+    w = (where or "").strip()
+    return f"SELECT {cols} FROM {table} WHERE " + (f"({w}) AND {cond}" if w else cond)
+
+
+def wilson_interval(failures: int, n: int, confidence: float = 0.95):
+    if n <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    p = failures / n
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def sampled_compare(
+    o_client,
+    s_client,
+    src_table: str,
+    tgt_table: str,
+    key_cols: str,
+    normalize,
+    modulus: int = 100,
+    residue: int = 0,
+    columns: str = "*",
+    where: str = "",
+    num_tol: float = 0.0,
+    confidence: float = 0.95,
+):
+    """
+    Compares the same ~1/modulus slice of both tables, selected by a key hash
+    that Oracle and Snowflake compute identically, through the regular keyed
+    comparison, and extrapolates a mismatch rate with a Wilson score interval.
+    """
+    keys = split_cols(key_cols)
+    modulus = max(1, int(modulus or 1))
+    residue = int(residue or 0) % modulus
+    src_sql = sample_sql("oracle", src_table, keys, modulus, residue, columns, where)
+    tgt_sql = sample_sql("snowflake", tgt_table, keys, modulus, residue, columns, where)
+    start = time.perf_counter()
+    o_data, o_ms, o_err = o_client.execute(src_sql)
+    s_data, s_ms, s_err = s_client.execute(tgt_sql)
+    report = {
+        "source_sql": src_sql,
+        "target_sql": tgt_sql,
+        "source_error": o_err,
+        "target_error": s_err,
+        "elapsed_ms": {"oracle": o_ms, "snowflake": s_ms},
+        "sample": {"modulus": modulus, "residue": residue, "confidence": confidence},
+    }
+    if o_err or s_err or not keys:
+        report.update({"source_rows": len(o_data), "target_rows": len(s_data), "row_match": None, "columns_match": None})
+        return report
+    part = compare_rows(o_data, s_data, normalize, pk_cols=",".join(keys), num_tol=num_tol, max_samples=None)
+    sampled_keys = len(part["missing_keys_in_target"]) + len(part["missing_keys_in_source"]) + part["common_keys"]
+    bad = len(part["missing_keys_in_target"]) + len(part["missing_keys_in_source"]) + len(part["samples_mismatch"])
+    lo, hi = wilson_interval(bad, sampled_keys, confidence)
+    rate = bad / sampled_keys if sampled_keys else 0.0
+    report.update(part)
+    report["row_match"] = bad == 0
+    report["samples_mismatch"] = part["samples_mismatch"][:50]
+    report["missing_keys_in_target"] = part["missing_keys_in_target"][:50]
+    report["missing_keys_in_source"] = part["missing_keys_in_source"][:50]
+    report["sample"].update({
+        "sampled_keys": sampled_keys,
+        "mismatched_keys": bad,
+        "mismatch_rate": rate,
+        "rate_low": lo,
+        "rate_high": hi,
+        "estimated_total_keys": sampled_keys * modulus,
+        "estimated_mismatched_keys": int(round(rate * sampled_keys * modulus)),
+        "elapsed_ms": int((time.perf_counter() - start) * 1000),
+    })
+    return report
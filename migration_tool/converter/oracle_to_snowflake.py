@@ -1,28 +1,14 @@
 import re
 import json
+import time
 
-
-def _apply_regex(s: str, items):
-    for it in items or []:
-        p = it.get("pattern")
-        r = it.get("repl")
-        if p is None or r is None:
-            continue
-        s = re.sub(p, r, s, flags=re.IGNORECASE)
-    return s
+from migration_tool.converter.rule_registry import CompiledRules, compile_rules
+from migration_tool.metrics import CONVERT_SECONDS, CONVERT_WARNINGS
 
 
-def _apply_replacements(s: str, items):
-    for it in items or []:
-        if isinstance(it, (list, tuple)) and len(it) == 2:
-            p, r = it
-            s = re.sub(p, r, s, flags=re.IGNORECASE)
-        elif isinstance(it, dict):
-            p = it.get("pattern")
-            r = it.get("repl")
-            if p is None or r is None:
-                continue
-            s = re.sub(p, r, s, flags=re.IGNORECASE)
+def _apply(s: str, compiled):
+    for rx, repl in compiled:
+        s = rx.sub(repl, s)
     return s
 
 
@@ -73,24 +59,29 @@ def _default_rules():
     }
 
 
-def convert(sql: str, rules: dict | None = None):
+_BASE = CompiledRules(_default_rules())
+_NONE = CompiledRules({})
+
+
+def convert(sql: str, rules: dict | CompiledRules | None = None):
+    """
+    Rule-based Oracle → Snowflake conversion: built-in defaults, then the
+    user rules (a dict or CompiledRules). rules=None applies the built-ins
+    only; pass get_registry().current() for the live, hot-reloaded rules.json.
+    """
+    start = time.perf_counter()
     warnings = []
     s = sql or ""
 
-    base = _default_rules()
-    user = rules or {}
+    user = _NONE if rules is None else compile_rules(rules)
 
-    s = _apply_replacements(s, base.get("replacements"))
-    s = _apply_regex(s, base.get("regex"))
-    s = _apply_replacements(s, user.get("replacements"))
-    s = _apply_regex(s, user.get("regex"))
+    s = _apply(s, _BASE.replacements)
+    s = _apply(s, _BASE.regex)
+    s = _apply(s, user.replacements)
+    s = _apply(s, user.regex)
 
-    for it in (base.get("warnings") or []) + (user.get("warnings") or []):
-        p = it.get("pattern")
-        m = it.get("message")
-        if not p or not m:
-            continue
-        if re.search(p, s, flags=re.IGNORECASE):
+    for rx, m in _BASE.warnings + user.warnings:
+        if rx.search(s):
             warnings.append(m)
 
     dm = re.search(r"\bDECODE\s*\(([^)]*)\)", s, flags=re.IGNORECASE)
@@ -111,4 +102,7 @@ def convert(sql: str, rules: dict | None = None):
                r"DATE DEFAULT CURRENT_DATE()", s, flags=re.IGNORECASE)
     s = re.sub(r"(\bDATE\b)(\s+DEFAULT\s+SYSDATE\b)", r"DATE DEFAULT CURRENT_DATE()", s, flags=re.IGNORECASE)
 
+    CONVERT_SECONDS.observe(time.perf_counter() - start)
+    if warnings:
+        CONVERT_WARNINGS.inc(len(warnings))
     return s.strip(), warnings
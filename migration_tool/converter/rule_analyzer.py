@@ -0,0 +1,150 @@
+import re
+
+from migration_tool.converter.oracle_to_snowflake import _default_rules, convert
+from migration_tool.converter.rule_registry import CompiledRules
+
+_JS_BACKREF = re.compile(r"\$\d")
+
+
+def _steps(rules: dict, origin: str):
+    """Ordered (label, pattern, repl) of the rewriting rules in the order convert() applies them."""
+    out = []
+    for i, it in enumerate(rules.get("replacements") or []):
+        if isinstance(it, (list, tuple)) and len(it) == 2:
+            out.append((f"{origin}.replacements[{i}]", it[0], it[1]))
+        elif isinstance(it, dict) and it.get("pattern") is not None and it.get("repl") is not None:
+            out.append((f"{origin}.replacements[{i}]", it["pattern"], it["repl"]))
+    for i, it in enumerate(rules.get("regex") or []):
+        if it.get("pattern") is not None and it.get("repl") is not None:
+            out.append((f"{origin}.regex[{i}]", it["pattern"], it["repl"]))
+    return out
+
+
+def _outputs(corpus, rules):
+    res = []
+    for sql in corpus:
+        out, warnings = convert(sql, rules)
+        res.append((out, tuple(sorted(set(warnings)))))
+    return res
+
+
+def _without(rules: dict, labels):
+    """Copy of user rules minus the entries named by labels ("rules.regex[3]")."""
+    drop = set(labels)
+    out = {}
+    for key in ("replacements", "regex", "warnings"):
+        out[key] = [it for i, it in enumerate(rules.get(key) or []) if f"rules.{key}[{i}]" not in drop]
+    for k, v in rules.items():
+        if k not in out:
+            out[k] = v
+    return out
+
+
+def analyze_rules(rules: dict, corpus, minimize: bool = True, drop_unmatched: bool = False):
+    """
+    Runs the built-in and user rules over a corpus of Oracle SQL and reports
+    per rule: how often it fires, whether it is an exact duplicate of an
+    earlier rule, whether it is shadowed (its pattern matches the input but
+    an earlier rule always rewrites the match away first), whether it never
+    matches at all, and $1-style backreferences Python re emits literally.
+    With minimize, user rules are greedily dropped while the converted
+    output and warning set of every corpus statement stay identical; the
+    result is returned as minimal_rules (same order). Only user rules are
+    candidates, built-ins live in code. Rules whose pattern matches nothing
+    in the corpus are kept unless drop_unmatched, since the corpus cannot
+    vouch for them.
+    """
+    corpus = [s for s in corpus if s]
+    base_steps = _steps(_default_rules(), "default")
+    user_steps = _steps(rules, "rules")
+    steps = base_steps + user_steps
+    compiled = []
+    report = []
+    seen = {}
+    for label, pattern, repl in steps:
+        entry = {"rule": label, "pattern": pattern, "repl": repl, "fires": 0, "matches_input": 0,
+                 "duplicate_of": None, "shadowed_by": None, "issues": []}
+        try:
+            rx = re.compile(pattern, re.IGNORECASE)
+        except re.error as e:
+            rx = None
+            entry["issues"].append(f"pattern does not compile: {e}")
+        key = (pattern, repl)
+        if key in seen:
+            entry["duplicate_of"] = seen[key]
+            entry["issues"].append(f"duplicate of {seen[key]}")
+        else:
+            seen[key] = label
+        if _JS_BACKREF.search(repl):
+            entry["issues"].append("repl uses $1-style backreferences, which Python re inserts literally; use \\1")
+        compiled.append(rx)
+        report.append(entry)
+
+    shadow_votes = [dict() for _ in steps]
+    for sql in corpus:
+        s = sql
+        for j, rx in enumerate(compiled):
+            if rx is not None and rx.search(sql):
+                report[j]["matches_input"] += 1
+        matched = [rx is not None and rx.search(sql) is not None for rx in compiled]
+        for i, rx in enumerate(compiled):
+            if rx is None:
+                continue
+            new = rx.sub(steps[i][2], s)
+            if new != s:
+                report[i]["fires"] += 1
+                # Later rules whose match this rewrite removed
+                for j in range(i + 1, len(compiled)):
+                    if matched[j] and compiled[j] is not None and compiled[j].search(s) and not compiled[j].search(new):
+                        shadow_votes[j][steps[i][0]] = shadow_votes[j].get(steps[i][0], 0) + 1
+                        matched[j] = False
+            s = new
+
+    for j, entry in enumerate(report):
+        if entry["fires"]:
+            continue
+        if entry["matches_input"] and shadow_votes[j]:
+            entry["shadowed_by"] = max(shadow_votes[j], key=shadow_votes[j].get)
+            entry["issues"].append(f"shadowed by {entry['shadowed_by']}")
+        elif entry["duplicate_of"] is None:
+            entry["issues"].append("never fires on the corpus")
+
+    result = {
+        "corpus_size": len(corpus),
+        "rules": report,
+        "user_rules": len(user_steps),
+        "removed": [],
+        "minimal_rules": None,
+    }
+    if not minimize:
+        return result
+
+    baseline = _outputs(corpus, rules)
+    removed = []
+    # Try the obvious candidates first so the greedy pass keeps the earliest of equivalent rules
+    user_entries = report[len(base_steps):]
+    order = sorted(
+        range(len(user_entries)),
+        key=lambda k: (user_entries[k]["duplicate_of"] is None, user_entries[k]["shadowed_by"] is None, user_entries[k]["fires"] > 0, -k),
+    )
+    for k in order:
+        e = user_entries[k]
+        if not drop_unmatched and not e["matches_input"] and not e["fires"] and e["duplicate_of"] is None:
+            continue
+        trial = removed + [e["rule"]]
+        if _outputs(corpus, _without(rules, trial)) == baseline:
+            removed = trial
+    warn_drop = []
+    for i, w in enumerate(rules.get("warnings") or []):
+        if w in (_default_rules().get("warnings") or []):
+            warn_drop.append(f"rules.warnings[{i}]")
+    if warn_drop and _outputs(corpus, _without(rules, removed + warn_drop)) == baseline:
+        removed += warn_drop
+    minimal = _without(rules, removed)
+    result["removed"] = sorted(removed, key=lambda l: (l.split("[")[0], int(l.split("[")[1].rstrip("]"))))
+    result["minimal_rules"] = minimal
+    before = CompiledRules(rules)
+    after = CompiledRules(minimal)
+    result["scans_before"] = len(before.replacements) + len(before.regex)
+    result["scans_after"] = len(after.replacements) + len(after.regex)
+    return result
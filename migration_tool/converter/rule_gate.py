@@ -0,0 +1,196 @@
+import json
+import multiprocessing
+import os
+import re
+import time
+
+from migration_tool.converter.oracle_to_snowflake import convert
+from migration_tool.converter.rule_history import get_history_store
+from migration_tool.converter.rule_registry import get_registry
+
+GOLDEN_CORPUS_PATH = os.path.join(os.path.dirname(__file__), "golden_corpus.json")
+
+_GROUP_REF = re.compile(r"\\(\d+)|\\g<([^>]*)>")
+
+# Inputs that make nested/ambiguous quantifiers backtrack badly; a rule must stay fast on them too
+_STRESS_INPUTS = [
+    "SELECT NVL(" + "a," * 4000 + " FROM t",
+    "SELECT " + "(" * 500 + "x" + " " * 4000,
+    "SELECT '" + "a" * 8000,
+    "DECODE(" + "x, " * 3000,
+    "TO_CHAR(" + " " * 6000 + "x",
+    "NVL(" + "a" * 28 + "!",
+    "SELECT " + "ab " * 14 + "!",
+    "'" + "x" * 28 + "\n" * 2,
+]
+
+
+def with_rule(rules: dict | None, proposal: dict):
+    """Copy of rules with an optimizer proposal appended the way apply_rule stores it."""
+    out = {k: list(v) for k, v in (rules or {}).items() if isinstance(v, list)}
+    for k in ("replacements", "regex", "warnings"):
+        out.setdefault(k, [])
+    if proposal.get("type") == "regex":
+        new_rule = {"pattern": proposal["pattern"], "repl": proposal["repl"]}
+        if new_rule not in out["regex"]:
+            out["regex"].append(new_rule)
+    elif proposal.get("type") == "replacement":
+        new_rule = [proposal["pattern"], proposal["repl"]]
+        if new_rule not in out["replacements"]:
+            out["replacements"].append(new_rule)
+    return out
+
+
+def validate_rule(proposal: dict):
+    """Static checks on a proposal: known type, pattern compiles, repl only references existing groups."""
+    errors = []
+    if not isinstance(proposal, dict) or proposal.get("type") not in ("regex", "replacement"):
+        return ["rule type must be 'regex' or 'replacement'"]
+    p = proposal.get("pattern")
+    r = proposal.get("repl")
+    if not isinstance(p, str) or not p:
+        errors.append("pattern is empty")
+    if not isinstance(r, str):
+        errors.append("repl must be a string")
+    if errors:
+        return errors
+    try:
+        rx = re.compile(p, re.IGNORECASE)
+    except re.error as e:
+        return [f"pattern does not compile: {e}"]
+    if rx.fullmatch("") is not None:
+        errors.append("pattern matches the empty string")
+    for m in _GROUP_REF.finditer(r):
+        if m.group(1) is not None and int(m.group(1)) > rx.groups:
+            errors.append(f"repl references group \\{m.group(1)} but pattern has {rx.groups} groups")
+        elif m.group(2) is not None and not (m.group(2).isdigit() and int(m.group(2)) <= rx.groups) and m.group(2) not in rx.groupindex:
+            errors.append(f"repl references unknown group \\g<{m.group(2)}>")
+    if re.search(r"\$\d", r):
+        errors.append("repl uses $1-style backreferences; Python re needs \\1")
+    return errors
+
+
+def load_corpus(path: str | None = None, history=None):
+    """[(source, index, sql)] from the golden corpus and every trigger_sql in the rule history."""
+    items = []
+    path = path or os.environ.get("MIGRATION_GOLDEN_CORPUS") or GOLDEN_CORPUS_PATH
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for i, sql in enumerate(json.load(f)):
+                items.append(("golden", i, sql))
+    history = history or get_history_store()
+    for entry_id, sql in history.trigger_sqls():
+        items.append(("history", entry_id, sql))
+    return items
+
+
+def _timed_convert(sql, rules):
+    start = time.perf_counter()
+    try:
+        out, _ = convert(sql, rules)
+        err = None
+    except Exception as e:
+        out, err = None, str(e)
+    return out, (time.perf_counter() - start) * 1000, err
+
+
+def _rule_ms(proposal, text):
+    start = time.perf_counter()
+    re.sub(proposal["pattern"], proposal["repl"], text, flags=re.IGNORECASE)
+    return (time.perf_counter() - start) * 1000
+
+
+def _replay(source, index, sql, base_rules, cand_rules, proposal):
+    """Worker: one statement converted with and without the proposal, plus the cost of the new rule alone."""
+    before, before_ms, _ = _timed_convert(sql, base_rules)
+    after, after_ms, err = _timed_convert(sql, cand_rules)
+    try:
+        rule_ms = max(_rule_ms(proposal, sql), _rule_ms(proposal, before or ""), _rule_ms(proposal, sql * 16))
+    except Exception as e:
+        rule_ms, err = 0.0, err or str(e)
+    return {
+        "source": source, "index": index, "sql": sql, "before": before, "after": after,
+        "before_ms": round(before_ms, 3), "after_ms": round(after_ms, 3), "rule_ms": round(rule_ms, 3), "error": err,
+    }
+
+
+def _stress(text, proposal):
+    try:
+        return {"source": "stress", "index": len(text), "rule_ms": round(_rule_ms(proposal, text), 3), "error": None}
+    except Exception as e:
+        return {"source": "stress", "index": len(text), "rule_ms": 0.0, "error": str(e)}
+
+
+def gate_rule(proposal: dict, rules: dict | None = None, trigger_sql: str | None = None, corpus=None,
+              max_rule_ms: float | None = None, timeout_s: float = 10.0, processes: int | None = None, allow_golden_changes: bool = False):
+    """
+    Regression and performance gate for an optimizer proposal. Replays the
+    golden corpus and every rule-history trigger_sql (plus trigger_sql)
+    through convert() with and without the rule in a process pool, and times
+    the rule alone on each statement and on backtracking stress inputs.
+    Rejects when the rule does not validate, changes golden output (unless
+    allow_golden_changes), errors, exceeds max_rule_ms on any input
+    (env MIGRATION_RULE_GATE_MAX_MS, default 25), or a replay does not finish
+    within timeout_s (the pool is terminated, so a runaway regex cannot hang
+    the caller). Returns {ok, reasons, diffs, timings, ...}.
+    """
+    if max_rule_ms is None:
+        max_rule_ms = float(os.environ.get("MIGRATION_RULE_GATE_MAX_MS", "25"))
+    report = {"ok": False, "reasons": [], "diffs": [], "timings": [], "max_rule_ms": 0.0, "budget_ms": max_rule_ms, "target_changed": None}
+    errors = validate_rule(proposal)
+    if errors:
+        report["reasons"] = errors
+        return report
+    if rules is None:
+        rules = get_registry().rules()
+    cand = with_rule(rules, proposal)
+    items = list(corpus) if corpus is not None else load_corpus()
+    if trigger_sql:
+        items.append(("target", 0, trigger_sql))
+
+    start = time.perf_counter()
+    ctx = multiprocessing.get_context("spawn")
+    pool = ctx.Pool(processes or min(len(items) + len(_STRESS_INPUTS), os.cpu_count() or 2))
+    timed_out = []
+    results = []
+    try:
+        pending = [pool.apply_async(_replay, (src, i, sql, rules, cand, proposal)) for src, i, sql in items]
+        pending += [pool.apply_async(_stress, (text, proposal)) for text in _STRESS_INPUTS]
+        deadline = time.monotonic() + timeout_s
+        for (src, i, *_), ar in zip(items + [("stress", len(t)) for t in _STRESS_INPUTS], pending):
+            try:
+                results.append(ar.get(timeout=max(0.0, deadline - time.monotonic())))
+            except multiprocessing.TimeoutError:
+                timed_out.append(f"{src}#{i}")
+    finally:
+        if timed_out:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+    report["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+
+    if timed_out:
+        report["reasons"].append(f"replay exceeded {timeout_s}s (possible catastrophic backtracking): {', '.join(timed_out)}")
+    for r in results:
+        report["timings"].append({k: r.get(k) for k in ("source", "index", "before_ms", "after_ms", "rule_ms")})
+        report["max_rule_ms"] = max(report["max_rule_ms"], r["rule_ms"])
+        if r.get("error"):
+            report["reasons"].append(f"{r['source']}#{r['index']}: {r['error']}")
+        if r["source"] == "stress":
+            continue
+        if r["before"] != r["after"]:
+            report["diffs"].append({k: r[k] for k in ("source", "index", "sql", "before", "after")})
+            if r["source"] == "golden" and not allow_golden_changes:
+                report["reasons"].append(f"golden#{r['index']} output changed")
+        if r["source"] == "target":
+            report["target_changed"] = r["before"] != r["after"]
+        if r["rule_ms"] > max_rule_ms:
+            report["reasons"].append(f"{r['source']}#{r['index']}: rule took {r['rule_ms']}ms > {max_rule_ms}ms")
+    slow = [r for r in results if r["source"] == "stress" and r["rule_ms"] > max_rule_ms]
+    if slow:
+        report["reasons"].append(f"rule took up to {max(r['rule_ms'] for r in slow)}ms on backtracking stress inputs > {max_rule_ms}ms")
+    if report["target_changed"] is False:
+        report["reasons"].append("rule does not change the conversion of its trigger SQL")
+    report["ok"] = not report["reasons"]
+    return report
@@ -0,0 +1,183 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+STATUSES = ("proposed", "applied", "rejected", "rolled_back")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    status TEXT NOT NULL,
+    trigger_sql TEXT,
+    before_conversion TEXT,
+    issues TEXT,
+    proposed_rule TEXT,
+    extra TEXT,
+    legacy_index INTEGER UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_history_status ON history(status, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_COLUMNS = ("timestamp", "trigger_sql", "before_conversion", "issues", "proposed_rule")
+
+
+def default_history_db():
+    return os.path.join(os.path.dirname(os.path.dirname(__file__)), "state", "rules_history.db")
+
+
+def legacy_history_path():
+    return os.path.join(os.path.dirname(__file__), "rules_history.json")
+
+
+class RuleHistoryStore:
+    """
+    Append-only SQLite store for optimizer rule proposals (replaces the
+    rules_history.json array). Each append is one INSERT in its own
+    transaction under WAL, so concurrent workers and processes record
+    proposals without rewriting a shared file, and a crash cannot corrupt
+    earlier entries. Entries keep the JSON shape (timestamp, trigger_sql,
+    before_conversion, issues, proposed_rule) plus id and status; only the
+    status is ever updated. migrate_json() imports the legacy file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _row(row):
+        if row is None:
+            return None
+        e = {"id": row["id"], "timestamp": row["timestamp"], "status": row["status"]}
+        e["trigger_sql"] = row["trigger_sql"]
+        e["before_conversion"] = row["before_conversion"]
+        e["issues"] = json.loads(row["issues"]) if row["issues"] else None
+        e["proposed_rule"] = json.loads(row["proposed_rule"]) if row["proposed_rule"] else None
+        e["applied"] = row["status"] == "applied"
+        if row["extra"]:
+            e.update(json.loads(row["extra"]))
+        return e
+
+    @staticmethod
+    def _values(entry: dict, status: str):
+        extra = {k: v for k, v in entry.items() if k not in _COLUMNS and k not in ("id", "status", "applied")}
+        return (
+            entry.get("timestamp") or datetime.utcnow().isoformat(),
+            status,
+            entry.get("trigger_sql"),
+            entry.get("before_conversion"),
+            json.dumps(entry.get("issues"), ensure_ascii=False) if entry.get("issues") is not None else None,
+            json.dumps(entry.get("proposed_rule"), ensure_ascii=False) if entry.get("proposed_rule") is not None else None,
+            json.dumps(extra, ensure_ascii=False, default=str) if extra else None,
+        )
+
+    def append(self, entry: dict, status: str | None = None):
+        """Records one entry; returns its id."""
+        status = status or entry.get("status") or ("applied" if entry.get("applied") else "proposed")
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO history(timestamp, status, trigger_sql, before_conversion, issues, proposed_rule, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._values(entry, status),
+            )
+            self.conn.commit()
+            return cur.lastrowid
+
+    def set_status(self, entry_id: int, status: str):
+        if status not in STATUSES:
+            raise ValueError(f"unknown status {status!r}; expected one of {STATUSES}")
+        with self._lock:
+            cur = self.conn.execute("UPDATE history SET status = ? WHERE id = ?", (status, int(entry_id)))
+            self.conn.commit()
+            return cur.rowcount > 0
+
+    def get(self, entry_id: int):
+        with self._lock:
+            return self._row(self.conn.execute("SELECT * FROM history WHERE id = ?", (int(entry_id),)).fetchone())
+
+    def list(self, status: str | None = None, limit: int | None = None, newest_first: bool = True):
+        sql = "SELECT * FROM history"
+        args = []
+        if status:
+            sql += " WHERE status = ?"
+            args.append(status)
+        sql += " ORDER BY id DESC" if newest_first else " ORDER BY id"
+        if limit:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        with self._lock:
+            return [self._row(r) for r in self.conn.execute(sql, args).fetchall()]
+
+    def counts(self):
+        with self._lock:
+            return {r[0]: r[1] for r in self.conn.execute("SELECT status, COUNT(*) FROM history GROUP BY status")}
+
+    def trigger_sqls(self):
+        """(id, trigger_sql) of every entry, oldest first."""
+        with self._lock:
+            return [(r[0], r[1]) for r in self.conn.execute("SELECT id, trigger_sql FROM history WHERE trigger_sql IS NOT NULL ORDER BY id")]
+
+    def migrate_json(self, json_path: str):
+        """
+        Imports a legacy rules_history.json array. Entries are keyed by their
+        array position, so re-running imports only entries appended since the
+        last migration. Returns the number imported.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        rows = []
+        for i, e in enumerate(history if isinstance(history, list) else []):
+            if isinstance(e, dict):
+                # The JSON file was only written right before apply_rule, so its "applied": false is stale
+                rows.append(self._values(e, "applied") + (i,))
+        with self._lock:
+            cur = self.conn.executemany(
+                "INSERT OR IGNORE INTO history(timestamp, status, trigger_sql, before_conversion, issues, proposed_rule, extra, legacy_index) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            imported = max(0, cur.rowcount)
+            self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('migrated_from', ?)", (os.path.abspath(json_path),))
+            self.conn.commit()
+            return imported
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_history_store(path: str | None = None):
+    """
+    Process-wide store per path (MIGRATION_RULES_HISTORY_DB or
+    state/rules_history.db). The legacy rules_history.json is migrated the
+    first time a store is opened in this process.
+    """
+    path = os.path.abspath(path or os.environ.get("MIGRATION_RULES_HISTORY_DB") or default_history_db())
+    with _STORES_LOCK:
+        store = _STORES.get(path)
+        if store is None:
+            store = RuleHistoryStore(path)
+            store.migrate_json(legacy_history_path())
+            _STORES[path] = store
+        return store
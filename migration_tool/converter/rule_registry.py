@@ -0,0 +1,253 @@
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from migration_tool.logstore.writer import FileLock
+
+
+class CompiledRules:
+    """
+    A rule set (replacements / regex / warnings) with every pattern compiled
+    once; invalid patterns are skipped into errors. With validate, rules that
+    fail rule_gate.validate_rule (e.g. $1-style backreferences) are skipped
+    into skipped as well, and warnings equal to one of skip_warnings are
+    dropped so they are not reported twice.
+    """
+
+    def __init__(self, rules: dict | None, generation: int | None = None, validate: bool = False, skip_warnings=()):
+        rules = rules or {}
+        self.rules = rules
+        self.generation = generation
+        self.errors = []
+        self.skipped = []
+        self.replacements = []
+        self.regex = []
+        self.warnings = []
+        check = None
+        if validate:
+            # Imported here: rule_gate imports the converter, which imports this module
+            from migration_tool.converter.rule_gate import validate_rule
+            check = validate_rule
+        for kind, it in [("replacement", it) for it in rules.get("replacements") or []] + [("regex", it) for it in rules.get("regex") or []]:
+            if isinstance(it, (list, tuple)) and len(it) == 2:
+                p, r = it
+            elif isinstance(it, dict):
+                p, r = it.get("pattern"), it.get("repl")
+            else:
+                continue
+            if check is not None and p is not None and r is not None:
+                problems = check({"type": kind, "pattern": p, "repl": r})
+                if problems:
+                    self.skipped.append(f"{p!r}: {'; '.join(problems)}")
+                    continue
+            self._add(self.replacements if kind == "replacement" else self.regex, p, r)
+        known = {(w.get("pattern"), w.get("message")) for w in skip_warnings or []}
+        for it in rules.get("warnings") or []:
+            p = it.get("pattern")
+            m = it.get("message")
+            if p and m and (p, m) not in known:
+                self._add(self.warnings, p, m)
+
+    def _add(self, target, pattern, value):
+        if pattern is None or value is None:
+            return
+        try:
+            target.append((re.compile(pattern, re.IGNORECASE), value))
+        except re.error as e:
+            self.errors.append(f"{pattern!r}: {e}")
+
+
+def compile_rules(rules):
+    return rules if isinstance(rules, CompiledRules) else CompiledRules(rules)
+
+
+def default_versions_dir():
+    return os.path.join(os.path.dirname(os.path.dirname(__file__)), "state", "rules_versions")
+
+
+def default_rules_path():
+    return os.path.join(os.path.dirname(__file__), "rules.json")
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class RuleRegistry:
+    """
+    Versioned rules.json. publish() stores the new rule set as an immutable
+    generation under versions_dir and swaps the live file in with an atomic
+    rename; rollback() republishes an earlier generation. current() returns
+    the precompiled rule set and hot-reloads it when the live file changes:
+    a stat() (mtime, size, inode) at most every check_interval seconds, so
+    long-running workers in any process pick up a new generation without a
+    restart and without re-reading the file on every conversion. The live
+    generation is compiled with validation, so invalid rules are skipped.
+    """
+
+    def __init__(self, path: str, versions_dir: str | None = None, check_interval: float = 1.0):
+        self.path = path
+        self.versions_dir = versions_dir or default_versions_dir()
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._compiled = None
+        self._stat = None
+        self._checked = 0.0
+        self.reloads = 0
+
+    def _stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _current_generation(self):
+        try:
+            with open(os.path.join(self.versions_dir, "CURRENT"), "r", encoding="utf-8") as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _load(self):
+        key = self._stat_key()
+        rules = {}
+        if key is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    rules = json.load(f)
+            except (OSError, ValueError):
+                # Half-written by a non-atomic editor: keep serving the previous set, retry next check
+                if self._compiled is not None:
+                    return
+        from migration_tool.converter.oracle_to_snowflake import _default_rules
+
+        # A broken rule in rules.json must not go live in every worker
+        self._compiled = CompiledRules(rules, self._current_generation(), validate=True, skip_warnings=_default_rules().get("warnings"))
+        self._stat = key
+        self.reloads += 1
+
+    def current(self):
+        now = time.monotonic()
+        compiled = self._compiled
+        if compiled is not None and now - self._checked < self.check_interval:
+            return compiled
+        with self._lock:
+            if self._compiled is None or (now - self._checked >= self.check_interval and self._stat_key() != self._stat):
+                self._load()
+            self._checked = now
+            return self._compiled
+
+    def rules(self):
+        """Plain dict copy of the live rule set."""
+        return json.loads(json.dumps(self.current().rules))
+
+    def versions(self):
+        """[{generation, timestamp, note, current}] oldest first."""
+        out = []
+        cur = self._current_generation()
+        if not os.path.isdir(self.versions_dir):
+            return out
+        for name in sorted(os.listdir(self.versions_dir)):
+            if not (name.endswith(".json") and name[:-5].isdigit()):
+                continue
+            try:
+                with open(os.path.join(self.versions_dir, name), "r", encoding="utf-8") as f:
+                    v = json.load(f)
+            except (OSError, ValueError):
+                continue
+            out.append({"generation": v.get("generation"), "timestamp": v.get("timestamp"), "note": v.get("note"), "current": v.get("generation") == cur})
+        return out
+
+    def get_version(self, generation: int):
+        with open(os.path.join(self.versions_dir, f"{int(generation):06d}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)["rules"]
+
+    def _next_generation(self):
+        gens = [int(n[:-5]) for n in os.listdir(self.versions_dir) if n.endswith(".json") and n[:-5].isdigit()]
+        return max(gens) + 1 if gens else 1
+
+    def _snapshot(self, generation, rules, note):
+        _write_atomic(
+            os.path.join(self.versions_dir, f"{generation:06d}.json"),
+            {"generation": generation, "timestamp": datetime.utcnow().isoformat(), "note": note, "rules": rules},
+        )
+
+    def _lock_file(self):
+        os.makedirs(self.versions_dir, exist_ok=True)
+        # One lock for publish and read-modify-publish, so neither can slip between the other's steps
+        return FileLock(os.path.join(self.versions_dir, ".lock"))
+
+    def _publish(self, rules: dict, note: str):
+        gen = self._next_generation()
+        if gen == 1 and os.path.exists(self.path):
+            # Keep whatever was live before the registry existed, so it can be rolled back to
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._snapshot(1, json.load(f), "initial")
+                gen = 2
+            except (OSError, ValueError):
+                pass
+        self._snapshot(gen, rules, note)
+        _write_atomic(self.path, rules)
+        with open(os.path.join(self.versions_dir, "CURRENT.tmp"), "w", encoding="utf-8") as f:
+            f.write(str(gen))
+        os.replace(os.path.join(self.versions_dir, "CURRENT.tmp"), os.path.join(self.versions_dir, "CURRENT"))
+        with self._lock:
+            self._checked = 0.0
+        return gen
+
+    def publish(self, rules: dict, note: str = ""):
+        """Stores rules as a new generation and makes it live; returns the generation."""
+        with self._lock_file():
+            return self._publish(rules, note)
+
+    def update(self, fn, note: str = ""):
+        """Read-modify-publish under the registry lock: fn(rules) returns the new rule set."""
+        with self._lock_file():
+            rules = {}
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    rules = json.load(f)
+            return self._publish(fn(rules), note)
+
+    def rollback(self, generation: int | None = None):
+        """Republishes an earlier generation (default: the one before the current) as a new generation."""
+        if generation is None:
+            cur = self._current_generation()
+            older = [v["generation"] for v in self.versions() if cur is None or v["generation"] < cur]
+            if not older:
+                raise ValueError("no earlier rule version to roll back to")
+            generation = max(older)
+        return self.publish(self.get_version(generation), f"rollback to #{generation}")
+
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_registry(path: str | None = None):
+    """
+    Process-wide registry for rules.json (MIGRATION_RULES_PATH to override;
+    MIGRATION_RULES_CHECK_INTERVAL sets the hot-reload stat interval).
+    """
+    path = os.path.abspath(path or os.environ.get("MIGRATION_RULES_PATH") or default_rules_path())
+    with _REGISTRIES_LOCK:
+        reg = _REGISTRIES.get(path)
+        if reg is None:
+            try:
+                interval = float(os.environ.get("MIGRATION_RULES_CHECK_INTERVAL") or 1.0)
+            except ValueError:
+                interval = 1.0
+            versions_dir = default_versions_dir() if path == os.path.abspath(default_rules_path()) else os.path.splitext(path)[0] + ".versions"
+            reg = RuleRegistry(path, versions_dir, check_interval=interval)
+            _REGISTRIES[path] = reg
+        return reg
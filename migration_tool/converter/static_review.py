@@ -0,0 +1,113 @@
+import re
+
+from migration_tool.metrics import REGISTRY
+
+STATIC_REVIEWS = REGISTRY.counter("migration_static_review_total", "Deterministic pre-reviews by outcome.", ("result",))
+
+# (pattern, issue) checked against the converted SQL with literals and comments blanked out
+RESIDUAL_CHECKS = [
+    (r"\bNVL2?\s*\(", "Oracle NVL/NVL2 left unconverted (use COALESCE / IFF)"),
+    (r"\bSYS(?:DATE|TIMESTAMP)\b", "Oracle SYSDATE/SYSTIMESTAMP left unconverted (use CURRENT_TIMESTAMP())"),
+    (r"\bROWNUM\b", "ROWNUM is not supported in Snowflake (use LIMIT or ROW_NUMBER())"),
+    (r"\bCONNECT\s+BY\b|\bSTART\s+WITH\b[^;]*\bPRIOR\b", "CONNECT BY hierarchy query needs a WITH RECURSIVE rewrite"),
+    (r"\bDECODE\s*\(", "Oracle DECODE left unconverted (use CASE)"),
+    (r"\(\s*\+\s*\)", "Oracle (+) outer join syntax needs an ANSI LEFT/RIGHT JOIN"),
+    (r"\bELSE\s+END\b", "Empty ELSE branch in CASE (DECODE without a default)"),
+    (r"\bELSE\s+[^,()]+,[^()]*?\bEND\b", "CASE ... ELSE followed by a value list (multi-pair DECODE mis-expanded)"),
+    (r"\bN?VARCHAR2\b", "Oracle VARCHAR2/NVARCHAR2 type left unconverted (use VARCHAR)"),
+    (r"\b(?:N?CLOB|BLOB|BFILE|LONG\s+RAW|RAW|U?ROWID|XMLTYPE|BINARY_(?:FLOAT|DOUBLE|INTEGER)|PLS_INTEGER|SYS_REFCURSOR)\b",
+     "Oracle-only data type left in the output"),
+]
+
+_COMPILED = [(re.compile(p, re.IGNORECASE), msg) for p, msg in RESIDUAL_CHECKS]
+
+
+def mask_sql(sql: str):
+    """
+    Returns sql with the contents of string literals, quoted identifiers and
+    comments replaced by spaces (same length), and whether a string literal
+    or block comment was left unterminated.
+    """
+    s = sql or ""
+    out = []
+    i = 0
+    n = len(s)
+    unterminated = False
+    while i < n:
+        c = s[i]
+        if c == "'":
+            j = i + 1
+            while j < n:
+                if s[j] == "'":
+                    if j + 1 < n and s[j + 1] == "'":
+                        j += 2
+                        continue
+                    break
+                j += 1
+            if j >= n:
+                unterminated = True
+                out.append("'" + " " * (n - i - 1))
+                i = n
+            else:
+                out.append("'" + " " * (j - i - 1) + "'")
+                i = j + 1
+        elif c == '"':
+            j = s.find('"', i + 1)
+            end = n if j < 0 else j + 1
+            out.append(" " * (end - i))
+            i = end
+        elif s.startswith("--", i):
+            j = s.find("\n", i)
+            end = n if j < 0 else j
+            out.append(" " * (end - i))
+            i = end
+        elif s.startswith("/*", i):
+            j = s.find("*/", i + 2)
+            if j < 0:
+                unterminated = True
+            end = n if j < 0 else j + 2
+            out.append(" " * (end - i))
+            i = end
+        else:
+            out.append(c)
+            i += 1
+    return "".join(out), unterminated
+
+
+def static_review(oracle_sql: str, snowflake_sql: str):
+    """
+    Deterministic pre-review of a conversion. Looks for Oracle leftovers
+    (NVL, SYSDATE, ROWNUM, CONNECT BY, DECODE, (+) joins, VARCHAR2, Oracle-only
+    types), unbalanced parentheses and unterminated literals in the Snowflake
+    output. Returns a review dict shaped like the Reviewer's; "clean" True
+    means nothing was found and the LLM review can be skipped.
+    """
+    masked, unterminated = mask_sql(snowflake_sql)
+    issues = []
+    if not masked.strip():
+        issues.append("Converted SQL is empty")
+    for rx, msg in _COMPILED:
+        m = rx.search(masked)
+        if m:
+            issues.append(f"{msg}: '{snowflake_sql[m.start():m.end()]}'")
+    depth = 0
+    for c in masked:
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth < 0:
+                break
+    if depth != 0:
+        issues.append("Unbalanced parentheses in converted SQL")
+    if unterminated:
+        issues.append("Unterminated string literal or comment in converted SQL")
+    clean = not issues
+    STATIC_REVIEWS.inc(result="clean" if clean else "dirty")
+    return {
+        "score": 10 if clean else max(0, 8 - 2 * len(issues)),
+        "issues": issues,
+        "suggestion": "" if clean else "Fix the residual Oracle constructs listed above.",
+        "static": True,
+        "clean": clean,
+    }
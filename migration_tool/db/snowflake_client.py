@@ -1,5 +1,7 @@
 import time
 
+from migration_tool.metrics import DB_QUERIES, DB_QUERY_SECONDS
+
 
 class SnowflakeClient:
     def __init__(self, config: dict):
@@ -43,13 +45,35 @@ class SnowflakeClient:
             cols = [c[0] for c in cur.description] if cur.description else []
             data = [dict(zip(cols, r)) for r in rows]
             elapsed_ms = int((time.perf_counter() - start) * 1000)
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, db="snowflake")
+            DB_QUERIES.inc(db="snowflake", status="ok")
             return data, elapsed_ms, None
         except snowflake.connector.errors.Error as e:
             elapsed_ms = int((time.perf_counter() - start) * 1000)
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, db="snowflake")
+            DB_QUERIES.inc(db="snowflake", status="error")
             return [], elapsed_ms, str(e)
         finally:
             cur.close()
 
+    def iter_rows(self, sql: str, batch_size: int = 10000):
+        """Yields rows as dicts via fetchmany instead of materializing the result set."""
+        if self.conn is None:
+            self.connect()
+        cur = self.conn.cursor()
+        try:
+            cur.arraysize = batch_size
+            cur.execute(sql)
+            cols = [c[0] for c in cur.description] if cur.description else []
+            while cur.description:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for r in rows:
+                    yield dict(zip(cols, r))
+        finally:
+            cur.close()
+
     def close(self):
         if self.conn is not None:
             try:
@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from migration_tool.logstore.writer import FileLock, rotated_segments
+
+_INDEX_LOCK = threading.Lock()
+
+
+def default_archive_dir(log_path: str):
+    return os.path.join(os.path.dirname(log_path), "archive")
+
+
+def _index_path(archive_dir: str):
+    return os.path.join(archive_dir, "index.json")
+
+
+def load_index(archive_dir: str):
+    p = _index_path(archive_dir)
+    if not os.path.exists(p):
+        return {"partitions": [], "segments": []}
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_index(archive_dir: str, index: dict):
+    p = _index_path(archive_dir)
+    tmp = p + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, p)
+
+
+def _day_of(e: dict):
+    ts = e.get("timestamp")
+    if isinstance(ts, str) and len(ts) >= 10:
+        try:
+            return datetime.strptime(ts[:10], "%Y-%m-%d").date().isoformat()
+        except ValueError:
+            pass
+    return "unknown"
+
+
+def segment_id(segment: str):
+    """
+    Identity of a rotated segment: its name plus inode, size and mtime, so a
+    later file that reuses the same .N suffix is not mistaken for it.
+    """
+    st = os.stat(segment)
+    tag = hashlib.blake2b(f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}".encode(), digest_size=4).hexdigest()
+    return f"{os.path.basename(segment)}.{tag}"
+
+
+def compact_segment(segment: str, archive_dir: str, seg_id: str | None = None):
+    """
+    Splits one rotated segment by event date into gzip-compressed JSONL
+    partitions (archive/date=YYYY-MM-DD/<segment id>.jsonl.gz) and returns the
+    index entries: rows, min/max timestamp and per-event counts per partition.
+    """
+    name = os.path.basename(segment)
+    seg_id = seg_id or segment_id(segment)
+    buckets = {}
+    with open(segment, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                e = json.loads(line)
+            except Exception:
+                continue
+            if isinstance(e, dict):
+                buckets.setdefault(_day_of(e), []).append((e, line))
+    entries = []
+    for day, items in sorted(buckets.items()):
+        part_dir = os.path.join(archive_dir, f"date={day}")
+        os.makedirs(part_dir, exist_ok=True)
+        path = os.path.join(part_dir, f"{seg_id}.jsonl.gz")
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as g:
+            for _, line in items:
+                g.write(line + "\n")
+        os.replace(tmp, path)
+        stamps = [e.get("timestamp") for e, _ in items if isinstance(e.get("timestamp"), str)]
+        counts = {}
+        for e, _ in items:
+            k = str(e.get("event"))
+            counts[k] = counts.get(k, 0) + 1
+        entries.append({
+            "date": day,
+            "path": os.path.relpath(path, archive_dir),
+            "segment": name,
+            "segment_id": seg_id,
+            "rows": len(items),
+            "min_ts": min(stamps) if stamps else None,
+            "max_ts": max(stamps) if stamps else None,
+            "events": counts,
+            "bytes": os.path.getsize(path),
+        })
+    return entries
+
+
+def compact_rotated(log_path: str, archive_dir: str | None = None, min_age_hours: float = 24.0, delete_source: bool = True):
+    """
+    Compacts rotated migration.log segments older than min_age_hours into the
+    partitioned archive (giving the SQLite viewer store time to sync them
+    first) and removes the raw segments. Already archived segments are
+    skipped; they are recognised by segment_id(), not by name, because
+    rotation can reuse a name once the earlier segment is gone.
+    """
+    archive_dir = archive_dir or default_archive_dir(log_path)
+    os.makedirs(archive_dir, exist_ok=True)
+    done = []
+    with _INDEX_LOCK, FileLock(os.path.join(archive_dir, "index.lock")):
+        index = load_index(archive_dir)
+        archived = set(index.get("segments") or [])
+        now = time.time()
+        for seg in rotated_segments(log_path):
+            name = os.path.basename(seg)
+            seg_id = segment_id(seg)
+            if seg_id in archived:
+                if delete_source:
+                    os.remove(seg)
+                continue
+            if now - os.path.getmtime(seg) < min_age_hours * 3600:
+                continue
+            entries = compact_segment(seg, archive_dir, seg_id)
+            index["partitions"] = [p for p in index.get("partitions") or [] if p.get("segment_id") != seg_id] + entries
+            index["segments"] = sorted(archived | {seg_id})
+            archived.add(seg_id)
+            _save_index(archive_dir, index)
+            if delete_source:
+                os.remove(seg)
+            done.append({"segment": name, "partitions": len(entries), "rows": sum(e["rows"] for e in entries)})
+    return done
+
+
+def select_partitions(archive_dir: str, start: str | None = None, end: str | None = None):
+    """Index entries whose [min_ts, max_ts] can overlap [start, end]; other partitions are never opened."""
+    out = []
+    for p in load_index(archive_dir).get("partitions") or []:
+        if start and p.get("max_ts") and p["max_ts"] < start:
+            continue
+        if end and p.get("min_ts") and p["min_ts"] > end:
+            continue
+        if (start or end) and p.get("date") == "unknown":
+            continue
+        out.append(p)
+    return sorted(out, key=lambda p: (p.get("min_ts") or "", p.get("path")))
+
+
+def iter_archived_events(archive_dir: str, start: str | None = None, end: str | None = None, events=None):
+    """Yields archived events in [start, end] (ISO strings), reading only the partitions that overlap."""
+    for p in select_partitions(archive_dir, start, end):
+        if events and not any(p.get("events", {}).get(ev) for ev in events):
+            continue
+        with gzip.open(os.path.join(archive_dir, p["path"]), "rt", encoding="utf-8") as g:
+            for line in g:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    e = json.loads(line)
+                except Exception:
+                    continue
+                ts = e.get("timestamp")
+                if start and (not isinstance(ts, str) or ts < start):
+                    continue
+                if end and (not isinstance(ts, str) or ts > end):
+                    continue
+                if events and e.get("event") not in events:
+                    continue
+                yield e
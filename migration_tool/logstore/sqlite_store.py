@@ -0,0 +1,308 @@
+import json
+import os
+import sqlite3
+import threading
+
+from migration_tool.logstore.sqltext import HASH_SUFFIX, SQL_FIELDS, event_sql, get_text_store
+from migration_tool.logstore.writer import rotated_segments
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts TEXT,
+    event TEXT,
+    has_error INTEGER NOT NULL DEFAULT 0,
+    has_warning INTEGER NOT NULL DEFAULT 0,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS idx_events_event_ts ON events(event, ts);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    inode TEXT,
+    offset INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def default_db_path(log_path: str):
+    return os.path.splitext(log_path)[0] + ".db"
+
+
+def _error_text(e: dict):
+    parts = []
+    err = e.get("error")
+    if isinstance(err, dict):
+        parts.extend(str(v) for v in err.values() if v)
+    elif err:
+        parts.append(str(err))
+    parts.extend(str(w) for w in (e.get("warnings") or []))
+    return "\n".join(parts)
+
+
+_NOT_OTHER = set(SQL_FIELDS) | {k + HASH_SUFFIX for k in SQL_FIELDS} | {"error", "warnings"}
+
+
+def _other_text(e: dict):
+    """Everything in an event that is neither SQL nor error text (tables, modes, messages, ...)."""
+    rest = {k: v for k, v in e.items() if k not in _NOT_OTHER}
+    return json.dumps(rest, ensure_ascii=False, default=str) if rest else ""
+
+
+def _has_error(e: dict):
+    err = e.get("error")
+    if isinstance(err, dict):
+        return any(err.values())
+    return bool(err)
+
+
+def _inode(path: str):
+    st = os.stat(path)
+    return f"{st.st_dev}:{st.st_ino}"
+
+
+class LogStore:
+    """
+    SQLite mirror of the JSONL migration log, indexed on timestamp and event
+    type with an FTS5 (trigram) index over SQL (interned text resolved), error
+    text and the rest of the event. sync() imports only the bytes appended
+    since the last call and follows rotation by inode.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self.fts = True
+        self._reindex = False
+        try:
+            cols = [r[1] for r in self.conn.execute("PRAGMA table_info(events_fts)")]
+            if cols and "other_text" not in cols:
+                # Index from before other_text: rebuild it on the next sync, when interned SQL can be resolved
+                self.conn.execute("DROP TABLE events_fts")
+                self._reindex = True
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(sql_text, error_text, other_text, tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            self.fts = False
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _insert_lines(self, lines, texts=None):
+        n = 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                e = json.loads(line)
+            except Exception:
+                continue
+            if not isinstance(e, dict):
+                continue
+            cur = self.conn.execute(
+                "INSERT INTO events(ts, event, has_error, has_warning, payload) VALUES (?, ?, ?, ?, ?)",
+                (e.get("timestamp"), e.get("event"), int(_has_error(e)), int(bool(e.get("warnings"))), line),
+            )
+            if self.fts:
+                self._index(cur.lastrowid, e, texts)
+            n += 1
+        return n
+
+    def _index(self, rowid, e: dict, texts=None):
+        sql_text = "\n".join(str(v) for v in (event_sql(e, k, texts) for k in SQL_FIELDS) if v)
+        self.conn.execute(
+            "INSERT INTO events_fts(rowid, sql_text, error_text, other_text) VALUES (?, ?, ?, ?)",
+            (rowid, sql_text, _error_text(e), _other_text(e)),
+        )
+
+    def _rebuild_fts(self, texts=None):
+        """Re-indexes every stored event (caller holds the lock and the transaction)."""
+        self.conn.execute("DELETE FROM events_fts")
+        for r in self.conn.execute("SELECT id, payload FROM events").fetchall():
+            try:
+                e = json.loads(r["payload"])
+            except ValueError:
+                continue
+            self._index(r["id"], e, texts)
+        self._reindex = False
+
+    def _read_from(self, path: str, offset: int):
+        """Complete lines after offset; a trailing partial line is left for the next sync."""
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n")
+        if end < 0:
+            return [], offset
+        return data[: end + 1].decode("utf-8", errors="replace").splitlines(), offset + end + 1
+
+    def import_jsonl(self, path: str, texts=None):
+        """
+        Imports a whole JSONL file (e.g. an old or rotated log) once; returns
+        rows added. texts resolves interned SQL for the full-text index. A
+        file that replaced an earlier one under the same path (different
+        inode) is imported from the start.
+        """
+        if not os.path.exists(path):
+            return 0
+        key = os.path.abspath(path)
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT inode, offset FROM sources WHERE path = ?", (key,)).fetchone()
+                offset = row["offset"] if row else 0
+                # Same name, different file (a reused rotation suffix): read it from the start
+                if row and row["inode"] and row["inode"] != _inode(path):
+                    offset = 0
+                if os.path.getsize(path) < offset:
+                    offset = 0
+                lines, new_offset = self._read_from(path, offset)
+                n = self._insert_lines(lines, texts)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sources(path, inode, offset) VALUES (?, ?, ?)", (key, _inode(path), new_offset)
+                )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return n
+
+    def sync(self, log_path: str):
+        """
+        Folds new events from the live log into the store. The first sync also
+        imports any rotated segments; if the live file was rotated since the
+        last sync, the rest of the rotated segment (found by inode) and any
+        segments rotated after it are read first.
+        """
+        key = os.path.abspath(log_path)
+        texts = get_text_store(log_path)
+        added = 0
+        with self._lock:
+            first = self.conn.execute("SELECT 1 FROM sources WHERE path = ?", (key,)).fetchone() is None
+        if first:
+            for seg in rotated_segments(log_path):
+                added += self.import_jsonl(seg, texts)
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._reindex:
+                    self._rebuild_fts(texts)
+                row = self.conn.execute("SELECT inode, offset FROM sources WHERE path = ?", (key,)).fetchone()
+                inode, offset = (row["inode"], row["offset"]) if row else (None, 0)
+                if inode and (not os.path.exists(log_path) or _inode(log_path) != inode):
+                    found = False
+                    for seg in rotated_segments(log_path):
+                        if found:
+                            lines, _ = self._read_from(seg, 0)
+                            added += self._insert_lines(lines, texts)
+                        elif _inode(seg) == inode:
+                            found = True
+                            lines, _ = self._read_from(seg, offset)
+                            added += self._insert_lines(lines, texts)
+                    offset = 0
+                if os.path.exists(log_path):
+                    if os.path.getsize(log_path) < offset:
+                        offset = 0
+                    lines, offset = self._read_from(log_path, offset)
+                    added += self._insert_lines(lines, texts)
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO sources(path, inode, offset) VALUES (?, ?, ?)", (key, _inode(log_path), offset)
+                    )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return added
+
+    def contains(self, e: dict):
+        """True if an identical event (same parsed payload) is already in the store."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT payload FROM events WHERE event IS ? AND ts IS ?", (e.get("event"), e.get("timestamp"))
+            ).fetchall()
+        for r in rows:
+            try:
+                if json.loads(r["payload"]) == e:
+                    return True
+            except ValueError:
+                continue
+        return False
+
+    def _where(self, events=None, keyword=None, start=None, end=None):
+        conds = []
+        args = []
+        if events:
+            conds.append(f"e.event IN ({', '.join('?' for _ in events)})")
+            args.extend(events)
+        if start:
+            conds.append("e.ts >= ?")
+            args.append(start)
+        if end:
+            conds.append("e.ts <= ?")
+            args.append(end)
+        kw = (keyword or "").strip()
+        if kw:
+            if self.fts and len(kw) >= 3:
+                conds.append("e.id IN (SELECT rowid FROM events_fts WHERE events_fts MATCH ?)")
+                args.append('"' + kw.replace('"', '""') + '"')
+            elif self.fts:
+                # Too short for trigrams: scan the indexed text, which includes interned SQL the payload lacks
+                conds.append(
+                    "e.id IN (SELECT rowid FROM events_fts WHERE instr(lower(sql_text), ?) > 0 "
+                    "OR instr(lower(error_text), ?) > 0 OR instr(lower(other_text), ?) > 0)"
+                )
+                args.extend([kw.lower()] * 3)
+            else:
+                conds.append("instr(lower(e.payload), ?) > 0")
+                args.append(kw.lower())
+        return (" WHERE " + " AND ".join(conds)) if conds else "", args
+
+    def count(self, events=None, keyword=None, start=None, end=None):
+        where, args = self._where(events, keyword, start, end)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM events e{where}", args).fetchone()[0]
+
+    def query(self, events=None, keyword=None, start=None, end=None, limit=200, offset=0, newest_first=True):
+        """One page of matching events, decoded."""
+        where, args = self._where(events, keyword, start, end)
+        order = "DESC" if newest_first else "ASC"
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT e.payload FROM events e{where} ORDER BY e.ts {order}, e.id {order} LIMIT ? OFFSET ?",
+                args + [int(limit), int(offset)],
+            ).fetchall()
+        return [json.loads(r["payload"]) for r in rows]
+
+    def failure_counts(self):
+        """Counts behind the error chart: failed executes and converts with errors or warnings."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT event, COUNT(*) AS n FROM events "
+                "WHERE (event = 'execute' AND has_error = 1) OR (event = 'convert' AND (has_error = 1 OR has_warning = 1)) "
+                "GROUP BY event"
+            ).fetchall()
+        names = {"execute": "执行失败", "convert": "转换失败"}
+        return {names[r["event"]]: r["n"] for r in rows}
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_store(log_path: str, db_path: str | None = None):
+    """Process-wide LogStore for a log file, kept across Streamlit reruns."""
+    db_path = db_path or default_db_path(log_path)
+    with _STORES_LOCK:
+        s = _STORES.get(db_path)
+        if s is None:
+            s = LogStore(db_path)
+            _STORES[db_path] = s
+        return s
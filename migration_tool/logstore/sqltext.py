@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+
+SQL_FIELDS = ("input_sql", "converted_sql", "executed_sql", "source_sql", "target_sql")
+HASH_SUFFIX = "_hash"
+MIN_INTERN_LEN = 64
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def sql_hash(text: str):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def default_text_path(log_path: str):
+    return os.path.splitext(log_path)[0] + ".sqltext.jsonl"
+
+
+class SqlTextStore:
+    """
+    Content-addressed side store for SQL text: an append-only JSONL file of
+    {"h": hash, "sql": text}, one line per distinct statement. Lookups load
+    new lines lazily, so a reader only pays for texts written since its last
+    miss. Duplicate lines (two processes interning the same text) are harmless.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._texts = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        if not os.path.exists(self.path):
+            return
+        if os.path.getsize(self.path) < self._offset:
+            self._texts = {}
+            self._offset = 0
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n")
+        if end < 0:
+            return
+        for line in data[: end + 1].decode("utf-8", errors="replace").splitlines():
+            try:
+                it = json.loads(line)
+            except Exception:
+                continue
+            if isinstance(it, dict) and it.get("h"):
+                self._texts[it["h"]] = it.get("sql")
+        self._offset += end + 1
+
+    def get(self, h: str):
+        with self._lock:
+            if h not in self._texts:
+                self._refresh()
+            return self._texts.get(h)
+
+    def intern(self, texts: dict):
+        """
+        Appends the {hash: text} pairs not stored yet. Callers writing events
+        that reference these hashes must hold the log's FileLock so that other
+        processes never see a reference before its text.
+        """
+        with self._lock:
+            self._refresh()
+            new = [(h, t) for h, t in texts.items() if h not in self._texts]
+            if not new:
+                return 0
+            data = "".join(json.dumps({"h": h, "sql": t}, ensure_ascii=False) + "\n" for h, t in new).encode("utf-8")
+            with open(self.path, "ab") as f:
+                f.write(data)
+            for h, t in new:
+                self._texts[h] = t
+            self._offset = os.path.getsize(self.path)
+            return len(new)
+
+    def flush_to_disk(self):
+        if os.path.exists(self.path):
+            with open(self.path, "ab") as f:
+                os.fsync(f.fileno())
+
+
+def intern_event(event: dict, min_len: int = MIN_INTERN_LEN):
+    """
+    Returns (event, texts): a shallow copy where every SQL field of at least
+    min_len characters is replaced by <field>_hash, plus the hash -> text map.
+    """
+    out = None
+    texts = {}
+    for k in SQL_FIELDS:
+        v = event.get(k)
+        if not isinstance(v, str) or len(v) < min_len:
+            continue
+        if out is None:
+            out = dict(event)
+        h = sql_hash(v)
+        texts[h] = v
+        del out[k]
+        out[k + HASH_SUFFIX] = h
+    return (out if out is not None else event), texts
+
+
+def event_sql(e: dict, field: str, store: SqlTextStore | None = None):
+    """Inline SQL of an event field, resolving an interned hash through store."""
+    v = e.get(field)
+    if v is not None or store is None:
+        return v
+    h = e.get(field + HASH_SUFFIX)
+    return store.get(h) if h else None
+
+
+def resolve_event(e: dict, store: SqlTextStore | None):
+    """Copy of an event with interned SQL fields restored inline."""
+    if store is None or not any(k + HASH_SUFFIX in e for k in SQL_FIELDS):
+        return e
+    out = dict(e)
+    for k in SQL_FIELDS:
+        h = out.pop(k + HASH_SUFFIX, None)
+        if h and out.get(k) is None:
+            out[k] = store.get(h)
+    return out
+
+
+def get_text_store(log_path: str):
+    """Process-wide SqlTextStore for a log file."""
+    path = os.path.abspath(default_text_path(log_path))
+    with _STORES_LOCK:
+        s = _STORES.get(path)
+        if s is None:
+            s = SqlTextStore(path)
+            _STORES[path] = s
+        return s
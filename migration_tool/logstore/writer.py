@@ -0,0 +1,279 @@
+import atexit
+import glob
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+from migration_tool.logstore.sqltext import get_text_store, intern_event
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+_STOP = object()
+_WRITERS = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+class FileLock:
+    """Exclusive inter-process lock on a sidecar file (flock on POSIX, msvcrt on Windows)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        else:
+            self.f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+            else:
+                self.f.seek(0)
+                msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.f.close()
+            self.f = None
+
+
+def rotated_segments(path: str):
+    """Rotated segments of a log (path.YYYY-MM-DD.N), oldest first."""
+    out = []
+    for p in glob.glob(glob.escape(path) + ".*"):
+        rest = p[len(path) + 1:]
+        parts = rest.split(".")
+        if len(parts) != 2 or not parts[1].isdigit():
+            continue
+        try:
+            day = datetime.strptime(parts[0], "%Y-%m-%d").date()
+        except ValueError:
+            continue
+        out.append((day, int(parts[1]), p))
+    return [p for _, _, p in sorted(out)]
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name) or default)
+    except ValueError:
+        return default
+
+
+class LogWriter:
+    """
+    Appends JSON events to a log file from a background thread.
+
+    write() only enqueues; the worker drains up to batch_size events per
+    wakeup and appends them with one open/write/close under an inter-process
+    lock, so several processes can share the file. Before each batch the file
+    is rotated to path.YYYY-MM-DD.N when it would exceed max_bytes or when its
+    last write happened on an earlier (UTC) day.
+
+    fsync: "always" syncs every batch, "interval" at most every fsync_interval
+    seconds, "never" leaves it to the OS.
+
+    With intern_sql, long SQL fields are moved to the log's SqlTextStore and
+    the event keeps only <field>_hash; texts are appended before the events
+    that reference them, under the same lock.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 50 * 1024 * 1024,
+        rotate_daily: bool = True,
+        backup_count: int = 0,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        fsync: str = "interval",
+        fsync_interval: float = 5.0,
+        asynchronous: bool = True,
+        intern_sql: bool = False,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.backup_count = backup_count
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.asynchronous = asynchronous
+        self.texts = get_text_store(path) if intern_sql else None
+        self.lock_path = path + ".lock"
+        self.written = 0
+        self.batches = 0
+        self.last_error = None
+        self._last_fsync = time.monotonic()
+        self._dirty = False
+        self._q = queue.Queue()
+        self._io_lock = threading.Lock()
+        self._thread = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if asynchronous:
+            self._thread = threading.Thread(target=self._run, name="migration-log-writer", daemon=True)
+            self._thread.start()
+
+    def write(self, event: dict):
+        if self.asynchronous:
+            self._q.put(event)
+        else:
+            self._write_batch([event])
+
+    def flush(self, timeout: float | None = 5.0):
+        """Blocks until everything enqueued before this call is on disk (or timeout)."""
+        if not self.asynchronous or self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._q.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float | None = 5.0):
+        if self._thread is not None and self._thread.is_alive():
+            self._q.put(_STOP)
+            self._thread.join(timeout)
+        self._sync(force=True)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._sync()
+                continue
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            events = [e for e in batch if isinstance(e, dict)]
+            if events:
+                self._write_batch(events)
+            for e in batch:
+                if isinstance(e, threading.Event):
+                    e.set()
+            if any(e is _STOP for e in batch):
+                return
+
+    def _write_batch(self, events):
+        texts = {}
+        if self.texts is not None:
+            interned = []
+            for e in events:
+                e, t = intern_event(e)
+                interned.append(e)
+                texts.update(t)
+            events = interned
+        data = "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in events).encode("utf-8")
+        try:
+            with self._io_lock, FileLock(self.lock_path):
+                if texts and self.texts.intern(texts) and self.fsync == "always":
+                    self.texts.flush_to_disk()
+                self._maybe_rotate(len(data))
+                with open(self.path, "ab") as f:
+                    f.write(data)
+                    if self.fsync == "always":
+                        f.flush()
+                        os.fsync(f.fileno())
+                    else:
+                        self._dirty = True
+            self.written += len(events)
+            self.batches += 1
+            self._sync()
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"migration log write failed: {e}", file=sys.stderr)
+
+    def _sync(self, force=False):
+        if not self._dirty or self.fsync == "never":
+            return
+        if not force and self.fsync == "interval" and time.monotonic() - self._last_fsync < self.fsync_interval:
+            return
+        try:
+            with open(self.path, "ab") as f:
+                os.fsync(f.fileno())
+        except Exception:
+            pass
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+
+    def _maybe_rotate(self, incoming: int):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if st.st_size == 0:
+            return
+        day = datetime.utcfromtimestamp(st.st_mtime).date()
+        due = self.rotate_daily and day < datetime.utcnow().date()
+        due = due or (self.max_bytes and st.st_size + incoming > self.max_bytes)
+        if not due:
+            return
+        n = 1
+        while os.path.exists(f"{self.path}.{day.isoformat()}.{n}"):
+            n += 1
+        try:
+            os.replace(self.path, f"{self.path}.{day.isoformat()}.{n}")
+        except OSError:
+            return
+        if self.backup_count:
+            for old in rotated_segments(self.path)[:-self.backup_count]:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+
+
+def get_writer(path: str):
+    """
+    Process-wide writer per log path, configured from the environment:
+    MIGRATION_LOG_MAX_BYTES, MIGRATION_LOG_ROTATE_DAILY (1/0), MIGRATION_LOG_BACKUPS,
+    MIGRATION_LOG_BATCH, MIGRATION_LOG_FSYNC (always/interval/never), MIGRATION_LOG_ASYNC (1/0),
+    MIGRATION_LOG_INTERN_SQL (1/0).
+    """
+    key = os.path.abspath(path)
+    with _WRITERS_LOCK:
+        w = _WRITERS.get(key)
+        if w is None:
+            w = LogWriter(
+                path,
+                max_bytes=_env_int("MIGRATION_LOG_MAX_BYTES", 50 * 1024 * 1024),
+                rotate_daily=os.environ.get("MIGRATION_LOG_ROTATE_DAILY", "1") != "0",
+                backup_count=_env_int("MIGRATION_LOG_BACKUPS", 0),
+                batch_size=_env_int("MIGRATION_LOG_BATCH", 500),
+                fsync=os.environ.get("MIGRATION_LOG_FSYNC") or "interval",
+                asynchronous=os.environ.get("MIGRATION_LOG_ASYNC", "1") != "0",
+                intern_sql=os.environ.get("MIGRATION_LOG_INTERN_SQL", "1") != "0",
+            )
+            _WRITERS[key] = w
+        return w
+
+
+def flush_all(timeout: float | None = 5.0):
+    for w in list(_WRITERS.values()):
+        w.flush(timeout)
+
+
+@atexit.register
+def _close_all():
+    for w in list(_WRITERS.values()):
+        w.close(2.0)
@@ -0,0 +1,274 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels: dict):
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        k = self._key(labels)
+        with self._lock:
+            self._series[k] = self._series.get(k, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        lines = self._header()
+        for k, v in series:
+            lines.append(f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram in seconds, as Prometheus expects it."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        k = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(k)
+            if s is None:
+                s = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+                self._series[k] = s
+            s["counts"][i] += 1
+            s["sum"] += value
+            s["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels):
+        with self._lock:
+            s = self._series.get(self._key(labels))
+            return None if s is None else {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}
+
+    def quantile(self, q: float, **labels):
+        """Upper bucket bound holding the q-quantile (None without observations)."""
+        s = self.snapshot(**labels)
+        if not s or not s["count"]:
+            return None
+        rank = q * s["count"]
+        acc = 0
+        for bound, n in zip(self.buckets + (float("inf"),), s["counts"]):
+            acc += n
+            if acc >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        with self._lock:
+            series = sorted((k, {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}) for k, s in self._series.items())
+        lines = self._header()
+        for k, s in series:
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), s["counts"]):
+                acc += n
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, k, ('le', _fmt_value(float(bound))))} {acc}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, k)} {_fmt_value(s['sum'])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, k)} {s['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, help, labels, **kw):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = cls(name, help, labels, **kw)
+                self._metrics[name] = m
+            elif not isinstance(m, cls):
+                raise ValueError(f"metric {name} already registered as {m.kind}")
+            return m
+
+    def counter(self, name: str, help: str, labels=()):
+        return self._get(Counter, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            metrics = [self._metrics[k] for k in sorted(self._metrics)]
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """Atomically writes the exposition to path (node_exporter textfile collector style)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+REGISTRY = Registry()
+
+CONVERT_SECONDS = REGISTRY.histogram("migration_convert_seconds", "Latency of rule-based Oracle to Snowflake conversion.")
+CONVERT_WARNINGS = REGISTRY.counter("migration_convert_warnings_total", "Warnings emitted by convert().")
+DB_QUERY_SECONDS = REGISTRY.histogram("migration_db_query_seconds", "Latency of DB client execute() calls.", ("db",))
+DB_QUERIES = REGISTRY.counter("migration_db_queries_total", "DB client execute() calls by outcome.", ("db", "status"))
+CONSISTENCY_SECONDS = REGISTRY.histogram("migration_consistency_run_seconds", "Latency of consistency validation runs.", ("mode",))
+CONSISTENCY_RUNS = REGISTRY.counter("migration_consistency_runs_total", "Consistency validation runs by outcome.", ("mode", "result"))
+LLM_SECONDS = REGISTRY.histogram("migration_llm_request_seconds", "Latency of LLM chat completion calls.", ("model", "transport"))
+LLM_REQUESTS = REGISTRY.counter("migration_llm_requests_total", "LLM chat completion calls by outcome.", ("model", "transport", "status"))
+
+
+def consistency_result(row_match, mismatches=0, error=False):
+    if error:
+        return "error"
+    if row_match is None:
+        return "unknown"
+    return "match" if row_match and not mismatches else "mismatch"
+
+
+def observe_consistency(mode: str, seconds: float, result: str):
+    CONSISTENCY_SECONDS.observe(seconds, mode=mode)
+    CONSISTENCY_RUNS.inc(mode=mode, result=result)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_EXPORTERS = {}
+_EXPORTERS_LOCK = threading.Lock()
+
+
+def start_http_server(port: int, addr: str = "127.0.0.1", registry: Registry = REGISTRY):
+    """Serves /metrics from a daemon thread; one server per (addr, port) per process."""
+    key = ("http", addr, int(port))
+    with _EXPORTERS_LOCK:
+        srv = _EXPORTERS.get(key)
+        if srv is None:
+            handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+            srv = ThreadingHTTPServer((addr, int(port)), handler)
+            srv.daemon_threads = True
+            threading.Thread(target=srv.serve_forever, name="migration-metrics-http", daemon=True).start()
+            _EXPORTERS[key] = srv
+        return srv
+
+
+def start_file_exporter(path: str, interval: float = 15.0, registry: Registry = REGISTRY):
+    """Rewrites the textfile every interval seconds from a daemon thread."""
+    key = ("file", os.path.abspath(path))
+    with _EXPORTERS_LOCK:
+        if key in _EXPORTERS:
+            return _EXPORTERS[key]
+        stop = threading.Event()
+
+        def _loop():
+            while True:
+                try:
+                    registry.write_textfile(path)
+                except Exception:
+                    pass
+                if stop.wait(interval):
+                    return
+
+        threading.Thread(target=_loop, name="migration-metrics-file", daemon=True).start()
+        _EXPORTERS[key] = stop
+        return stop
+
+
+def start_from_env():
+    """
+    Starts the exporters configured by MIGRATION_METRICS_PORT (and
+    MIGRATION_METRICS_ADDR, default 127.0.0.1) and/or MIGRATION_METRICS_FILE
+    (MIGRATION_METRICS_INTERVAL seconds, default 15). Safe to call repeatedly.
+    """
+    started = {}
+    port = os.environ.get("MIGRATION_METRICS_PORT")
+    if port:
+        try:
+            start_http_server(int(port), os.environ.get("MIGRATION_METRICS_ADDR") or "127.0.0.1")
+            started["http"] = int(port)
+        except Exception as e:
+            started["http_error"] = str(e)
+    path = os.environ.get("MIGRATION_METRICS_FILE")
+    if path:
+        try:
+            interval = float(os.environ.get("MIGRATION_METRICS_INTERVAL") or 15)
+        except ValueError:
+            interval = 15.0
+        start_file_exporter(path, interval)
+        started["file"] = path
+    return started